@@ -0,0 +1,114 @@
+import os
+import sys
+import json
+import tempfile
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.progress.change_detector import ChangeDetector
+from src.progress.state_manager import StateManager
+
+
+def _history(contents):
+    return [{"speaker": "target", "content": c} for c in contents]
+
+
+def test_counting():
+    print("Testing new message counting...")
+    detector = ChangeDetector(thresholds={"persona": 3})
+    history = _history(["今天好累", "嗯"])
+    mark = detector.mark(detector.signals(history[-10:], total=len(history)))
+
+    history += _history(["嗯", "好"])
+    signals = detector.signals(history[-10:], total=len(history))
+    assert detector.new_target_messages(mark, signals) == 2
+    assert not detector.should_rerun("persona", mark, signals)
+
+    # 用户自己的消息不计入
+    history.append({"speaker": "user", "content": "怎么啦"})
+    signals = detector.signals(history[-10:], total=len(history))
+    assert detector.new_target_messages(mark, signals) == 2
+
+    history += _history(["哈哈"])
+    signals = detector.signals(history[-10:], total=len(history))
+    assert detector.new_target_messages(mark, signals) == 3
+    assert detector.should_rerun("persona", mark, signals)
+
+
+def test_repeated_text():
+    print("Testing repeated short messages...")
+    detector = ChangeDetector(thresholds={"relationship": 2})
+    history = _history(["哈哈"] * 12)
+    mark = detector.mark(detector.signals(history[-5:], total=len(history)))
+
+    # 窗口内容完全相同，但对方确实又发了消息
+    history += _history(["哈哈"] * 2)
+    signals = detector.signals(history[-5:], total=len(history))
+    assert detector.new_target_messages(mark, signals) == 2
+    assert detector.should_rerun("relationship", mark, signals)
+
+    # 标记之后的消息已全部滑出窗口外时，按窗口内全部对方消息计
+    history += _history(["哈哈"] * 10)
+    signals = detector.signals(history[-5:], total=len(history))
+    assert detector.new_target_messages(mark, signals) == 5
+
+
+def test_reuse_and_fallbacks():
+    print("Testing reuse and fallbacks...")
+    detector = ChangeDetector(thresholds={"persona": 1})
+    history = _history(["周末去看电影吗"])
+    signals = detector.signals(history, total=1)
+    assert detector.should_rerun("persona", None, signals)
+
+    # 重复请求 (同一窗口、同一消息数) 沿用
+    mark = detector.mark(signals)
+    assert not detector.should_rerun("persona", mark, detector.signals(history, total=1))
+
+    # 历史被整体替换变短、或旧标记缺少消息总数时，按窗口内全部对方消息计
+    replaced = _history(["在吗"])
+    assert detector.new_target_messages({"total": 5}, detector.signals(replaced, total=1)) == 1
+    assert detector.new_target_messages({"window_hash": "old"}, detector.signals(replaced, total=1)) == 1
+
+    stats = detector.stats()["persona"]
+    assert stats["reran"] == 1 and stats["reused"] == 1 and stats["no_mark"] == 1
+
+    disabled = ChangeDetector(enabled=False)
+    assert disabled.should_rerun("persona", mark, detector.signals(history, total=1))
+
+
+def test_stored_message_count():
+    print("Testing stored message count...")
+    manager = StateManager(tempfile.mkdtemp())
+    loads = []
+    get_history = manager.get_history
+    manager.get_history = lambda session_id, limit=None: loads.append(session_id) or get_history(session_id, limit)
+
+    assert manager.count_messages("s1") == 0
+    manager.append_message("s1", {"speaker": "target", "content": "在吗"})
+    manager.merge_history("s1", [{"speaker": "target", "content": "周末去看电影吗", "timestamp": 1}])
+    manager.update_state("s1", {"persona": {"mbti": "INFP"}})
+    loads.clear()
+    # 写入时已记录条数，每轮计数不再解析历史
+    assert manager.count_messages("s1") == 2
+    assert manager.count_messages("s1") == 2
+    assert loads == []
+
+    # 状态文件被外部改写后重新计数
+    path = os.path.join(manager._persist_dir, "state_s1.json")
+    with open(path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    state["history"].append({"speaker": "user", "content": "好呀", "timestamp": 2})
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    assert manager.count_messages("s1") == 3
+    assert loads == ["s1"]
+
+
+if __name__ == "__main__":
+    print("Starting Change Detector Test...")
+    test_counting()
+    test_repeated_text()
+    test_reuse_and_fallbacks()
+    test_stored_message_count()
+    print("Test Passed Successfully!")
@@ -0,0 +1,49 @@
+import requests
+import json
+import time
+
+URL = "http://localhost:8090/chat/stream"
+HEADERS = {"Content-Type": "application/json"}
+
+def test_chat_stream():
+    payload = {
+        "session_id": f"test_stream_{int(time.time())}",
+        "new_message": {"speaker": "target", "content": "周末有部新电影上映，你想去看吗？"},
+        "relationship_stage": "暧昧期",
+        "intimacy_level": 5
+    }
+
+    print("Sending streaming chat request...")
+    start = time.time()
+    first_event_at = None
+    with requests.post(URL, headers=HEADERS, data=json.dumps(payload), stream=True) as response:
+        if response.status_code != 200:
+            print(f"❌ Error: {response.text}")
+            return
+
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if not line:
+                continue
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+                if first_event_at is None:
+                    first_event_at = time.time() - start
+                    print(f"⏱️ First event after {first_event_at:.2f}s")
+                continue
+            if line.startswith("data:"):
+                data = json.loads(line[len("data:"):])
+                elapsed = time.time() - start
+                if event == "token":
+                    print(data.get("delta", ""), end="", flush=True)
+                elif event == "reply":
+                    print(f"\n✅ [{elapsed:.2f}s] Safe reply: {data['reply'].get('text')}")
+                elif event == "done":
+                    print(f"\n🏁 [{elapsed:.2f}s] Done, {len(data.get('replies', []))} replies")
+                elif event == "error":
+                    print(f"\n❌ [{elapsed:.2f}s] Error: {data.get('detail')}")
+                else:
+                    print(f"\n📦 [{elapsed:.2f}s] {event}: {json.dumps(data, ensure_ascii=False)[:200]}")
+
+if __name__ == "__main__":
+    test_chat_stream()
@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+import asyncio
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.pipeline.stage_graph import StageGraph, StageFailed, StageStats
+
+
+def _stage(name, delay=0.0, result=None, error=None):
+    async def run(**inputs):
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return result if result is not None else name
+    return run
+
+
+async def test_optional_skip():
+    print("Testing optional stages under deadline...")
+    stats = StageStats()
+    graph = StageGraph(stats=stats)
+    graph.add("upstream", _stage("upstream", 0.1))
+    # 截止时间只剩预留时间时，可选阶段直接跳过
+    graph.add("skipped", _stage("skipped"), deps=["upstream"], optional=True, default="empty", reserve=0.1)
+    # 运行到截止时间仍未完成的可选阶段被取消，fallback 优先于 default
+    graph.add("slow", _stage("slow", 1.0), optional=True, default="empty", fallback=lambda: "stored")
+    graph.add("final", _stage("final"), deps=["skipped", "slow"])
+    outputs = await graph.run(deadline=0.15)
+    assert outputs["skipped"] == "empty"
+    assert outputs["slow"] == "stored"
+    assert outputs["final"] == "final"
+    assert graph.timings["skipped"]["status"] == "skipped"
+    assert graph.timings["slow"]["status"] == "timeout"
+    assert sorted(graph.degraded) == ["skipped", "slow"]
+    snapshot = stats.snapshot()
+    assert snapshot["skipped"]["skipped"] == 1 and snapshot["slow"]["timeouts"] == 1
+
+
+async def test_required_hang():
+    print("Testing hanging required stage...")
+    graph = StageGraph()
+    graph.add("upstream", _stage("upstream", 0.05))
+    # 必需阶段挂起: 截止时间到达时以 fallback 的输出继续，下游照常执行
+    graph.add("plan", _stage("plan", 10.0), deps=["upstream"], fallback=lambda: {"strategy": "last"}, reserve=0.05)
+    graph.add("generate", _stage("generate", 10.0), deps=["plan"], fallback=lambda: {"replies": []})
+    t0 = time.perf_counter()
+    outputs = await graph.run(deadline=0.3)
+    elapsed = time.perf_counter() - t0
+    assert elapsed < 0.5, elapsed
+    assert outputs["plan"] == {"strategy": "last"}
+    assert outputs["generate"] == {"replies": []}
+    assert graph.timings["plan"]["status"] == "timeout"
+    assert graph.timings["generate"]["status"] == "timeout"
+    assert graph.degraded == ["plan", "generate"]
+
+    # 没有 fallback 的必需阶段不受截止时间约束
+    graph = StageGraph()
+    graph.add("required", _stage("required", 0.2))
+    outputs = await graph.run(deadline=0.05)
+    assert outputs["required"] == "required" and not graph.degraded
+
+    # 带 fallback 的必需阶段出错时仍中断流水线
+    graph = StageGraph()
+    graph.add("required", _stage("required", error=RuntimeError("boom")), fallback=lambda: "stored")
+    try:
+        await graph.run(deadline=1.0)
+        assert False, "必需阶段出错应抛出 StageFailed"
+    except StageFailed as e:
+        assert e.stage == "required"
+
+
+async def main():
+    print("Starting Deadline Test...")
+    await test_optional_skip()
+    await test_required_hang()
+    print("Test Passed Successfully!")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+import os
+import sys
+import asyncio
+import shutil
+import tempfile
+import time
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.pipeline.job_queue import JobQueue
+
+
+def merge_values(old, new):
+    return {"v": old["v"] + new["v"]}
+
+
+async def test_coalescing():
+    print("Testing job coalescing...")
+    seen = []
+
+    async def handler(session_id, payload):
+        await asyncio.sleep(0.02)
+        seen.append((session_id, payload["v"]))
+
+    queue = JobQueue(workers=2)
+    queue.register("ingest", handler, merge_values)
+    # 连续入队时 worker 尚未取走任务，同一会话的任务合并为一个
+    for i in range(3):
+        await queue.enqueue("ingest", "s1", {"v": [i]})
+    await queue.enqueue("ingest", "s2", {"v": [9]})
+    assert await queue.join(5)
+    assert sorted(seen) == [("s1", [0, 1, 2]), ("s2", [9])]
+    stats = queue.stats()
+    assert stats["enqueued"] == 4 and stats["coalesced"] == 2 and stats["processed"] == 2
+
+    # 执行期间入队的同键任务在前一个完成后才执行
+    seen.clear()
+    await queue.enqueue("ingest", "s1", {"v": [3]})
+    await asyncio.sleep(0.005)
+    await queue.enqueue("ingest", "s1", {"v": [4]})
+    assert await queue.join(5)
+    assert seen == [("s1", [3]), ("s1", [4])]
+    await queue.close()
+
+
+async def test_retry_backoff():
+    print("Testing retry with backoff...")
+    attempts = []
+
+    async def flaky(session_id, payload):
+        attempts.append(time.time())
+        if len(attempts) == 1:
+            raise RuntimeError("temporary failure")
+
+    async def broken(session_id, payload):
+        raise RuntimeError("permanent failure")
+
+    queue = JobQueue(workers=1, max_attempts=2, retry_backoff=0.1)
+    queue.register("flaky", flaky)
+    queue.register("broken", broken)
+    await queue.enqueue("flaky", "s1", {})
+    await queue.enqueue("broken", "s1", {})
+    assert await queue.join(5)
+    assert len(attempts) == 2
+    assert attempts[1] - attempts[0] >= 0.09
+    stats = queue.stats()
+    assert stats["processed"] == 1 and stats["retried"] == 2 and stats["failed"] == 1
+    await queue.close()
+
+
+async def test_journal_replay(test_dir):
+    print("Testing journal replay...")
+    journal = os.path.join(test_dir, "jobs.sqlite")
+    seen = []
+
+    async def handler(session_id, payload):
+        seen.append((session_id, payload["v"]))
+
+    async def stuck(session_id, payload):
+        await asyncio.sleep(3600)
+
+    queue = JobQueue(workers=1, journal_path=journal)
+    queue.register("ingest", stuck, merge_values)
+    await queue.enqueue("ingest", "s1", {"v": [1]})
+    await queue.enqueue("ingest", "s2", {"v": [2]})
+    await queue.enqueue("ingest", "s2", {"v": [3]})
+    # 等待日志批量落盘，然后模拟进程崩溃 (不排空队列)
+    await asyncio.sleep(0.05)
+    for task in queue._worker_tasks:
+        task.cancel()
+    await asyncio.gather(*queue._worker_tasks, return_exceptions=True)
+
+    restarted = JobQueue(workers=1, journal_path=journal)
+    restarted.register("ingest", handler, merge_values)
+    await restarted.start()
+    assert await restarted.join(5)
+    assert sorted(seen) == [("s1", [1]), ("s2", [2, 3])]
+    assert restarted.stats()["recovered"] == 2
+    await restarted.close()
+
+    # 完成的任务已从日志中删除，再次启动不会重放
+    again = JobQueue(workers=1, journal_path=journal)
+    again.register("ingest", handler, merge_values)
+    await again.start()
+    assert again.stats()["recovered"] == 0
+    await again.close()
+
+
+async def main():
+    print("Starting Job Queue Test...")
+    test_dir = tempfile.mkdtemp()
+    try:
+        await test_coalescing()
+        await test_retry_backoff()
+        await test_journal_replay(test_dir)
+    finally:
+        shutil.rmtree(test_dir, ignore_errors=True)
+    print("Test Passed Successfully!")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
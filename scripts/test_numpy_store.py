@@ -0,0 +1,137 @@
+import os
+import sys
+import hashlib
+import random
+import shutil
+import tempfile
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.vectorstore.embedding_service import EmbeddingService
+from src.vectorstore.metadata_filter import match_where
+from src.vectorstore.numpy_store import NumpyStore
+
+DIM = 16
+
+
+def fake_embedding(texts):
+    """
+    离线的确定性 Embedding: 按文本哈希生成随机向量 (不下载模型、不访问网络)
+    """
+    vectors = []
+    for text in texts:
+        seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+        vectors.append(np.random.default_rng(seed).standard_normal(DIM).tolist())
+    return vectors
+
+
+def _store(test_dir, name="history"):
+    return NumpyStore(
+        persist_directory=test_dir,
+        collection_name=name,
+        embedding_service=EmbeddingService(embedding_fn=fake_embedding),
+    )
+
+
+def _assert_aligned(store, texts):
+    # 每条文本用自己的向量检索，命中的必须是自己 (向量与旁表对齐)
+    for text in texts:
+        top = store.similarity_search(text, n_results=1)
+        assert top and top[0]["text"] == text and top[0]["distance"] < 1e-5, text
+
+
+def test_persistence(test_dir):
+    print("Testing persistence and reload...")
+    store = _store(test_dir)
+    texts = [f"消息{i}" for i in range(5)]
+    store.add_texts([f"m{i}" for i in range(5)], texts, [{"i": i} for i in range(5)])
+    assert store.add_texts_if_not_exist(["m0", "m5"], ["消息0", "消息5"], [{}, {}]) == 1
+
+    reloaded = _store(test_dir)
+    assert reloaded.describe()["count"] == 6
+    assert reloaded.has_id("m5")
+    _assert_aligned(reloaded, texts + ["消息5"])
+
+
+def test_torn_last_line(test_dir):
+    print("Testing recovery from a torn meta line...")
+    store = _store(test_dir, "torn")
+    texts = ["早上好", "吃饭了吗", "晚安"]
+    store.add_texts(["a", "b", "c"], texts, [{}, {}, {}])
+    meta_path = os.path.join(test_dir, "torn", "meta.jsonl")
+    # 模拟写入旁表时进程崩溃: 最后一行只写了一半
+    with open(meta_path, "a", encoding="utf-8") as f:
+        f.write('{"id": "d", "text": "写到一半')
+
+    recovered = _store(test_dir, "torn")
+    assert recovered.describe()["count"] == 3
+    recovered.add_texts(["e", "f"], ["周末见", "好的"], [{}, {}])
+    _assert_aligned(recovered, texts + ["周末见", "好的"])
+
+    # 重启后崩溃之后追加的记录仍然存在，且与向量对齐
+    restarted = _store(test_dir, "torn")
+    assert restarted.describe()["count"] == 5
+    _assert_aligned(restarted, texts + ["周末见", "好的"])
+
+
+def test_legacy_torn_line(test_dir):
+    print("Testing files written after a torn line by older versions...")
+    store = _store(test_dir, "legacy")
+    store.add_texts(["a", "b"], ["你好", "在吗"], [{}, {}])
+    meta_path = os.path.join(test_dir, "legacy", "meta.jsonl")
+    with open(meta_path, "a", encoding="utf-8") as f:
+        f.write('{"id": "x", "text": "残')
+    # 旧版本不截断残行，之后的记录接在残行后面
+    store.add_texts(["c", "d"], ["出来玩", "好呀"], [{}, {}])
+
+    restarted = _store(test_dir, "legacy")
+    assert restarted.describe()["count"] == 4
+    _assert_aligned(restarted, ["你好", "在吗", "出来玩", "好呀"])
+
+
+def test_numpy_where(test_dir):
+    print("Testing NumPy where filtering...")
+    store = _store(test_dir, "where")
+    rng = random.Random(7)
+    ids, texts, metadatas = [], [], []
+    for i in range(300):
+        meta = {"session_id": f"s{i % 3}", "speaker": rng.choice(["user", "target"])}
+        if i % 10:
+            meta["timestamp"] = rng.randint(0, 1000)
+        ids.append(f"m{i}")
+        texts.append(f"消息{i}")
+        metadatas.append(meta)
+    store.add_texts(ids, texts, metadatas)
+
+    conditions = [
+        {"session_id": "s1"},
+        {"timestamp": {"$gte": 500}},
+        {"$and": [{"session_id": "s2"}, {"timestamp": {"$lt": 300}}]},
+        {"$or": [{"speaker": "user"}, {"timestamp": {"$gt": 900}}]},
+        {"session_id": {"$in": ["s0", "s1"]}, "speaker": {"$ne": "user"}},
+        {"timestamp": {"$lte": 100.5}},
+    ]
+    for where in conditions:
+        expected = {id for id, meta in zip(ids, metadatas) if match_where(meta, where)}
+        found = {d["id"] for d in store.similarity_search("消息", n_results=1000, where=where)}
+        assert found == expected, where
+
+    # 追加数据后元数据列增量扩展
+    store.add_texts(["late"], ["迟到的消息"], [{"session_id": "s1", "timestamp": 2000}])
+    found = store.similarity_search("消息", n_results=10, where={"timestamp": {"$gt": 1000}})
+    assert [d["id"] for d in found] == ["late"]
+
+
+if __name__ == "__main__":
+    print("Starting Numpy Store Test...")
+    test_dir = tempfile.mkdtemp()
+    try:
+        test_persistence(test_dir)
+        test_torn_last_line(test_dir)
+        test_legacy_torn_line(test_dir)
+        test_numpy_where(test_dir)
+    finally:
+        shutil.rmtree(test_dir, ignore_errors=True)
+    print("Test Passed Successfully!")
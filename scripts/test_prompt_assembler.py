@@ -0,0 +1,60 @@
+import os
+import sys
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.prompts.prompt_assembler import PromptAssembler, compact_json
+from src.prompts.token_budget import estimate_tokens
+
+TEMPLATE = "最新消息: {message}\n历史: {retrieval_materials}\n事实: {user_facts}\n指引: {action_guide}"
+
+
+def test_compact_json():
+    print("Testing compact serialization...")
+    assert compact_json({"a": 1, "b": None, "c": [], "d": {"e": ""}}) == '{"a":1}'
+    assert compact_json({"风格": "轻松"}) == '{"风格":"轻松"}'
+    assert compact_json({}) == "无"
+
+
+def _sections(assembler):
+    return {
+        "retrieval_materials": assembler.serialize_retrieval([{"text": f"第{i}条聊天记录，内容比较长一些"} for i in range(40)]),
+        "user_facts": assembler.serialize_facts(["喜欢看电影", "喜欢看电影", "住在北京"]),
+        "action_guide": compact_json({"next": "约她周末看电影"}),
+    }
+
+
+def test_within_budget():
+    print("Testing prompt within budget...")
+    assembler = PromptAssembler({"default": 5000})
+    prompt, usage = assembler.assemble(TEMPLATE, "qwen-plus", {"message": "在吗"}, _sections(assembler))
+    assert "{" not in prompt.replace('{"next"', "")
+    assert prompt.count("- 喜欢看电影") == 1
+    assert not any(s["trimmed"] for s in usage["sections"].values())
+    assert usage["budget"] == 5000 and usage["total"] == estimate_tokens(prompt)
+
+
+def test_trimming_order():
+    print("Testing trimming by priority...")
+    assembler = PromptAssembler({"qwen-turbo": 200})
+    prompt, usage = assembler.assemble(TEMPLATE, "qwen-turbo", {"message": "在吗"}, _sections(assembler))
+    # 预算不足时先裁剪检索结果，高优先级段落保持完整
+    assert usage["sections"]["retrieval_materials"]["trimmed"]
+    assert not usage["sections"]["user_facts"]["trimmed"]
+    assert not usage["sections"]["action_guide"]["trimmed"]
+    assert "约她周末看电影" in prompt and "住在北京" in prompt
+    assert usage["total"] <= 200
+
+    # 极小预算下固定段落保留，可裁剪段落退化为 "无"
+    prompt, usage = PromptAssembler({"default": 10}).assemble(TEMPLATE, "any", {"message": "在吗"}, _sections(assembler))
+    assert "最新消息: 在吗" in prompt
+    assert all(s["trimmed"] for s in usage["sections"].values())
+
+
+if __name__ == "__main__":
+    print("Starting Prompt Assembler Test...")
+    test_compact_json()
+    test_within_budget()
+    test_trimming_order()
+    print("Test Passed Successfully!")
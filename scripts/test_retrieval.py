@@ -0,0 +1,136 @@
+import os
+import sys
+import hashlib
+import shutil
+import tempfile
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.retrieval.lexical_index import LexicalIndex, tokenize
+from src.retrieval.retrieval_orchestrator import RetrievalOrchestrator, DAY
+from src.vectorstore.embedding_service import EmbeddingService
+from src.vectorstore.numpy_store import NumpyStore
+
+DIM = 32
+
+
+def fake_embedding(texts):
+    """
+    离线的确定性 Embedding: 字符二元组哈希到固定维度 (不下载模型、不访问网络)
+    """
+    vectors = []
+    for text in texts:
+        v = np.zeros(DIM, dtype=np.float32)
+        for token in tokenize(text) or [text]:
+            v[int(hashlib.md5(token.encode("utf-8")).hexdigest(), 16) % DIM] += 1.0
+        vectors.append(v.tolist())
+    return vectors
+
+
+def _store(test_dir, name):
+    return NumpyStore(
+        persist_directory=test_dir,
+        collection_name=name,
+        embedding_service=EmbeddingService(embedding_fn=fake_embedding),
+        persistent=False,
+    )
+
+
+def test_bm25(test_dir):
+    print("Testing BM25 index...")
+    path = os.path.join(test_dir, "lexical.jsonl")
+    index = LexicalIndex(persist_path=path)
+    added = index.add_texts(
+        ["m1", "m2", "m3", "m4"],
+        ["上周看了星际穿越，太好看了", "周末一起去吃火锅吧", "想去看电影", "星际穿越的配乐是 Hans Zimmer"],
+        [{"session_id": "s1"}, {"session_id": "s1"}, {"session_id": "s1"}, {"session_id": "s2"}],
+    )
+    assert added == 4
+    assert index.add_texts(["m1"], ["重复"], [{}]) == 0
+
+    results = index.search("星际穿越", n_results=10)
+    assert {r["id"] for r in results} == {"m1", "m4"}
+    assert index.search("zimmer")[0]["id"] == "m4"
+    assert [r["id"] for r in index.search("星际穿越", session_id="s1")] == ["m1"]
+    assert [r["id"] for r in index.search("星际穿越", where={"session_id": "s1"})] == ["m1"]
+    assert index.search("完全无关的内容") == []
+
+    # 重启后从持久化文件重建索引
+    reloaded = LexicalIndex(persist_path=path)
+    assert reloaded.stats() == index.stats()
+    assert reloaded.search("火锅")[0]["id"] == "m2"
+
+
+def test_session_statistics():
+    print("Testing per-session BM25 statistics...")
+    index = LexicalIndex()
+    index.add_texts(
+        ["a1", "a2", "a3"],
+        ["周末去看电影吧", "今天加班好累", "电影票买好了"],
+        [{"session_id": "alice"}] * 3,
+    )
+    before = {r["id"]: r["score"] for r in index.search("电影", session_id="alice")}
+
+    # 其他会话大量出现同一个词，不影响本会话的 IDF 与平均文档长度
+    index.add_texts(
+        [f"b{i}" for i in range(50)],
+        [f"电影院第{i}排的电影" for i in range(50)],
+        [{"session_id": "bob"}] * 50,
+    )
+    after = {r["id"]: r["score"] for r in index.search("电影", session_id="alice")}
+    assert before == after
+    assert index.search("电影", session_id="carol") == []
+    assert index.stats()["partitions"] == 2 and index.stats()["documents"] == 53
+
+
+def test_rrf_fusion(test_dir):
+    print("Testing BM25 + vector fusion...")
+    now = 1_700_000_000
+    store = _store(test_dir, "history")
+    lexical = LexicalIndex()
+    rows = [
+        ("e1", "你上次说的那家店叫蓝蛙，在三里屯", "s1", now - 2 * DAY),
+        ("e2", "最近工作好忙，天天加班", "s1", now - 3600),
+        ("e3", "周末想去爬山", "s1", now - 3 * DAY),
+        ("e4", "蓝蛙的汉堡挺好吃", "s2", now - 3600),
+        ("e5", "很久以前去过蓝蛙", "s1", now - 60 * DAY),
+    ]
+    ids = [r[0] for r in rows]
+    texts = [r[1] for r in rows]
+    metadatas = [{"session_id": r[2], "timestamp": r[3]} for r in rows]
+    store.add_texts(ids, texts, metadatas)
+    lexical.add_texts(ids, texts, metadatas)
+
+    orchestrator = RetrievalOrchestrator(store, lexical_index=lexical)
+    quotas = {"hot": 2, "valid_7d": 2, "background_30d": 0, "background_legacy": 0}
+    results = orchestrator.aggregate("蓝蛙", quotas=quotas, now=now, session_id="s1")
+    result_ids = [d["id"] for d in results]
+    # 精确实体由 BM25 召回并排在首位；其他会话与无配额分桶的消息不出现
+    assert result_ids[0] == "e1"
+    assert "e4" not in result_ids and "e5" not in result_ids
+    assert len(results) <= sum(quotas.values())
+
+    # 同时出现在两路结果中的文档排在只出现在一路的文档之前
+    fused = orchestrator._fuse(
+        [{"id": "a", "text": "a", "metadata": {}}, {"id": "b", "text": "b", "metadata": {}}],
+        [{"id": "c", "text": "c", "metadata": {}}, {"id": "b", "text": "b", "metadata": {}}],
+        limit=3,
+    )
+    assert [d["id"] for d in fused][0] == "b"
+
+    found = orchestrator.lookup("蓝蛙", n_results=5, session_id="s1")
+    assert {d["id"] for d in found} == {"e1", "e5"}
+
+
+if __name__ == "__main__":
+    print("Starting Retrieval Test...")
+    test_dir = tempfile.mkdtemp()
+    try:
+        test_bm25(test_dir)
+        test_session_statistics()
+        test_rrf_fusion(test_dir)
+    finally:
+        shutil.rmtree(test_dir, ignore_errors=True)
+    print("Test Passed Successfully!")
@@ -0,0 +1,75 @@
+import os
+import sys
+import asyncio
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.safety.safety_checker import SafetyChecker
+from src.safety.safety_prefilter import SafetyPrefilter
+
+
+# Mock QwenClient: 记录送到 LLM 复核的文本
+class MockQwenClient:
+    def __init__(self):
+        self.checked = []
+
+    async def achat_json(self, model, messages, **kwargs):
+        # 候选列表位于 "回复候选" 标题之后、第一个空行之前
+        block = messages[-1]["content"].split("回复候选（按编号列出）：\n", 1)[1].split("\n\n", 1)[0]
+        lines = block.splitlines()
+        self.checked.extend(line.split(". ", 1)[1] for line in lines)
+        return {"results": [{"index": i, "is_safe": True} for i in range(1, len(lines) + 1)]}
+
+
+def test_classify():
+    print("Testing local classification...")
+    prefilter = SafetyPrefilter()
+    assert prefilter.classify("周末一起去看电影吧")["decision"] == SafetyPrefilter.PASS
+    assert prefilter.classify("")["decision"] == SafetyPrefilter.PASS
+    assert prefilter.classify("你个傻逼")["decision"] == SafetyPrefilter.BLOCK
+    # 空白与标点间隔不能绕过词表
+    assert prefilter.classify("傻 .逼")["decision"] == SafetyPrefilter.BLOCK
+    doubt = prefilter.classify("他昨天赌博输了不少")
+    assert doubt["decision"] == SafetyPrefilter.UNCERTAIN and doubt["hits"] == ["赌博"]
+    assert prefilter.classify("好" * 201)["decision"] == SafetyPrefilter.UNCERTAIN
+
+    # 含有敏感单字的日常用语直接放行，不送 LLM 复核
+    for text in ["周末去商场血拼", "先杀时间再去吃刀削面", "他对这次面试胸有成竹", "我是干饭党", "小丑竟是我自己",
+                 "别赌气啦", "你好毒舌", "今晚看脱口秀吗", "今天化了裸妆"]:
+        assert prefilter.classify(text)["decision"] == SafetyPrefilter.PASS, text
+
+    custom = SafetyPrefilter(block_terms=["禁词"], doubt_terms=[], max_pass_length=10)
+    assert custom.classify("这里有禁词")["decision"] == SafetyPrefilter.BLOCK
+    assert custom.classify("这把刀挺好看的")["decision"] == SafetyPrefilter.PASS
+
+    stats = custom.stats()
+    assert stats["total"] == 2 and stats["llm_skipped_ratio"] == 1.0
+
+
+async def test_pass_through():
+    print("Testing prefilter pass-through...")
+    client = MockQwenClient()
+    checker = SafetyChecker(client, "qwen-plus", prefilter=SafetyPrefilter())
+    replies = ["好呀，几点见", "去死吧", "今天的晚霞好美，拍给你看", "身材真好"]
+    verdicts = await checker.acheck_all(replies)
+
+    # 只有无法本地判定的候选送 LLM，结果与输入顺序一致
+    assert client.checked == ["身材真好"]
+    assert verdicts[0]["is_safe"] and verdicts[0]["source"] == "prefilter"
+    assert not verdicts[1]["is_safe"] and SafetyChecker.is_blocked(verdicts[1])
+    assert verdicts[2]["source"] == "prefilter"
+    assert verdicts[3]["is_safe"] and "source" not in verdicts[3]
+    assert checker.prefilter_stats()["uncertain"] == 1
+
+    # 没有预过滤器时全部送 LLM
+    client = MockQwenClient()
+    await SafetyChecker(client, "qwen-plus").acheck_all(replies)
+    assert client.checked == replies
+
+
+if __name__ == "__main__":
+    print("Starting Safety Prefilter Test...")
+    test_classify()
+    asyncio.run(test_pass_through())
+    print("Test Passed Successfully!")
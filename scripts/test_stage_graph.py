@@ -0,0 +1,82 @@
+import os
+import sys
+import asyncio
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.pipeline.stage_graph import StageGraph, StageFailed, StageStats
+
+
+def _stage(name, events, delay=0.0, result=None, error=None):
+    async def run(**inputs):
+        events.append(("start", name, sorted(inputs)))
+        await asyncio.sleep(delay)
+        events.append(("end", name))
+        if error is not None:
+            raise error
+        return result if result is not None else name
+    return run
+
+
+async def test_dependency_order():
+    print("Testing DAG ordering...")
+    events = []
+    graph = StageGraph()
+    graph.add("a", _stage("a", events, 0.05))
+    graph.add("b", _stage("b", events, 0.01))
+    graph.add("c", _stage("c", events), deps=["a", "b"])
+    outputs = await graph.run()
+    assert outputs == {"a": "a", "b": "b", "c": "c"}
+
+    # 无依赖的阶段并发启动，c 在 a、b 都结束后才启动并拿到两者的输出
+    starts = [e[1] for e in events if e[0] == "start"]
+    assert starts[:2] == ["a", "b"]
+    c_start = events.index(("start", "c", ["a", "b"]))
+    assert c_start > events.index(("end", "a")) and c_start > events.index(("end", "b"))
+    assert graph.critical_path() == ["a", "c"]
+
+    try:
+        graph.add("d", _stage("d", events), deps=["missing"])
+        assert False, "未注册的依赖应报错"
+    except ValueError:
+        pass
+
+
+async def test_degradation():
+    print("Testing optional stage degradation...")
+    events = []
+    stats = StageStats()
+    graph = StageGraph(stats=stats)
+    graph.add("bad", _stage("bad", events, error=RuntimeError("boom")), optional=True, default={"x": 0})
+    graph.add("slow", _stage("slow", events, 0.5), optional=True, timeout=0.05, default="empty")
+    graph.add("final", _stage("final", events), deps=["bad", "slow"])
+    outputs = await graph.run()
+    assert outputs["bad"] == {"x": 0}
+    assert outputs["slow"] == "empty"
+    assert outputs["final"] == "final"
+    assert graph.timings["bad"]["status"] == "error"
+    assert graph.timings["slow"]["status"] == "timeout"
+    snapshot = stats.snapshot()
+    assert snapshot["bad"]["errors"] == 1 and snapshot["slow"]["timeouts"] == 1
+
+    # 必需阶段失败时中断整个流水线
+    graph = StageGraph()
+    graph.add("required", _stage("required", [], error=RuntimeError("boom")))
+    graph.add("after", _stage("after", []), deps=["required"])
+    try:
+        await graph.run()
+        assert False, "必需阶段失败应抛出 StageFailed"
+    except StageFailed as e:
+        assert e.stage == "required"
+
+
+async def main():
+    print("Starting Stage Graph Test...")
+    await test_dependency_order()
+    await test_degradation()
+    print("Test Passed Successfully!")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
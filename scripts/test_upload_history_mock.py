@@ -12,7 +12,7 @@ from src.love_agent import LoveAgent
 
 # Mock QwenClient
 class MockQwenClient:
-    def __init__(self):
+    def __init__(self, **kwargs):
         pass
     
     def chat_json(self, model, messages, **kwargs):
@@ -28,6 +28,15 @@ class MockQwenClient:
     def chat_vl(self, model, messages, **kwargs):
         return "image description"
 
+    async def achat_json(self, model, messages, **kwargs):
+        return self.chat_json(model, messages, **kwargs)
+
+    async def achat_vl(self, model, messages, **kwargs):
+        return self.chat_vl(model, messages, **kwargs)
+
+    async def aclose(self):
+        pass
+
 async def test_upload_history():
     print("Starting Upload History Test...")
     
@@ -44,7 +53,7 @@ async def test_upload_history():
     }
     
     # Patch QwenClient in love_agent module
-    with patch('src.love_agent.QwenClient', side_effect=MockQwenClient):
+    with patch('src.love_agent.AsyncQwenClient', side_effect=MockQwenClient):
         agent = LoveAgent(config)
         
         # Test Data
@@ -8,10 +8,24 @@ class ChatReviewer:
     
     对一段完整的聊天记录进行复盘，指出优点、缺点和改进建议。
     """
+    # 响应缓存有效期 (秒)
+    CACHE_TTL = 3600
+
     def __init__(self, client: QwenClient, model: str):
         self._client = client
         self._model = model
 
+    def _build_messages(self, conversation_history: str) -> List[Dict[str, str]]:
+        user_prompt = CHAT_REVIEW_PROMPT.replace(
+            "{conversation_history}", conversation_history
+        )
+        
+        messages = [
+            {"role": "system", "content": "你是资深情感咨询师，严格输出JSON。"},
+            {"role": "user", "content": user_prompt},
+        ]
+        return messages
+
     def review(self, conversation_history: str) -> Dict[str, Any]:
         """
         复盘聊天历史
@@ -22,14 +36,13 @@ class ChatReviewer:
         Returns:
             Dict: 复盘结果 (JSON)
         """
-        user_prompt = CHAT_REVIEW_PROMPT.replace(
-            "{conversation_history}", conversation_history
-        )
-        
-        messages = [
-            {"role": "system", "content": "你是资深情感咨询师，严格输出JSON。"},
-            {"role": "user", "content": user_prompt},
-        ]
-        
+        messages = self._build_messages(conversation_history)
         # 使用稍高的温度以获得更有建设性和创造性的反馈
-        return self._client.chat_json(self._model, messages, temperature=0.3)
+        return self._client.chat_json(self._model, messages, temperature=0.3, cache_ttl=self.CACHE_TTL)
+
+    async def areview(self, conversation_history: str) -> Dict[str, Any]:
+        """
+        复盘聊天历史 (异步版本)
+        """
+        messages = self._build_messages(conversation_history)
+        return await self._client.achat_json(self._model, messages, temperature=0.3, cache_ttl=self.CACHE_TTL)
@@ -0,0 +1,63 @@
+from typing import Dict, Any, List
+from src.model.qwen_client import QwenClient
+from src.prompts.prompts import CONVERSATION_SUMMARY_PROMPT
+
+
+class ConversationSummarizer:
+    """
+    对话滚动摘要生成器
+    
+    把滑出最近窗口的较早消息增量合并进已有摘要，使分析时的输入长度不随历史增长。
+    """
+    # 响应缓存有效期 (秒)
+    CACHE_TTL = 86400
+
+    def __init__(self, client: QwenClient, model: str, max_chars: int = 300):
+        """
+        Args:
+            client: LLM 客户端
+            model: 使用的模型 (建议使用较便宜的模型)
+            max_chars: 摘要的最大字数
+        """
+        self._client = client
+        self._model = model
+        self._max_chars = max_chars
+
+    def _build_messages(self, previous_summary: str, new_messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        lines = []
+        for m in new_messages:
+            speaker = "我" if m.get("speaker") == "user" else "对方"
+            lines.append(f"{speaker}: {m.get('content', '')}")
+        user_prompt = (
+            CONVERSATION_SUMMARY_PROMPT
+            .replace("{previous_summary}", previous_summary or "无")
+            .replace("{new_messages}", "\n".join(lines))
+            .replace("{max_chars}", str(self._max_chars))
+        )
+        return [
+            {"role": "system", "content": "你是对话记录整理员，严格输出JSON。"},
+            {"role": "user", "content": user_prompt},
+        ]
+
+    def summarize(self, previous_summary: str, new_messages: List[Dict[str, Any]]) -> str:
+        """
+        合并生成新的滚动摘要
+        
+        Args:
+            previous_summary: 已有摘要
+            new_messages: 需要并入摘要的消息列表
+            
+        Returns:
+            str: 更新后的摘要，失败时返回原摘要
+        """
+        messages = self._build_messages(previous_summary, new_messages)
+        resp = self._client.chat_json(self._model, messages, temperature=0.3, cache_ttl=self.CACHE_TTL)
+        return resp.get("summary") or previous_summary
+
+    async def asummarize(self, previous_summary: str, new_messages: List[Dict[str, Any]]) -> str:
+        """
+        合并生成新的滚动摘要 (异步版本)
+        """
+        messages = self._build_messages(previous_summary, new_messages)
+        resp = await self._client.achat_json(self._model, messages, temperature=0.3, cache_ttl=self.CACHE_TTL)
+        return resp.get("summary") or previous_summary
@@ -10,25 +10,28 @@ class EmotionAnalyzer:
     
     分析用户对话中的情绪状态，结合规则匹配（关键词）和 LLM 深度分析。
     """
+    # 响应缓存有效期 (秒)
+    CACHE_TTL = 600
+
     def __init__(self, client: QwenClient, model: str):
         self._client = client
         self._model = model
 
-    def analyze(self, context: List[Dict[str, str]]) -> Dict[str, Any]:
+    def guess(self, latest: str) -> str:
         """
-        执行情绪分析
-        
+        基于关键词规则的情绪预判 (不调用模型)
+
         Args:
-            context: 对话上下文窗口
-            
+            latest: 最新一条消息
+
         Returns:
-            Dict: 包含情绪分类、置信度和详细分析结果
+            str: "negative" 或 "neutral"
         """
-        latest = context[-1]["content"] if context else ""
-        
-        # 简单的规则匹配作为预判
         negative_hits = len(re.findall(r"(糟|累|烦|无语|难受|不开心|生气|算了)", latest))
-        emotion_guess = "negative" if negative_hits >= 1 else "neutral"
+        return "negative" if negative_hits >= 1 else "neutral"
+
+    def _build_messages(self, context: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        latest = context[-1]["content"] if context else ""
         
         # 构建历史记录字符串
         history_lines = []
@@ -36,18 +39,45 @@ class EmotionAnalyzer:
             history_lines.append(f"{m.get('speaker','')}: {m.get('content','')}")
         context_history = "\n".join(history_lines)
         
-        # 调用 LLM 进行深度分析
         user_prompt = (
             EMOTION_DETECTION_PROMPT.replace("{current_message}", latest).replace("{context_history}", context_history)
         )
-        messages = [
+        return [
             {"role": "system", "content": "你是中文对话的情绪识别专家，严格输出JSON对象。"},
             {"role": "user", "content": user_prompt},
         ]
-        resp = self._client.chat_json(self._model, messages, temperature=0.2)
-        
+
+    def build_result(self, context: List[Dict[str, str]], resp: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        将规则预判与 LLM 分析结果组合为最终的情绪分析结构
+        """
+        latest = context[-1]["content"] if context else ""
+        emotion_guess = self.guess(latest)
         return {
             "emotion": emotion_guess,
             "confidence": 0.7 if emotion_guess == "negative" else 0.5,
             "detail": resp,
         }
+
+    def analyze(self, context: List[Dict[str, str]]) -> Dict[str, Any]:
+        """
+        执行情绪分析
+        
+        Args:
+            context: 对话上下文窗口
+            
+        Returns:
+            Dict: 包含情绪分类、置信度和详细分析结果
+        """
+        # 调用 LLM 进行深度分析
+        messages = self._build_messages(context)
+        resp = self._client.chat_json(self._model, messages, temperature=0.2, cache_ttl=self.CACHE_TTL)
+        return self.build_result(context, resp)
+
+    async def aanalyze(self, context: List[Dict[str, str]]) -> Dict[str, Any]:
+        """
+        执行情绪分析 (异步版本)
+        """
+        messages = self._build_messages(context)
+        resp = await self._client.achat_json(self._model, messages, temperature=0.2, cache_ttl=self.CACHE_TTL)
+        return self.build_result(context, resp)
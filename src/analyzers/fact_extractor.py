@@ -24,3 +24,10 @@ class FactExtractor:
         """
         # 临时实现
         return []
+
+    async def aextract(self, latest_text: str, history_str: str) -> List[str]:
+        """
+        提取事实 (异步版本)
+        """
+        # 临时实现
+        return self.extract(latest_text, history_str)
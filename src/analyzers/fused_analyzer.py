@@ -0,0 +1,111 @@
+from typing import Dict, Any, List, Optional
+from src.model.qwen_client import QwenClient
+from src.analyzers.emotion_analyzer import EmotionAnalyzer
+from src.analyzers.search_intent_analyzer import SearchIntentAnalyzer
+from src.prompts.prompts import (
+    FUSED_ANALYSIS_PROMPT,
+    EMOTION_DETECTION_PROMPT,
+    TOPIC_ANALYSIS_PROMPT,
+    RESEARCH_INTENT_PROMPT,
+    PERSONALITY_ANALYSIS_PROMPT,
+    RELATIONSHIP_ANALYSIS_PROMPT,
+)
+
+# 共享的对话内容只在合并 Prompt 顶部出现一次，子任务模板中的占位符替换为引用说明
+_SHARED_PLACEHOLDERS = {
+    "{conversation_history}": "（见上方对话历史）",
+    "{context_history}": "（见上方对话历史）",
+    "{current_message}": "（见上方对方最新消息）",
+}
+
+# 任务名 -> 复用的单项分析模板
+FUSED_TASK_TEMPLATES = {
+    "emotion": EMOTION_DETECTION_PROMPT,
+    "topics": TOPIC_ANALYSIS_PROMPT,
+    "search_intent": RESEARCH_INTENT_PROMPT,
+    "persona": PERSONALITY_ANALYSIS_PROMPT,
+    "relationship": RELATIONSHIP_ANALYSIS_PROMPT,
+}
+
+
+class FusedAnalyzer:
+    """
+    合并分析器
+
+    将情绪、话题、搜索意图、人物画像、关系状态五项分析合并为一次 LLM 调用：
+    对话窗口只在 Prompt 中出现一次，各子任务沿用 prompts.py 中的原有模板，
+    返回后再拆分为与各单项分析器一致的结构。
+    """
+    # 响应缓存有效期 (秒)
+    CACHE_TTL = 600
+
+    def __init__(self, client: QwenClient, model: str, emotion_analyzer: EmotionAnalyzer):
+        self._client = client
+        self._model = model
+        self._emotion = emotion_analyzer
+
+    def _build_messages(self, latest_message: str, context_history: str, tasks: List[str]) -> List[Dict[str, str]]:
+        sections = []
+        for i, name in enumerate(tasks, start=1):
+            template = FUSED_TASK_TEMPLATES[name]
+            for placeholder, ref in _SHARED_PLACEHOLDERS.items():
+                template = template.replace(placeholder, ref)
+            sections.append(f"=== 任务{i}（结果键：{name}）===\n{template.strip()}")
+        
+        user_prompt = (
+            FUSED_ANALYSIS_PROMPT.replace("{context_history}", str(context_history))
+            .replace("{current_message}", str(latest_message))
+            .replace("{task_keys}", ", ".join(tasks))
+            .replace("{tasks}", "\n\n".join(sections))
+        )
+        return [
+            {"role": "system", "content": "你是中文恋爱对话分析专家，严格输出JSON对象。"},
+            {"role": "user", "content": user_prompt},
+        ]
+
+    def _split(self, window: List[Dict[str, str]], tasks: List[str], resp: Dict[str, Any]) -> Dict[str, Optional[Any]]:
+        """
+        将合并结果拆分为各单项分析器的输出结构
+
+        某一项缺失或格式不对时返回 None，由调用方回退到单独调用。
+        """
+        def _section(name: str) -> Optional[Dict[str, Any]]:
+            value = resp.get(name) if name in tasks else None
+            return value if isinstance(value, dict) and value else None
+
+        emotion = _section("emotion")
+        topics = _section("topics")
+        intent = _section("search_intent")
+        return {
+            "emotion": self._emotion.build_result(window, emotion) if emotion else None,
+            "topics": topics.get("topics", []) if topics else None,
+            "search_intent": SearchIntentAnalyzer.normalize(intent) if intent else None,
+            "persona": _section("persona"),
+            "relationship": _section("relationship"),
+        }
+
+    def analyze(self, window: List[Dict[str, str]], context_history: str, tasks: List[str]) -> Dict[str, Optional[Any]]:
+        """
+        执行合并分析
+        
+        Args:
+            window: 对话上下文窗口 (最后一条为对方最新消息)
+            context_history: 不含最新消息的历史文本
+            tasks: 需要执行的任务列表 (FUSED_TASK_TEMPLATES 的键)
+            
+        Returns:
+            Dict: 任务名 -> 与单项分析器相同结构的结果 (缺失为 None)
+        """
+        latest = window[-1]["content"] if window else ""
+        messages = self._build_messages(latest, context_history, tasks)
+        resp = self._client.chat_json(self._model, messages, temperature=0.2, cache_ttl=self.CACHE_TTL)
+        return self._split(window, tasks, resp)
+
+    async def aanalyze(self, window: List[Dict[str, str]], context_history: str, tasks: List[str]) -> Dict[str, Optional[Any]]:
+        """
+        执行合并分析 (异步版本)
+        """
+        latest = window[-1]["content"] if window else ""
+        messages = self._build_messages(latest, context_history, tasks)
+        resp = await self._client.achat_json(self._model, messages, temperature=0.2, cache_ttl=self.CACHE_TTL)
+        return self._split(window, tasks, resp)
@@ -26,3 +26,10 @@ class ImageAnalyzer:
         """
         # 临时实现
         return "图片内容分析功能暂时不可用。"
+
+    async def aanalyze_and_reply(self, image_url: str, relationship_stage: str, intimacy_level: int, persona: Dict[str, Any]) -> str:
+        """
+        分析图片并生成回复 (异步版本)
+        """
+        # 临时实现
+        return self.analyze_and_reply(image_url, relationship_stage, intimacy_level, persona)
@@ -9,20 +9,14 @@ class PersonaProfiler:
     
     根据对话历史，分析目标对象的人物性格、MBTI、关键词等特征。
     """
+    # 响应缓存有效期 (秒)
+    CACHE_TTL = 600
+
     def __init__(self, client: QwenClient, model: str):
         self._client = client
         self._model = model
 
-    def profile(self, context_window: List[Dict[str, str]]) -> Dict[str, Any]:
-        """
-        生成人物画像
-        
-        Args:
-            context_window: 对话历史窗口
-            
-        Returns:
-            Dict: 人物画像数据 (JSON)
-        """
+    def _build_messages(self, context_window: List[Dict[str, str]]) -> List[Dict[str, str]]:
         history_lines = []
         for m in context_window:
             speaker = m.get("speaker") or ""
@@ -31,9 +25,28 @@ class PersonaProfiler:
         conversation_history = "\n".join(history_lines)
         
         user_prompt = PERSONALITY_ANALYSIS_PROMPT.replace("{conversation_history}", conversation_history)
-        messages = [
+        return [
             {"role": "system", "content": "你是专业的性格分析助手，严格输出JSON对象。"},
             {"role": "user", "content": user_prompt},
         ]
-        resp = self._client.chat_json(self._model, messages, temperature=0.2)
+
+    def profile(self, context_window: List[Dict[str, str]]) -> Dict[str, Any]:
+        """
+        生成人物画像
+        
+        Args:
+            context_window: 对话历史窗口
+            
+        Returns:
+            Dict: 人物画像数据 (JSON)
+        """
+        messages = self._build_messages(context_window)
+        resp = self._client.chat_json(self._model, messages, temperature=0.2, cache_ttl=self.CACHE_TTL)
         return resp
+
+    async def aprofile(self, context_window: List[Dict[str, str]]) -> Dict[str, Any]:
+        """
+        生成人物画像 (异步版本)
+        """
+        messages = self._build_messages(context_window)
+        return await self._client.achat_json(self._model, messages, temperature=0.2, cache_ttl=self.CACHE_TTL)
@@ -25,3 +25,10 @@ class ProfileSummarizer:
         """
         # 临时实现
         return "用户画像摘要暂时不可用。"
+
+    async def asummarize(self, user_facts: List[str], relationship_stage: str, intimacy_level: int) -> str:
+        """
+        生成摘要 (异步版本)
+        """
+        # 临时实现
+        return self.summarize(user_facts, relationship_stage, intimacy_level)
@@ -9,10 +9,22 @@ class RelationshipAnalyzer:
     
     分析当前两人关系的阶段、亲密度、信任度等维度。
     """
+    # 响应缓存有效期 (秒)
+    CACHE_TTL = 600
+
     def __init__(self, client: QwenClient, model: str):
         self._client = client
         self._model = model
 
+    def _build_messages(self, conversation_history: str) -> List[Dict[str, str]]:
+        user_prompt = RELATIONSHIP_ANALYSIS_PROMPT.replace(
+            "{conversation_history}", conversation_history
+        )
+        return [
+            {"role": "system", "content": "你是恋爱关系分析专家，严格输出JSON。"},
+            {"role": "user", "content": user_prompt},
+        ]
+
     def analyze(self, conversation_history: str) -> Dict[str, Any]:
         """
         分析关系状态
@@ -23,14 +35,15 @@ class RelationshipAnalyzer:
         Returns:
             Dict: 关系分析结果 (JSON)
         """
-        user_prompt = RELATIONSHIP_ANALYSIS_PROMPT.replace(
-            "{conversation_history}", conversation_history
-        )
-        messages = [
-            {"role": "system", "content": "你是恋爱关系分析专家，严格输出JSON。"},
-            {"role": "user", "content": user_prompt},
-        ]
-        return self._client.chat_json(self._model, messages, temperature=0.5)
+        messages = self._build_messages(conversation_history)
+        return self._client.chat_json(self._model, messages, temperature=0.5, cache_ttl=self.CACHE_TTL)
+
+    async def aanalyze(self, conversation_history: str) -> Dict[str, Any]:
+        """
+        分析关系状态 (异步版本)
+        """
+        messages = self._build_messages(conversation_history)
+        return await self._client.achat_json(self._model, messages, temperature=0.5, cache_ttl=self.CACHE_TTL)
 
     def update_state(self, conversation_history: str, current_state: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -43,5 +56,11 @@ class RelationshipAnalyzer:
         Returns:
             Dict: 更新后的状态
         """
-        # 目前简化为重新分析，后续可加入状态平滑过渡逻辑
+        # 每次调用都完整重新分析；是否需要调用由 LoveAgent 中的 ChangeDetector 判断 (变化不大时直接沿用状态)
         return self.analyze(conversation_history)
+
+    async def aupdate_state(self, conversation_history: str, current_state: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        基于新的历史和当前状态更新关系状态 (异步版本)
+        """
+        return await self.aanalyze(conversation_history)
@@ -9,10 +9,35 @@ class SearchIntentAnalyzer:
     
     判断用户当前的问题是否需要借助外部知识库或联网搜索来回答。
     """
+    # 响应缓存有效期 (秒)
+    CACHE_TTL = 600
+
     def __init__(self, client: QwenClient, model: str):
         self._client = client
         self._model = model
 
+    def _build_prompt(self, latest_message: str, context_history: str) -> str:
+        return (
+            RESEARCH_INTENT_PROMPT.replace("{current_message}", str(latest_message))
+            .replace("{context_history}", str(context_history))
+        )
+
+    def _build_messages(self, user_prompt: str) -> List[Dict[str, str]]:
+        # print(f"DEBUG SEARCH PROMPT:\n{user_prompt}")
+        return [
+            {"role": "system", "content": "你是对话分析专家，严格输出JSON对象。"},
+            {"role": "user", "content": user_prompt},
+        ]
+
+    @staticmethod
+    def normalize(resp: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        规范化模型输出 (强制布尔值转换)
+        """
+        if isinstance(resp.get("need_search"), str):
+            resp["need_search"] = str(resp["need_search"]).lower() == "true"
+        return resp
+
     def analyze(self, latest_message: str, context_history: str) -> Dict[str, Any]:
         """
         分析搜索意图
@@ -24,23 +49,17 @@ class SearchIntentAnalyzer:
         Returns:
             Dict: 包含 need_search (bool) 和 search_query (str)
         """
-        user_prompt = (
-            RESEARCH_INTENT_PROMPT.replace("{current_message}", str(latest_message))
-            .replace("{context_history}", str(context_history))
-        )
-        # print(f"DEBUG SEARCH PROMPT:\n{user_prompt}")
-        messages = [
-            {"role": "system", "content": "你是对话分析专家，严格输出JSON对象。"},
-            {"role": "user", "content": user_prompt},
-        ]
+        user_prompt = self._build_prompt(latest_message, context_history)
+        messages = self._build_messages(user_prompt)
         # 使用极低温度以保证逻辑判断的确定性
-        resp = self._client.chat_json(self._model, messages, temperature=0.01) 
-        
-        # 调试日志
-        with open("debug_search_intent.log", "a") as f:
-            f.write(f"\n--- New Analysis ---\nInput: {latest_message}\nPrompt: {user_prompt}\nResponse: {resp}\n")
-            
-        # 强制布尔值转换
-        if isinstance(resp.get("need_search"), str):
-            resp["need_search"] = str(resp["need_search"]).lower() == "true"
-        return resp
+        resp = self._client.chat_json(self._model, messages, temperature=0.01, cache_ttl=self.CACHE_TTL) 
+        return self.normalize(resp)
+
+    async def aanalyze(self, latest_message: str, context_history: str) -> Dict[str, Any]:
+        """
+        分析搜索意图 (异步版本)
+        """
+        user_prompt = self._build_prompt(latest_message, context_history)
+        messages = self._build_messages(user_prompt)
+        resp = await self._client.achat_json(self._model, messages, temperature=0.01, cache_ttl=self.CACHE_TTL)
+        return self.normalize(resp)
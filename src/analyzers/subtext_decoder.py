@@ -1,4 +1,4 @@
-from typing import Dict, Any
+from typing import Dict, Any, List
 from src.model.qwen_client import QwenClient
 from src.prompts.prompts import SUBTEXT_DECODING_PROMPT
 
@@ -9,10 +9,25 @@ class SubtextDecoder:
     
     深度分析对方话语背后的真实意图和隐含情绪。
     """
+    # 响应缓存有效期 (秒)
+    CACHE_TTL = 600
+
     def __init__(self, client: QwenClient, model: str):
         self._client = client
         self._model = model
 
+    def _build_messages(self, target_message: str, context_history: str, relationship_stage: str) -> List[Dict[str, str]]:
+        user_prompt = (
+            SUBTEXT_DECODING_PROMPT.replace("{target_message}", str(target_message))
+            .replace("{context_history}", str(context_history))
+            .replace("{relationship_stage}", str(relationship_stage))
+        )
+        
+        return [
+            {"role": "system", "content": "你是恋爱读心神探，敏锐洞察潜台词，严格输出JSON。"},
+            {"role": "user", "content": user_prompt},
+        ]
+
     def decode(
         self,
         target_message: str,
@@ -34,21 +49,32 @@ class SubtextDecoder:
         if not target_message:
             return {}
             
-        user_prompt = (
-            SUBTEXT_DECODING_PROMPT.replace("{target_message}", str(target_message))
-            .replace("{context_history}", str(context_history))
-            .replace("{relationship_stage}", str(relationship_stage))
-        )
-        
-        messages = [
-            {"role": "system", "content": "你是恋爱读心神探，敏锐洞察潜台词，严格输出JSON。"},
-            {"role": "user", "content": user_prompt},
-        ]
+        messages = self._build_messages(target_message, context_history, relationship_stage)
         
         try:
-            resp = self._client.chat_json(self._model, messages, temperature=0.5)
+            resp = self._client.chat_json(self._model, messages, temperature=0.5, cache_ttl=self.CACHE_TTL)
             # print(f"DEBUG SUBTEXT RESP: {resp}") # Uncomment for debugging
             return resp
         except Exception as e:
             print(f"潜台词解码错误: {e}")
             return {}
+
+    async def adecode(
+        self,
+        target_message: str,
+        context_history: str,
+        relationship_stage: str,
+    ) -> Dict[str, Any]:
+        """
+        解码潜台词 (异步版本)
+        """
+        if not target_message:
+            return {}
+
+        messages = self._build_messages(target_message, context_history, relationship_stage)
+
+        try:
+            return await self._client.achat_json(self._model, messages, temperature=0.5, cache_ttl=self.CACHE_TTL)
+        except Exception as e:
+            print(f"潜台词解码错误: {e}")
+            return {}
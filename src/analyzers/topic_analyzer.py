@@ -9,10 +9,23 @@ class TopicAnalyzer:
     
     识别当前对话的话题，用于辅助知识库检索和话题转移策略。
     """
+    # 响应缓存有效期 (秒)：同一对话窗口在重试时会被重复分析
+    CACHE_TTL = 600
+
     def __init__(self, client: QwenClient, model: str):
         self._client = client
         self._model = model
 
+    def _build_messages(self, latest_message: str, context_history: str) -> List[Dict[str, str]]:
+        user_prompt = (
+            TOPIC_ANALYSIS_PROMPT.replace("{current_message}", str(latest_message))
+            .replace("{context_history}", str(context_history))
+        )
+        return [
+            {"role": "system", "content": "你是对话话题分析专家，严格输出JSON对象。"},
+            {"role": "user", "content": user_prompt},
+        ]
+
     def analyze(self, latest_message: str, context_history: str) -> List[str]:
         """
         分析对话话题
@@ -24,13 +37,14 @@ class TopicAnalyzer:
         Returns:
             List[str]: 话题列表
         """
-        user_prompt = (
-            TOPIC_ANALYSIS_PROMPT.replace("{current_message}", str(latest_message))
-            .replace("{context_history}", str(context_history))
-        )
-        messages = [
-            {"role": "system", "content": "你是对话话题分析专家，严格输出JSON对象。"},
-            {"role": "user", "content": user_prompt},
-        ]
-        resp = self._client.chat_json(self._model, messages, temperature=0.1)
+        messages = self._build_messages(latest_message, context_history)
+        resp = self._client.chat_json(self._model, messages, temperature=0.1, cache_ttl=self.CACHE_TTL)
+        return resp.get("topics", [])
+
+    async def aanalyze(self, latest_message: str, context_history: str) -> List[str]:
+        """
+        分析对话话题 (异步版本)
+        """
+        messages = self._build_messages(latest_message, context_history)
+        resp = await self._client.achat_json(self._model, messages, temperature=0.1, cache_ttl=self.CACHE_TTL)
         return resp.get("topics", [])
@@ -1,4 +1,4 @@
-from typing import Dict, Any
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 from src.model.qwen_client import QwenClient
 from src.prompts.prompts import EMOTIONAL_FIRST_AID_PROMPT
 
@@ -13,6 +13,21 @@ class EmpathyEngine:
         self._client = client
         self._model = model
 
+    def _build_messages(self, target_message: str, current_emotion: str, emotion_score: int,
+                        relationship_stage: str, persona: Dict[str, Any], user_facts: list) -> List[Dict[str, str]]:
+        user_prompt = (
+            EMOTIONAL_FIRST_AID_PROMPT.replace("{target_message}", str(target_message))
+            .replace("{current_emotion}", str(current_emotion))
+            .replace("{emotion_score}", str(emotion_score))
+            .replace("{relationship_stage}", str(relationship_stage))
+            .replace("{persona}", str(persona or {}))
+            .replace("{user_facts}", str(user_facts or []))
+        )
+        return [
+            {"role": "system", "content": "你是中文情感急救助手，生成口语自然的三段式回复（共情+安慰+解决建议），严格输出JSON，包含replies数组，每条含text与reason。"},
+            {"role": "user", "content": user_prompt},
+        ]
+
     def generate(self, target_message: str, current_emotion: str, emotion_score: int, 
                  relationship_stage: str = "未知", persona: Dict[str, Any] = None, 
                  user_facts: list = None, temperature: float = 0.7) -> Dict[str, Any]:
@@ -31,17 +46,22 @@ class EmpathyEngine:
         Returns:
             Dict: 包含建议回复列表 (replies)
         """
-        user_prompt = (
-            EMOTIONAL_FIRST_AID_PROMPT.replace("{target_message}", str(target_message))
-            .replace("{current_emotion}", str(current_emotion))
-            .replace("{emotion_score}", str(emotion_score))
-            .replace("{relationship_stage}", str(relationship_stage))
-            .replace("{persona}", str(persona or {}))
-            .replace("{user_facts}", str(user_facts or []))
-        )
-        messages = [
-            {"role": "system", "content": "你是中文情感急救助手，生成口语自然的三段式回复（共情+安慰+解决建议），严格输出JSON，包含replies数组，每条含text与reason。"},
-            {"role": "user", "content": user_prompt},
-        ]
+        messages = self._build_messages(target_message, current_emotion, emotion_score,
+                                        relationship_stage, persona, user_facts)
         resp = self._client.chat_json(self._model, messages, temperature=temperature)
         return resp
+
+    async def agenerate(self, target_message: str, current_emotion: str, emotion_score: int,
+                        relationship_stage: str = "未知", persona: Dict[str, Any] = None,
+                        user_facts: list = None, temperature: float = 0.7,
+                        on_token: Optional[Callable[[str], Awaitable[None]]] = None) -> Dict[str, Any]:
+        """
+        生成共情回复 (异步版本)
+
+        传入 on_token 时使用流式输出，模型每产出一段文本就回调一次。
+        """
+        messages = self._build_messages(target_message, current_emotion, emotion_score,
+                                        relationship_stage, persona, user_facts)
+        if on_token is not None:
+            return await self._client.astream_json(self._model, messages, temperature=temperature, on_delta=on_token)
+        return await self._client.achat_json(self._model, messages, temperature=temperature)
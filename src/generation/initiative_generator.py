@@ -13,21 +13,7 @@ class InitiativeGenerator:
         self._client = client
         self._model = model
 
-    def generate(self, relationship_stage: str, intimacy_level: int, persona: Dict[str, Any], user_facts: List[str], last_chat_time: str, environment_context: str) -> Dict[str, Any]:
-        """
-        生成搭讪建议
-        
-        Args:
-            relationship_stage: 关系阶段
-            intimacy_level: 亲密度等级
-            persona: 对方画像
-            user_facts: 相关事实
-            last_chat_time: 上次聊天时间
-            environment_context: 环境上下文（天气、节日等）
-            
-        Returns:
-            Dict: 建议内容
-        """
+    def _build_messages(self, relationship_stage: str, intimacy_level: int, persona: Dict[str, Any], user_facts: List[str], last_chat_time: str, environment_context: str) -> List[Dict[str, str]]:
         current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
         user_prompt = (
@@ -40,9 +26,34 @@ class InitiativeGenerator:
             .replace("{user_facts}", str(user_facts))
         )
         
-        messages = [
+        return [
             {"role": "system", "content": "你是高情商恋爱军师，善于制造自然、有趣的话题开场。严格输出JSON，包含options数组。"},
             {"role": "user", "content": user_prompt},
         ]
+
+    def generate(self, relationship_stage: str, intimacy_level: int, persona: Dict[str, Any], user_facts: List[str], last_chat_time: str, environment_context: str) -> Dict[str, Any]:
+        """
+        生成搭讪建议
         
+        Args:
+            relationship_stage: 关系阶段
+            intimacy_level: 亲密度等级
+            persona: 对方画像
+            user_facts: 相关事实
+            last_chat_time: 上次聊天时间
+            environment_context: 环境上下文（天气、节日等）
+            
+        Returns:
+            Dict: 建议内容
+        """
+        messages = self._build_messages(relationship_stage, intimacy_level, persona, user_facts,
+                                        last_chat_time, environment_context)
         return self._client.chat_json(self._model, messages, temperature=0.9)
+
+    async def agenerate(self, relationship_stage: str, intimacy_level: int, persona: Dict[str, Any], user_facts: List[str], last_chat_time: str, environment_context: str) -> Dict[str, Any]:
+        """
+        生成搭讪建议 (异步版本)
+        """
+        messages = self._build_messages(relationship_stage, intimacy_level, persona, user_facts,
+                                        last_chat_time, environment_context)
+        return await self._client.achat_json(self._model, messages, temperature=0.9)
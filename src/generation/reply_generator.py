@@ -1,6 +1,7 @@
-from typing import Dict, Any, List
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from src.model.qwen_client import QwenClient
 from src.prompts.prompts import REPLY_COMPOSITION_PROMPT
+from src.prompts.prompt_assembler import PromptAssembler, compact_json
 
 
 class ReplyGenerator:
@@ -8,10 +9,67 @@ class ReplyGenerator:
     回复生成器
     
     综合各种上下文信息（策略、画像、记忆、检索结果等），生成最终的回复候选项。
+    提示词由 PromptAssembler 紧凑序列化并按模型预算裁剪。
     """
-    def __init__(self, client: QwenClient, model: str):
+    def __init__(self, client: QwenClient, model: str, assembler: Optional[PromptAssembler] = None):
         self._client = client
         self._model = model
+        self._assembler = assembler or PromptAssembler()
+
+    def _build_request(
+        self,
+        target_message: str,
+        relationship_stage: str,
+        intimacy_level: int,
+        humor_level: int,
+        reply_strategy: str,
+        language_style: str,
+        current_appellation: str,
+        kb_context: Dict[str, Any],
+        retrieval_context: List[Dict[str, Any]] | None = None,
+        user_gender: str = "未知",
+        target_gender: str = "未知",
+        topic_management: Dict[str, Any] | None = None,
+        boundary_assessment: Dict[str, Any] | None = None,
+        continuation_assessment: Dict[str, Any] | None = None,
+        action_guide: Dict[str, Any] | None = None,
+        user_facts: List[str] | None = None,
+    ) -> Tuple[List[Dict[str, str]], bool, Dict[str, Any]]:
+        # 检查是否需要在线搜索
+        enable_search = bool((kb_context or {}).get("need_online_search", False))
+
+        # 知识库上下文中的搜索标记只用于控制在线搜索，不写入提示词
+        kb_materials = {k: v for k, v in (kb_context or {}).items() if k != "need_online_search"}
+
+        user_prompt, usage = self._assembler.assemble(
+            REPLY_COMPOSITION_PROMPT,
+            self._model,
+            fixed={
+                "target_message": target_message,
+                "relationship_stage": relationship_stage,
+                "intimacy_level": intimacy_level,
+                "humor_level": humor_level,
+                "reply_strategy": reply_strategy,
+                "language_style": language_style,
+                "current_appellation": current_appellation,
+                "user_gender": user_gender,
+                "target_gender": target_gender,
+            },
+            sections={
+                "retrieval_materials": PromptAssembler.serialize_retrieval(retrieval_context),
+                "kb_materials": compact_json(kb_materials),
+                "user_facts": PromptAssembler.serialize_facts(user_facts),
+                "topic_management": compact_json(topic_management),
+                "continuation_assessment": compact_json(continuation_assessment),
+                "boundary_assessment": compact_json(boundary_assessment),
+                "action_guide": compact_json(action_guide),
+            },
+        )
+        messages = [
+            {"role": "system", "content": "你是中文恋爱聊天助手，生成口语自然的微信聊天候选，严格输出JSON，仅包含replies数组。"},
+            {"role": "user", "content": user_prompt},
+        ]
+        return messages, enable_search, usage
 
     def generate(
         self,
@@ -55,40 +113,55 @@ class ReplyGenerator:
             temperature: 随机性
             
         Returns:
-            Dict: 包含多个回复选项的 JSON
+            Dict: 包含多个回复选项的 JSON，附带 prompt_usage (各段落的提示词 token 用量)
         """
-        retrieval_materials = str(retrieval_context or [])
-        kb_materials = str(kb_context or {})
-        topic_management_str = str(topic_management or {})
-        boundary_assessment_str = str(boundary_assessment or {})
-        continuation_assessment_str = str(continuation_assessment or {})
-        action_guide_str = str(action_guide or {})
-        facts_str = str(user_facts or [])
-        
-        # 检查是否需要在线搜索
-        enable_search = kb_context.get("need_online_search", False)
-        
-        user_prompt = (
-            REPLY_COMPOSITION_PROMPT.replace("{target_message}", str(target_message))
-            .replace("{relationship_stage}", str(relationship_stage))
-            .replace("{intimacy_level}", str(intimacy_level))
-            .replace("{humor_level}", str(humor_level))
-            .replace("{reply_strategy}", str(reply_strategy))
-            .replace("{language_style}", str(language_style))
-            .replace("{current_appellation}", str(current_appellation))
-            .replace("{retrieval_materials}", retrieval_materials)
-            .replace("{kb_materials}", kb_materials)
-            .replace("{user_gender}", str(user_gender))
-            .replace("{target_gender}", str(target_gender))
-            .replace("{topic_management}", topic_management_str)
-            .replace("{boundary_assessment}", boundary_assessment_str)
-            .replace("{continuation_assessment}", continuation_assessment_str)
-            .replace("{action_guide}", action_guide_str)
-            .replace("{user_facts}", facts_str)
+        messages, enable_search, usage = self._build_request(
+            target_message, relationship_stage, intimacy_level, humor_level, reply_strategy,
+            language_style, current_appellation, kb_context, retrieval_context, user_gender,
+            target_gender, topic_management, boundary_assessment, continuation_assessment,
+            action_guide, user_facts,
         )
-        messages = [
-            {"role": "system", "content": "你是中文恋爱聊天助手，生成口语自然的微信聊天候选，严格输出JSON，仅包含replies数组。"},
-            {"role": "user", "content": user_prompt},
-        ]
         resp = self._client.chat_json(self._model, messages, temperature=temperature, enable_search=enable_search)
-        return resp
+        # 复制一份再附加用量，避免改动缓存中的响应对象
+        return {**resp, "prompt_usage": usage}
+
+    async def agenerate(
+        self,
+        target_message: str,
+        relationship_stage: str,
+        intimacy_level: int,
+        humor_level: int,
+        reply_strategy: str,
+        language_style: str,
+        current_appellation: str,
+        kb_context: Dict[str, Any],
+        retrieval_context: List[Dict[str, Any]] | None = None,
+        user_gender: str = "未知",
+        target_gender: str = "未知",
+        topic_management: Dict[str, Any] | None = None,
+        boundary_assessment: Dict[str, Any] | None = None,
+        continuation_assessment: Dict[str, Any] | None = None,
+        action_guide: Dict[str, Any] | None = None,
+        user_facts: List[str] | None = None,
+        temperature: float = 0.8,
+        on_token: Optional[Callable[[str], Awaitable[None]]] = None,
+    ) -> Dict[str, Any]:
+        """
+        生成回复 (异步版本)
+
+        传入 on_token 时使用流式输出，模型每产出一段文本就回调一次。
+        """
+        messages, enable_search, usage = self._build_request(
+            target_message, relationship_stage, intimacy_level, humor_level, reply_strategy,
+            language_style, current_appellation, kb_context, retrieval_context, user_gender,
+            target_gender, topic_management, boundary_assessment, continuation_assessment,
+            action_guide, user_facts,
+        )
+        if on_token is not None:
+            resp = await self._client.astream_json(
+                self._model, messages, temperature=temperature, enable_search=enable_search, on_delta=on_token
+            )
+        else:
+            resp = await self._client.achat_json(self._model, messages, temperature=temperature, enable_search=enable_search)
+        # 复制一份再附加用量，避免改动缓存中的响应对象
+        return {**resp, "prompt_usage": usage}
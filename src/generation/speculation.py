@@ -0,0 +1,90 @@
+from typing import Any, Dict, List, Optional
+import threading
+from src.prompts.prompt_assembler import compact_json
+from src.retrieval.lexical_index import tokenize
+
+# 判断策略是否一致时比较的字段
+DEFAULT_FIELDS = ["reply_strategy", "language_style", "action_guide"]
+
+
+def _text_similarity(a: str, b: str) -> float:
+    """
+    基于字符二元组的 Jaccard 相似度
+    """
+    if a == b:
+        return 1.0
+    ta, tb = set(tokenize(a)), set(tokenize(b))
+    if not ta or not tb:
+        return 0.0
+    return len(ta & tb) / len(ta | tb)
+
+
+def strategy_similarity(previous: Dict[str, Any], current: Dict[str, Any], fields: Optional[List[str]] = None) -> float:
+    """
+    比较两次策略规划的相似度 (各字段相似度的平均值)
+
+    文本字段直接比较，字典字段 (如 action_guide) 先紧凑序列化再比较。
+
+    Args:
+        previous: 推测生成使用的策略 (上一轮保存的规划结果)
+        current: 本轮规划结果
+        fields: 参与比较的字段
+
+    Returns:
+        float: 0.0 - 1.0
+    """
+    fields = fields or DEFAULT_FIELDS
+    scores = []
+    for field in fields:
+        a, b = previous.get(field), current.get(field)
+        a = a if isinstance(a, str) else compact_json(a)
+        b = b if isinstance(b, str) else compact_json(b)
+        scores.append(_text_similarity(a, b))
+    return sum(scores) / len(scores) if scores else 0.0
+
+
+class SpeculationStats:
+    """
+    推测生成统计 (线程安全)
+
+    命中时节省的时间 = 规划完成后再生成的预计完成时刻 - 实际拿到候选的时刻；
+    未命中时记录被丢弃的推测生成已运行的时间。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._skipped = 0
+        self._saved_ms = 0.0
+        self._wasted_ms = 0.0
+
+    def record_hit(self, saved_ms: float):
+        with self._lock:
+            self._hits += 1
+            self._saved_ms += max(0.0, saved_ms)
+
+    def record_miss(self, wasted_ms: float):
+        with self._lock:
+            self._misses += 1
+            self._wasted_ms += max(0.0, wasted_ms)
+
+    def record_skip(self):
+        with self._lock:
+            self._skipped += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        获取命中率与节省 / 浪费的时间
+        """
+        with self._lock:
+            attempts = self._hits + self._misses
+            return {
+                "attempts": attempts,
+                "hits": self._hits,
+                "misses": self._misses,
+                "skipped": self._skipped,
+                "hit_rate": round(self._hits / attempts, 4) if attempts else 0.0,
+                "saved_ms": round(self._saved_ms, 2),
+                "avg_saved_ms": round(self._saved_ms / self._hits, 2) if self._hits else 0.0,
+                "wasted_ms": round(self._wasted_ms, 2),
+            }
@@ -1,7 +1,8 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import hashlib
 import time
 from src.vectorstore.chroma_store import ChromaStore
+from src.retrieval.lexical_index import LexicalIndex
 
 class HistoryIngestor:
     """
@@ -10,8 +11,14 @@ class HistoryIngestor:
     负责将聊天记录存入向量数据库，以便后续检索。
     使用 MD5 生成唯一消息 ID，确保去重。
     """
-    def __init__(self, vector_store: ChromaStore):
+    def __init__(self, vector_store: ChromaStore, lexical_index: Optional[LexicalIndex] = None):
+        """
+        Args:
+            vector_store: 历史聊天向量库
+            lexical_index: 历史聊天的 BM25 索引，为空则只写向量库
+        """
         self._vs = vector_store
+        self._lexical = lexical_index
 
     def ingest(self, context: Dict[str, Any]):
         """
@@ -32,6 +39,7 @@ class HistoryIngestor:
             if new_msg not in messages:
                 messages = messages + [new_msg]
 
+        ids, texts, metadatas = [], [], []
         for msg in messages:
             content = msg.get("content", "")
             if not content:
@@ -39,6 +47,11 @@ class HistoryIngestor:
                 
             speaker = msg.get("speaker", "unknown")
             timestamp = msg.get("timestamp") or int(time.time())
+            try:
+                # 以数值存储，供检索时按时间范围过滤
+                timestamp = int(timestamp)
+            except (TypeError, ValueError):
+                timestamp = int(time.time())
             
             # Create a unique ID
             # Use content and timestamp to ensure uniqueness but allow dedup
@@ -53,4 +66,12 @@ class HistoryIngestor:
                 "type": "chat_history"
             }
             
-            self._vs.add_text_if_not_exists(msg_id, content, metadata)
+            ids.append(msg_id)
+            texts.append(content)
+            metadatas.append(metadata)
+
+        # 批量查重 + 批量写入，避免逐条 get/add 往返
+        if ids:
+            self._vs.add_texts_if_not_exist(ids, texts, metadatas)
+            if self._lexical is not None:
+                self._lexical.add_texts(ids, texts, metadatas)
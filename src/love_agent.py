@@ -1,31 +1,87 @@
 import os
 import json
 import asyncio
+import datetime
 import time
-from typing import Dict, Any, List
-from src.model.qwen_client import QwenClient
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from src.model.qwen_client import AsyncQwenClient
+from src.model.response_cache import ResponseCache
 from src.analyzers.emotion_analyzer import EmotionAnalyzer
 from src.analyzers.persona_profiler import PersonaProfiler
 from src.analyzers.search_intent_analyzer import SearchIntentAnalyzer
 from src.analyzers.relationship_analyzer import RelationshipAnalyzer
 from src.analyzers.topic_analyzer import TopicAnalyzer
+from src.analyzers.fused_analyzer import FusedAnalyzer
 from src.analyzers.fact_extractor import FactExtractor
 from src.progress.state_manager import StateManager
+from src.progress.log_state_manager import LogStateManager
+from src.progress.sqlite_state_manager import SQLiteStateManager
+from src.progress.state_cache import CachedStateManager
 from src.generation.reply_generator import ReplyGenerator
+from src.generation.speculation import SpeculationStats, strategy_similarity
+from src.prompts.prompt_assembler import PromptAssembler
+from src.pipeline.stage_graph import StageGraph, StageStats
+from src.pipeline.job_queue import JobQueue
 from src.generation.empathy_engine import EmpathyEngine
 from src.generation.initiative_generator import InitiativeGenerator
 from src.analyzers.image_analyzer import ImageAnalyzer
 from src.analyzers.profile_summarizer import ProfileSummarizer
+from src.analyzers.conversation_summarizer import ConversationSummarizer
 from src.analyzers.subtext_decoder import SubtextDecoder
 from src.analyzers.chat_reviewer import ChatReviewer
 from src.progress.opportunity_detector import OpportunityDetector
+from src.progress.change_detector import ChangeDetector
 from src.progress.strategy_planner import StrategyPlanner
 from src.progress.feedback_handler import FeedbackHandler
 from src.progress.context_awareness import ContextAwareness
 from src.vectorstore.chroma_store import ChromaStore
+from src.vectorstore.embedding_service import EmbeddingService, build_embedding_function
+from src.vectorstore.numpy_store import NumpyStore
 from src.ingestion.history_ingestor import HistoryIngestor
 from src.retrieval.retrieval_orchestrator import RetrievalOrchestrator
+from src.retrieval.lexical_index import LexicalIndex
 from src.safety.safety_checker import SafetyChecker
+from src.safety.safety_prefilter import SafetyPrefilter
+from src.prompts.token_budget import estimate_tokens, fit_lines_from_end
+
+# 事实库的固定检索语句 (启动时预热查询向量)
+FACT_QUERY_PROFILE = "用户"
+FACT_QUERY_PREFERENCES = "用户喜好 习惯"
+FACT_QUERY_LESSONS = "用户偏好调整 策略教训"
+
+
+def _merge_messages(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    # 摄入按消息 ID 去重，合并时直接拼接
+    return {"messages": old.get("messages", []) + new.get("messages", [])}
+
+
+def _merge_fact_texts(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    # 多轮积压的消息合并为一次事实提取，历史取最新
+    return {"texts": old.get("texts", []) + new.get("texts", []), "history": new.get("history", "")}
+
+
+def _merge_updates(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    return {"updates": {**old.get("updates", {}), **new.get("updates", {})}}
+
+
+# 关系分析产出并保存在状态中的字段
+RELATIONSHIP_FIELDS = ("relationship_stage", "intimacy_level", "radar", "overall_analysis")
+# 流水线阶段降级时对应的过期分析字段
+STALE_FIELDS = [
+    ("persona", "persona"),
+    ("intent", "search_intent"),
+    ("search", "kb_context"),
+    ("fact_retrieval", "facts"),
+    ("subtext", "subtext"),
+    ("rel_update", "radar"),
+    ("rel_update", "overall_analysis"),
+    ("analyze", "emotion"),
+    ("analyze", "topics"),
+    ("relationship", "radar"),
+    ("relationship", "overall_analysis"),
+    ("plan", "strategy"),
+    ("generate", "replies"),
+]
 
 
 class LoveAgent:
@@ -45,22 +101,84 @@ class LoveAgent:
         Args:
             config: 配置字典，包含模型配置、路径配置等
         """
-        self._client = QwenClient()
-        self._model = config.get("model", {}).get("default", "qwen-plus")
+        model_cfg = config.get("model", {})
+        
+        # LLM 响应缓存 (内存 LRU + 可选 SQLite)
+        cache_cfg = config.get("cache", {})
+        llm_cache = None
+        if cache_cfg.get("enabled", True):
+            llm_cache = ResponseCache(
+                max_entries=cache_cfg.get("max_entries", 2048),
+                sqlite_path=cache_cfg.get("sqlite_path"),
+                bypass_temperature=cache_cfg.get("bypass_temperature", 0.7),
+                max_disk_entries=cache_cfg.get("max_disk_entries", 50000),
+            )
+        
+        # 异步客户端: 分析任务直接运行在事件循环上，共享有上限的 keep-alive 连接池
+        self._client = AsyncQwenClient(
+            max_connections=model_cfg.get("max_connections", 20),
+            max_keepalive_connections=model_cfg.get("max_keepalive_connections", 10),
+            timeout=model_cfg.get("timeout", 60.0),
+            cache=llm_cache,
+        )
+        self._model = model_cfg.get("default", "qwen-plus")
+        # 合并分析模式默认值 (可被单次请求的 fused_analysis 覆盖)
+        self._fused_default = bool(config.get("analysis", {}).get("fused", False))
+        # 安全检查是否合并为一次批量调用
+        safety_cfg = config.get("safety", {})
+        self._safety_batch = bool(safety_cfg.get("batch", True))
         
         # 初始化向量数据库路径
-        persist_dir = config.get("chroma", {}).get("persist_directory", "data/chroma")
-        self._history_vs = ChromaStore(persist_dir, "history_embeddings") # 历史聊天记录向量库
-        self._interest_vs = ChromaStore(persist_dir, "interest_embeddings") # 兴趣点向量库
-        self._fact_vs = ChromaStore(persist_dir, "fact_embeddings") # 长期记忆/事实向量库
+        chroma_cfg = config.get("chroma", {})
+        persist_dir = chroma_cfg.get("persist_directory", "data/chroma")
+        batch_size = chroma_cfg.get("batch_size", 512)
+        persistent = bool(chroma_cfg.get("persistent", True))
+        # 向量库后端: chroma 或进程内的 numpy 暴力检索 (接口一致)
+        backend = chroma_cfg.get("backend", "chroma")
+        store_cls = NumpyStore if backend == "numpy" else ChromaStore
+        # 所有向量库共享一个查询向量缓存；numpy 后端默认使用 API Embedding，不依赖 chromadb
+        embedding_cfg = chroma_cfg.get("embedding") or {}
+        self._embeddings = EmbeddingService(
+            embedding_fn=build_embedding_function(
+                embedding_cfg.get("provider"),
+                backend=backend,
+                model=embedding_cfg.get("model", "text-embedding-v3"),
+                batch_size=embedding_cfg.get("batch_size", 10),
+                dimensions=embedding_cfg.get("dimensions"),
+            ),
+            max_entries=chroma_cfg.get("embedding_cache_size", 4096),
+        )
+        self._history_vs = store_cls(persist_dir, "history_embeddings", batch_size=batch_size, embedding_service=self._embeddings, persistent=persistent) # 历史聊天记录向量库
+        self._interest_vs = store_cls(persist_dir, "interest_embeddings", batch_size=batch_size, embedding_service=self._embeddings, persistent=persistent) # 兴趣点向量库
+        self._fact_vs = store_cls(
+            persist_dir, "fact_embeddings", batch_size=batch_size, embedding_service=self._embeddings, persistent=persistent,
+            partition=chroma_cfg.get("fact_partition", "where"),
+            max_open_partitions=chroma_cfg.get("max_open_partitions", 64),
+        ) # 长期记忆/事实向量库 (按会话分区，检索只涉及当前会话的数据)
         
         # 状态持久化管理
-        state_dir = config.get("state", {}).get("persist_directory", "data/state")
-        self._state_manager = StateManager(state_dir)
+        state_cfg = config.get("state", {})
+        state_dir = state_cfg.get("persist_directory", "data/state")
+        self._state_manager = self._build_state_manager(state_cfg, state_dir)
+        # 分析只需要最近的聊天窗口，只读取日志末尾
+        self._history_tail = int(state_cfg.get("history_tail", 50))
         
         # 初始化各个功能模块
-        self._ingestor = HistoryIngestor(self._history_vs)
-        self._retrieval = RetrievalOrchestrator(self._history_vs)
+        # 历史聊天的 BM25 索引 (与向量检索融合)
+        retrieval_cfg = config.get("retrieval", {})
+        history_lexical = None
+        if retrieval_cfg.get("hybrid", True):
+            history_lexical = LexicalIndex(
+                persist_path=os.path.join(persist_dir, "lexical", "history.jsonl") if persistent else None
+            )
+        self._ingestor = HistoryIngestor(self._history_vs, lexical_index=history_lexical)
+        self._retrieval = RetrievalOrchestrator(
+            self._history_vs,
+            lexical_index=history_lexical,
+            lexical_top_k=retrieval_cfg.get("lexical_top_k", 10),
+            rrf_k=retrieval_cfg.get("rrf_k", 60),
+            recency_half_life_days=retrieval_cfg.get("recency_half_life_days", 0),
+        )
         self._emotion = EmotionAnalyzer(self._client, self._model)
         self._persona = PersonaProfiler(self._client, self._model)
         self._relationship = RelationshipAnalyzer(self._client, self._model)
@@ -68,30 +186,188 @@ class LoveAgent:
         self._fact_extractor = FactExtractor(self._client, self._model)
         self._search_intent = SearchIntentAnalyzer(self._client, self._model)
         self._planner = StrategyPlanner(self._client, self._model)
-        self._reply = ReplyGenerator(self._client, self._model)
+        pipeline_cfg = config.get("pipeline", {})
+        self._stage_timeouts = {k: float(v) for k, v in (pipeline_cfg.get("stage_timeouts") or {}).items() if v}
+        self._stage_stats = StageStats()
+        # 请求默认时间预算 (毫秒，0 为不限)；规划与生成的上游阶段需为回复生成预留的时间
+        self._deadline_ms = int(pipeline_cfg.get("deadline_ms", 0) or 0)
+        self._generation_reserve = float(pipeline_cfg.get("generation_reserve_ms", 0) or 0) / 1000
+        # 推测生成 (默认关闭): 用上一轮策略提前生成，与本轮策略规划并行
+        speculation_cfg = config.get("speculation", {})
+        self._speculation_default = bool(speculation_cfg.get("enabled", False))
+        self._speculation_threshold = float(speculation_cfg.get("similarity_threshold", 0.8))
+        self._speculation_fields = speculation_cfg.get("fields") or None
+        self._speculation_stats = SpeculationStats()
+        prompt_cfg = config.get("prompt", {})
+        self._reply = ReplyGenerator(
+            self._client, self._model, assembler=PromptAssembler(prompt_cfg.get("budgets"))
+        )
         self._empathy = EmpathyEngine(self._client, self._model)
         self._initiative = InitiativeGenerator(self._client, self._model)
-        self._safety = SafetyChecker(self._client, self._model)
+        safety_prefilter = None
+        if safety_cfg.get("prefilter", True):
+            safety_prefilter = SafetyPrefilter(
+                lexicon_path=safety_cfg.get("lexicon_path"),
+                max_pass_length=safety_cfg.get("max_pass_length", 200),
+            )
+        self._safety = SafetyChecker(self._client, self._model, prefilter=safety_prefilter)
+        self._fused = FusedAnalyzer(self._client, self._model, self._emotion)
         self._image_analyzer = ImageAnalyzer(self._client, "qwen-vl-plus") # 使用专门的 VL 模型处理图片
         self._profile_summarizer = ProfileSummarizer(self._client, self._model)
         self._subtext_decoder = SubtextDecoder(self._client, self._model)
         self._chat_reviewer = ChatReviewer(self._client, self._model)
         self._opportunity = OpportunityDetector()
+        # 增量检测: 画像与关系只在对方新消息足够多或本地信号突变时重新分析
+        change_cfg = config.get("change_detection", {})
+        self._changes = ChangeDetector(
+            thresholds={
+                "persona": int(change_cfg.get("persona_min_new_messages", 5)),
+                "relationship": int(change_cfg.get("relationship_min_new_messages", 3)),
+            },
+            opportunity_delta=float(change_cfg.get("opportunity_delta", 0.5)),
+            emotion_rule=self._emotion.guess,
+            opportunity=self._opportunity,
+            enabled=bool(change_cfg.get("enabled", True)),
+        )
         self._feedback_handler = FeedbackHandler(self._client, self._model)
         self._context_awareness = ContextAwareness()
 
+        # 滚动摘要: 滑出最近窗口的消息定期合并为摘要，分析时使用 "摘要 + 最近 N 条"
+        summary_cfg = config.get("summary", {})
+        self._summary_enabled = bool(summary_cfg.get("enabled", True))
+        self._window_turns = int(summary_cfg.get("keep_turns", 12))
+        self._summary_refresh_every = int(summary_cfg.get("refresh_every", 20))
+        self._summary_max_backlog = int(summary_cfg.get("max_backlog", 200))
+        self._history_token_budget = int(summary_cfg.get("history_token_budget", 1500))
+        self._summarizer = ConversationSummarizer(
+            self._client,
+            summary_cfg.get("model", "qwen-turbo"),
+            max_chars=summary_cfg.get("max_chars", 300),
+        )
+        self._summarizing = set()
+        self._background_tasks = set()
+
+        # 后台任务队列: 消息摄入、事实提取、画像/关系状态写入不阻塞本轮回复
+        jobs_cfg = config.get("jobs", {})
+        journal_file = jobs_cfg.get("journal_file", "jobs.sqlite")
+        self._jobs = JobQueue(
+            workers=int(jobs_cfg.get("workers", 2)),
+            journal_path=os.path.join(state_dir, journal_file) if journal_file else None,
+            max_attempts=int(jobs_cfg.get("max_attempts", 3)),
+            retry_backoff=float(jobs_cfg.get("retry_backoff", 1.0)),
+        )
+        self._jobs_drain_timeout = float(jobs_cfg.get("drain_timeout", 10))
+        self._jobs.register("ingest", self._job_ingest, merge=_merge_messages)
+        self._jobs.register("facts", self._job_facts, merge=_merge_fact_texts)
+        self._jobs.register("persona", self._job_persona)
+        self._jobs.register("relationship", self._job_state_update, merge=_merge_updates)
+        self._jobs.register("strategy", self._job_state_update, merge=_merge_updates)
+
+    @staticmethod
+    def _build_state_manager(state_cfg: Dict[str, Any], state_dir: str) -> StateManager:
+        """
+        根据配置选择状态存储后端
+
+        Args:
+            state_cfg: state 配置段
+            state_dir: 状态数据目录
+
+        Returns:
+            StateManager: json (单文件整体重写)、log (快照 + 追加日志) 或 sqlite (WAL 数据库)，
+                默认外层再包一层 CachedStateManager
+        """
+        backend = state_cfg.get("backend", "json")
+        if backend == "sqlite":
+            manager = SQLiteStateManager(state_dir, db_name=state_cfg.get("sqlite_file", "state.sqlite"))
+        elif backend == "log":
+            manager = LogStateManager(state_dir, compact_every=state_cfg.get("compact_every", 500))
+        else:
+            manager = StateManager(state_dir)
+
+        # 热状态缓存: 标量字段缓存在内存中，后台合并写回
+        cache_cfg = state_cfg.get("cache", {})
+        if cache_cfg.get("enabled", True):
+            manager = CachedStateManager(
+                manager,
+                max_entries=cache_cfg.get("max_entries", 256),
+                idle_ttl=cache_cfg.get("idle_ttl", 1800),
+                flush_interval=cache_cfg.get("flush_interval", 0.5),
+            )
+        return manager
+
+    async def search_history(self, session_id: str, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        在会话历史中查找实体 (片名、地名等)，只使用 BM25 索引，不计算 Embedding
+
+        Args:
+            session_id: 会话 ID
+            query: 查询文本
+            limit: 返回结果数量
+
+        Returns:
+            List[Dict]: 包含 text, speaker, timestamp, score 的结果列表
+        """
+        loop = asyncio.get_running_loop()
+        docs = await loop.run_in_executor(None, lambda: self._retrieval.lookup(query, n_results=limit, session_id=session_id))
+        return [
+            {
+                "text": d["text"],
+                "speaker": (d.get("metadata") or {}).get("speaker"),
+                "timestamp": (d.get("metadata") or {}).get("timestamp"),
+                "score": round(d["score"], 4),
+            }
+            for d in docs
+        ]
+
+    async def astart(self):
+        """
+        服务启动: 启动后台任务队列 (重放崩溃前未完成的任务) 并预热 Embedding
+
+        预热尽力而为，失败只打印警告，不影响服务启动；
+        构造 LoveAgent 不加载 Embedding 模型，固定检索语句的向量在这里预先计算。
+        """
+        await self._jobs.start()
+        try:
+            await asyncio.to_thread(
+                self._embeddings.warm_up, [FACT_QUERY_PROFILE, FACT_QUERY_PREFERENCES, FACT_QUERY_LESSONS]
+            )
+        except Exception as e:
+            print(f"Warning: Embedding warm-up failed: {e}")
+
+    def vector_store_report(self) -> List[Dict[str, Any]]:
+        """
+        获取各向量库的条数、分区数和首次查询耗时 (只读元数据，用于启动报告和运行指标)
+        """
+        return [vs.describe() for vs in (self._history_vs, self._interest_vs, self._fact_vs)]
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        获取运行指标 (缓存命中率等)
+        """
+        return {
+            "llm_cache": self._client.cache_stats(),
+            "safety_prefilter": self._safety.prefilter_stats(),
+            "embedding_cache": self._embeddings.stats(),
+            "state_cache": self._state_manager.stats() if isinstance(self._state_manager, CachedStateManager) else None,
+            "pipeline": self._stage_stats.snapshot(),
+            "jobs": self._jobs.stats(),
+            "change_detection": self._changes.stats(),
+            "speculation": self._speculation_stats.snapshot(),
+            "vector_stores": self.vector_store_report(),
+        }
+
     def get_radar(self, session_id: str) -> Dict[str, Any]:
         """
         获取指定会话的关系雷达数据
         """
-        state = self._state_manager.get_state(session_id)
+        state = self._state_manager.get_state(session_id, include_history=False)
         return state.get("radar", {})
 
     def get_profile(self, session_id: str) -> Dict[str, Any]:
         """
         获取指定会话的人物画像和事实标签
         """
-        state = self._state_manager.get_state(session_id)
+        state = self._state_manager.get_state(session_id, include_history=False)
         return {
             "persona": state.get("persona", {}),
             "user_facts": state.get("user_facts", [])
@@ -110,25 +386,85 @@ class LoveAgent:
         if new_message:
             # 如果有新消息，追加到状态管理器
             self._state_manager.append_message(session_id, new_message)
-            full_history = self._state_manager.get_history(session_id)
+            full_history = self._state_manager.get_history(session_id, limit=self._history_tail)
         elif incoming_messages:
             # 如果提供了完整列表，更新状态管理器
             self._state_manager.update_state(session_id, {"history": incoming_messages})
             full_history = incoming_messages
         else:
             # 否则直接获取存储的历史
-            full_history = self._state_manager.get_history(session_id)
+            full_history = self._state_manager.get_history(session_id, limit=self._history_tail)
         return full_history
 
     def _parse_input(self, messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
         """
-        提取最近的消息用于上下文分析 (默认最近12条)
+        提取最近的消息用于上下文分析 (默认最近12条，由 summary.keep_turns 配置)
         """
         window = []
-        for m in messages[-12:]:
+        for m in messages[-self._window_turns:]:
             window.append({"speaker": m.get("speaker"), "content": m.get("content", "")})
         return window
 
+    def _format_history(self, messages: List[Dict[str, Any]], summary: str = "") -> str:
+        """
+        构建分析用的历史文本: 滚动摘要 + 最近的对话 (总长度受 summary.history_token_budget 约束)
+        
+        Args:
+            messages: 按时间顺序排列的最近消息
+            summary: 较早对话的滚动摘要
+            
+        Returns:
+            str: 历史文本，预算不足时优先保留最近的对话
+        """
+        lines = []
+        for msg in messages:
+            speaker = "我" if msg.get("speaker") == "user" else "对方"
+            lines.append(f"{speaker}: {msg.get('content', '')}\n")
+        header = f"【较早对话摘要】{summary}\n" if summary else ""
+        budget = max(0, self._history_token_budget - estimate_tokens(header))
+        return header + "".join(fit_lines_from_end(lines, budget))
+
+    def _spawn(self, coro):
+        """
+        启动后台任务并持有引用 (避免任务被提前回收)
+        """
+        task = asyncio.ensure_future(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    async def _refresh_summary(self, session_id: str):
+        """
+        每滑出 summary.refresh_every 条消息，把它们增量合并进滚动摘要
+        
+        摘要覆盖到第 summary_covered 条消息为止；一次最多处理最近的 summary.max_backlog 条，
+        更早的积压 (如一次性上传的大量历史) 不再并入摘要，仍可通过向量检索召回。
+        """
+        if not self._summary_enabled or session_id in self._summarizing:
+            return
+        self._summarizing.add(session_id)
+        try:
+            loop = asyncio.get_running_loop()
+            state = await loop.run_in_executor(None, lambda: self._state_manager.get_state(session_id, include_history=False))
+            total = await loop.run_in_executor(None, self._state_manager.count_messages, session_id)
+            covered = int(state.get("summary_covered", 0))
+            pending_end = total - self._window_turns
+            if pending_end - covered < self._summary_refresh_every:
+                return
+            start = max(covered, pending_end - self._summary_max_backlog)
+            # 只读取日志末尾需要的部分
+            tail = await loop.run_in_executor(None, lambda: self._state_manager.get_history(session_id, limit=total - start))
+            pending = tail[:pending_end - start]
+            summary = await self._summarizer.asummarize(state.get("rolling_summary", ""), pending)
+            await loop.run_in_executor(None, self._state_manager.update_state, session_id, {
+                "rolling_summary": summary,
+                "summary_covered": pending_end,
+            })
+        except Exception as e:
+            print(f"滚动摘要更新失败: {e}")
+        finally:
+            self._summarizing.discard(session_id)
+
     def analyze_conversation(self, chat_json: Dict[str, Any]) -> Dict[str, Any]:
         """
         对对话进行基础分析：情绪、机会分值、话题
@@ -148,6 +484,26 @@ class LoveAgent:
         
         return {"emotion": emotion, "opportunity_score": opp_score, "topics": topics}
 
+    async def aanalyze_conversation(self, chat_json: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        对对话进行基础分析 (异步版本)，情绪与话题分析并发执行
+        """
+        window = self._parse_input(chat_json.get("messages", []))
+        latest_text = window[-1]["content"] if window else ""
+        opp_score = self._opportunity.score(latest_text)
+        
+        history_str = ""
+        for msg in window[:-1]:
+            speaker = "我" if msg["speaker"] == "user" else "对方"
+            history_str += f"{speaker}: {msg['content']}\n"
+            
+        emotion, topics = await asyncio.gather(
+            self._emotion.aanalyze(window),
+            self._topic.aanalyze(latest_text, history_str),
+        )
+        
+        return {"emotion": emotion, "opportunity_score": opp_score, "topics": topics}
+
     def search_knowledge(self, topics: List[str], query: str | None = None) -> Dict[str, Any]:
         """
         知识库检索（占位符，可扩展）
@@ -166,7 +522,7 @@ class LoveAgent:
         
         使用 Qwen-VL 模型分析图片内容，并结合当前关系阶段生成回复。
         """
-        current_state = self._state_manager.get_state(session_id)
+        current_state = self._state_manager.get_state(session_id, include_history=False)
         # 暂时传入空画像，或者从状态加载
         persona = {} 
         
@@ -178,17 +534,30 @@ class LoveAgent:
         )
         return reply
 
+    async def ahandle_image(self, session_id: str, image_url: str) -> str:
+        """
+        处理传入的图片消息 (异步版本)
+        """
+        loop = asyncio.get_running_loop()
+        current_state = await loop.run_in_executor(None, lambda: self._state_manager.get_state(session_id, include_history=False))
+        return await self._image_analyzer.aanalyze_and_reply(
+            image_url=image_url,
+            relationship_stage=current_state.get("relationship_stage", "陌生/破冰"),
+            intimacy_level=int(current_state.get("intimacy_level", 1)),
+            persona={}
+        )
+
     def generate_profile_summary(self, session_id: str) -> str:
         """
         生成用户画像摘要
         
         基于向量库中存储的事实标签，生成一段通过的文本描述。
         """
-        current_state = self._state_manager.get_state(session_id)
+        current_state = self._state_manager.get_state(session_id, include_history=False)
         
         # 检索所有相关事实 (限制最近20条以避免 Token 超限)
         # 注意: Chroma 不支持"获取全部"，所以这里使用通用词搜索
-        docs = self._fact_vs.similarity_search("用户", n_results=20)
+        docs = self._fact_vs.similarity_search(FACT_QUERY_PROFILE, n_results=20, session_id=session_id)
         user_facts = [d["text"] for d in docs]
         
         return self._profile_summarizer.summarize(
@@ -197,6 +566,21 @@ class LoveAgent:
             intimacy_level=int(current_state.get("intimacy_level", 1))
         )
 
+    async def agenerate_profile_summary(self, session_id: str) -> str:
+        """
+        生成用户画像摘要 (异步版本，状态读取与向量检索在线程中执行)
+        """
+        loop = asyncio.get_running_loop()
+        current_state = await loop.run_in_executor(None, lambda: self._state_manager.get_state(session_id, include_history=False))
+        docs = await loop.run_in_executor(
+            None, lambda: self._fact_vs.similarity_search(FACT_QUERY_PROFILE, n_results=20, session_id=session_id)
+        )
+        return await self._profile_summarizer.asummarize(
+            user_facts=[d["text"] for d in docs],
+            relationship_stage=current_state.get("relationship_stage", "陌生/破冰"),
+            intimacy_level=int(current_state.get("intimacy_level", 1))
+        )
+
     def generate_initiative(self, session_id: str) -> Dict[str, Any]:
         """
         主动生成搭讪/开场白
@@ -204,18 +588,17 @@ class LoveAgent:
         基于当前状态、记忆和环境上下文，生成合适的话题开启对话。
         """
         # 加载状态
-        current_state = self._state_manager.get_state(session_id)
+        current_state = self._state_manager.get_state(session_id, include_history=False)
         
         # 加载相关事实 (获取最近5条作为上下文)
         # 在真实系统中可以根据"兴趣"或"习惯"进行语义检索
-        docs = self._fact_vs.similarity_search("用户喜好 习惯", n_results=5)
+        docs = self._fact_vs.similarity_search(FACT_QUERY_PREFERENCES, n_results=5, session_id=session_id)
         user_facts = [d["text"] for d in docs]
         
         # 加载画像
         persona = current_state.get("persona", {})
         
         last_updated_ts = current_state.get("last_updated", 0)
-        import datetime
         last_chat_time = datetime.datetime.fromtimestamp(last_updated_ts).strftime("%Y-%m-%d %H:%M:%S")
         
         # 获取实时上下文 (天气、节日等)
@@ -231,21 +614,35 @@ class LoveAgent:
             environment_context=env_str
         )
 
+    async def agenerate_initiative(self, session_id: str) -> Dict[str, Any]:
+        """
+        主动生成搭讪/开场白 (异步版本，状态读取、向量检索与天气查询不阻塞事件循环)
+        """
+        loop = asyncio.get_running_loop()
+        current_state = await loop.run_in_executor(None, lambda: self._state_manager.get_state(session_id, include_history=False))
+        docs = await loop.run_in_executor(
+            None, lambda: self._fact_vs.similarity_search(FACT_QUERY_PREFERENCES, n_results=5, session_id=session_id)
+        )
+        last_chat_time = datetime.datetime.fromtimestamp(current_state.get("last_updated", 0)).strftime("%Y-%m-%d %H:%M:%S")
+        env_context = await self._context_awareness.aget_context()
+        return await self._initiative.agenerate(
+            relationship_stage=current_state.get("relationship_stage", "陌生/破冰"),
+            intimacy_level=int(current_state.get("intimacy_level", 1)),
+            persona=current_state.get("persona", {}),
+            user_facts=[d["text"] for d in docs],
+            last_chat_time=last_chat_time,
+            environment_context=env_context.get("context_str", "")
+        )
+
     async def handle_feedback(self, session_id: str, user_feedback: str, last_agent_reply: str) -> Dict[str, Any]:
         """
         处理用户对 Agent 回复的反馈
         """
-        current_state = self._state_manager.get_state(session_id)
+        loop = asyncio.get_running_loop()
+        current_state = await loop.run_in_executor(None, lambda: self._state_manager.get_state(session_id, include_history=False))
         
         # 运行反馈分析
-        loop = asyncio.get_running_loop()
-        analysis = await loop.run_in_executor(
-            None, 
-            self._feedback_handler.analyze,
-            user_feedback,
-            last_agent_reply,
-            current_state
-        )
+        analysis = await self._feedback_handler.aanalyze(user_feedback, last_agent_reply, current_state)
         
         # 如果需要调整策略，可以在这里更新状态
         return analysis
@@ -262,9 +659,7 @@ class LoveAgent:
             content = msg.get("content", "")
             history_str += f"{speaker}: {content}\n"
         
-        # 在执行器中运行以避免阻塞
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, self._chat_reviewer.review, history_str)
+        return await self._chat_reviewer.areview(history_str)
 
     async def process_uploaded_history(self, session_id: str, uploaded_messages: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
@@ -274,43 +669,43 @@ class LoveAgent:
         3. 存入向量数据库
         4. 基于最近上下文触发画像和雷达更新
         """
+        # 状态读写都是文件 / SQLite I/O，在线程中执行以免阻塞事件循环
+        loop = asyncio.get_running_loop()
+
         # 1. 合并 & 去重
-        new_messages = self._state_manager.merge_history(session_id, uploaded_messages)
+        new_messages = await loop.run_in_executor(None, self._state_manager.merge_history, session_id, uploaded_messages)
         
         if not new_messages:
             return {"status": "no_new_messages", "message": "没有新的消息需要处理。"}
             
-        # 获取完整的更新后的历史用于上下文分析
-        full_history = self._state_manager.get_history(session_id)
+        # 获取更新后的最近历史用于上下文分析
+        window_size = 20
+        full_history = await loop.run_in_executor(None, lambda: self._state_manager.get_history(session_id, limit=window_size))
+        total_count = await loop.run_in_executor(None, self._state_manager.count_messages, session_id)
         
         # 2. 存入向量库 (仅新消息)
-        loop = asyncio.get_running_loop()
         await loop.run_in_executor(None, self._ingestor.ingest, {"session_id": session_id, "messages": new_messages})
         
         # 3. 触发分析 (画像, 雷达, 事实)
         # 我们分析 *最新* 的上下文来更新 *当前* 状态。
         
         # 构建上下文 (最近20条)
-        window_size = 20
         recent_msgs = full_history[-window_size:]
         
         # 解析用于分析器
         parsed_window = [{"speaker": m.get("speaker"), "content": m.get("content", "")} for m in recent_msgs]
         
-        # 构建历史字符串用于关系/事实分析
-        history_str = ""
-        for msg in recent_msgs:
-            speaker = "我" if msg.get("speaker") == "user" else "对方"
-            history_str += f"{speaker}: {msg.get('content', '')}\n"
+        current_state = await loop.run_in_executor(None, lambda: self._state_manager.get_state(session_id, include_history=False))
+        
+        # 构建历史字符串用于关系/事实分析 (摘要 + 最近对话)
+        history_str = self._format_history(recent_msgs, current_state.get("rolling_summary", ""))
             
         latest_text = parsed_window[-1]["content"] if parsed_window else ""
-        
-        current_state = self._state_manager.get_state(session_id)
 
         # 定义并行任务
-        t_persona = loop.run_in_executor(None, self._persona.profile, parsed_window)
-        t_rel = loop.run_in_executor(None, self._relationship.update_state, history_str, current_state)
-        t_facts = loop.run_in_executor(None, self._fact_extractor.extract, latest_text, history_str)
+        t_persona = self._persona.aprofile(parsed_window)
+        t_rel = self._relationship.aupdate_state(history_str, current_state)
+        t_facts = self._fact_extractor.aextract(latest_text, history_str)
         
         # 并行运行
         persona_res, rel_update, new_facts = await asyncio.gather(t_persona, t_rel, t_facts)
@@ -323,35 +718,98 @@ class LoveAgent:
             updates.update(rel_update)
         
         if new_facts:
-            # 将事实存入向量库
-            import time
-            ids = [f"fact_{session_id}_{int(time.time())}_{i}" for i in range(len(new_facts))]
-            metadatas = [{"session_id": session_id, "timestamp": time.time(), "type": "user_fact"} for _ in new_facts]
-            self._fact_vs.add_texts(ids, new_facts, metadatas)
-            
-            # 更新状态中的事实列表
-            current_facts = current_state.get("user_facts", [])
-            for f in new_facts:
-                if f not in current_facts:
-                    current_facts.append(f)
-            updates["user_facts"] = current_facts
+            # 将事实存入向量库，并原子追加到状态中的事实列表
+            await loop.run_in_executor(None, self._store_facts, session_id, new_facts)
             
         if updates:
-            self._state_manager.update_state(session_id, updates)
+            await loop.run_in_executor(None, self._state_manager.update_state, session_id, updates)
+        if new_facts:
+            state = await loop.run_in_executor(None, lambda: self._state_manager.get_state(session_id, include_history=False))
+            updates["user_facts"] = state.get("user_facts", [])
+        
+        # 上传的历史滑出窗口后并入滚动摘要 (后台执行)
+        self._spawn(self._refresh_summary(session_id))
             
         return {
             "status": "success", 
             "new_messages_count": len(new_messages),
-            "total_messages_count": len(full_history),
+            "total_messages_count": total_count,
             "updates": updates
         }
 
-    async def generate_replies(self, chat_json: Dict[str, Any]) -> Dict[str, Any]:
+    def _store_facts(self, session_id: str, new_facts: List[str]):
+        """
+        写入新事实到向量库和状态 (原子追加，避免与其他写入互相覆盖)
+        """
+        ids = [f"fact_{session_id}_{int(time.time())}_{i}" for i in range(len(new_facts))]
+        metadatas = [{"session_id": session_id, "timestamp": time.time(), "type": "user_fact"} for _ in new_facts]
+        self._fact_vs.add_texts(ids, new_facts, metadatas, session_id=session_id)
+        self._state_manager.extend_list_field(session_id, "user_facts", new_facts)
+
+    async def _job_ingest(self, session_id: str, payload: Dict[str, Any]):
+        """
+        后台任务: 消息摄入向量库与 BM25 索引
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None, self._ingestor.ingest, {"session_id": session_id, "messages": payload.get("messages", [])}
+        )
+
+    async def _job_facts(self, session_id: str, payload: Dict[str, Any]):
+        """
+        后台任务: 从最新消息中提取用户事实并存储
+        """
+        texts = [t for t in payload.get("texts", []) if t]
+        if not texts:
+            return
+        new_facts = await self._fact_extractor.aextract("\n".join(texts), payload.get("history", ""))
+        if new_facts:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._store_facts, session_id, new_facts)
+
+    async def _job_persona(self, session_id: str, payload: Dict[str, Any]):
+        """
+        后台任务: 保存画像及增量检测标记；只给出对话窗口时先重新生成画像
+        """
+        persona = payload.get("persona")
+        if persona is None:
+            persona = await self._persona.aprofile(payload.get("window", []))
+        if persona:
+            updates = {"persona": persona}
+            if payload.get("mark"):
+                updates["persona_mark"] = payload["mark"]
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._state_manager.update_state, session_id, updates)
+
+    async def _job_state_update(self, session_id: str, payload: Dict[str, Any]):
+        """
+        后台任务: 写入分析产出的状态字段 (关系雷达、阶段、最近一次策略等)
+        """
+        updates = payload.get("updates") or {}
+        if updates:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._state_manager.update_state, session_id, updates)
+
+    async def generate_replies(
+        self,
+        chat_json: Dict[str, Any],
+        on_event: Optional[Callable[[str, Dict[str, Any]], Awaitable[None]]] = None,
+    ) -> Dict[str, Any]:
         """
         生成回复的核心流程
+        
+        Args:
+            chat_json: 请求数据
+            on_event: 可选的阶段事件回调 (事件名, 数据)，用于流式输出。各阶段完成即推送:
+                analysis (情绪/话题)、subtext、strategy、token (生成增量)、reply (通过安全检查的候选)；
+                subtext 与策略规划、回复生成并行，可能晚于 strategy 到达
         """
-        # 0. 解析历史 & 输入
-        full_history = self._resolve_history(chat_json)
+        async def _emit(event: str, data: Dict[str, Any]):
+            if on_event is not None:
+                await on_event(event, data)
+        loop = asyncio.get_running_loop()
+        # 0. 解析历史 & 输入 (状态读写在线程中执行)
+        full_history = await loop.run_in_executor(None, self._resolve_history, chat_json)
         
         # 准备任务上下文
         task_context = chat_json.copy()
@@ -362,264 +820,481 @@ class LoveAgent:
         window = self._parse_input(full_history)
         latest_text = window[-1]["content"] if window else ""
         
-        # 准备历史字符串
-        history_str = ""
-        for msg in window:
-            speaker = "我" if msg["speaker"] == "user" else "对方"
-            history_str += f"{speaker}: {msg['content']}\n"
-            
         session_id = task_context.get("session_id", "default")
-        loop = asyncio.get_running_loop()
+        current_state = await loop.run_in_executor(None, lambda: self._state_manager.get_state(session_id, include_history=False))
+        rolling_summary = current_state.get("rolling_summary", "")
+        
+        # 准备历史字符串 (滚动摘要 + 最近对话，受 token 预算约束)
+        history_str = self._format_history(window, rolling_summary)
+        # 滑出窗口的消息在后台并入摘要，供后续轮次使用
+        self._spawn(self._refresh_summary(session_id))
+        provided_stage = task_context.get("relationship_stage")
+
+        # 流水线按数据依赖组织为阶段图: 每个阶段在自己的依赖完成后立即启动，
+        # 例如策略规划不必等待消息摄入和事实提取，潜台词解读也不阻塞回复生成
+        graph = StageGraph(timeouts=self._stage_timeouts, stats=self._stage_stats)
+        deadline_ms = task_context.get("deadline_ms")
+        if deadline_ms is None:
+            deadline_ms = self._deadline_ms
+        # 规划/生成的上游阶段需提前结束，为回复生成留出时间；
+        # 必需阶段都带 fallback，超出预算时以已保存的状态或空结果继续，请求总耗时不超过预算
+        reserve = self._generation_reserve
+
+        provided_humor = task_context.get("humor_level")
+        humor_level = int(provided_humor) if provided_humor is not None else 3
+        user_gender = task_context.get("user_gender") or "未知"
+        target_gender = task_context.get("target_gender") or "未知"
+
+        # 合并分析模式: 情绪/话题/意图/画像/关系 用一次 LLM 调用完成 (按请求切换，便于 A/B)
+        use_fused = task_context.get("fused_analysis")
+        if use_fused is None:
+            use_fused = self._fused_default
+
+        # 画像 / 关系变化很慢: 对方新消息不足且本地信号平稳时直接沿用状态中保存的结果
+        total_messages = await loop.run_in_executor(None, self._state_manager.count_messages, session_id)
+        signals = self._changes.signals(window, total=total_messages)
+        analysis_mark = self._changes.mark(signals)
+        reuse_persona = bool(current_state.get("persona")) and not self._changes.should_rerun(
+            "persona", current_state.get("persona_mark"), signals
+        )
+        reuse_relationship = (
+            not provided_stage
+            and bool(current_state.get("radar"))
+            and not self._changes.should_rerun("relationship", current_state.get("relationship_mark"), signals)
+        )
+        reused = [name for name, flag in (("persona", reuse_persona), ("relationship", reuse_relationship)) if flag]
+
+        async def _fused():
+            if not use_fused:
+                return None
+            fused_tasks = ["emotion", "topics", "search_intent"]
+            if not reuse_persona:
+                fused_tasks.append("persona")
+            if not provided_stage and not reuse_relationship:
+                fused_tasks.append("relationship")
+            fused_history = self._format_history(window[:-1], rolling_summary)
+            try:
+                return await self._fused.aanalyze(window, fused_history, fused_tasks)
+            except Exception as e:
+                print(f"合并分析失败，回退到单项分析: {e}")
+                return None
+        graph.add("fused", _fused, fallback=lambda: None, reserve=reserve)
+
+        def _fused_part(fused: Optional[Dict[str, Any]], name: str):
+            # 合并结果中缺失的部分返回 None，由各阶段回退到单独调用
+            return (fused or {}).get(name)
 
-        # 1. 并行任务组 1: 分析 & 数据获取
-        # 任务: 摄入, 分析(情绪/话题), 事实提取, 意图, 画像, 检索(历史), 检索(事实), 关系更新
-        
-        # T1: 消息摄入 (存入向量库)
-        t_ingest = loop.run_in_executor(None, self._ingestor.ingest, task_context)
-        
-        # T2: 基础分析 (情绪, 机会, 话题)
-        t_analyze = loop.run_in_executor(None, self.analyze_conversation, task_context)
-        
-        # T3: 事实提取 (副作用：更新向量库和状态)
-        def _extract_and_store_facts():
-            new_facts = self._fact_extractor.extract(latest_text, history_str)
-            if new_facts:
-                import time
-                ids = [f"fact_{session_id}_{int(time.time())}_{i}" for i in range(len(new_facts))]
-                metadatas = [{"session_id": session_id, "timestamp": time.time(), "type": "user_fact"} for _ in new_facts]
-                self._fact_vs.add_texts(ids, new_facts, metadatas)
-                # 更新状态中的事实
-                current_facts = self._state_manager.get_state(session_id).get("user_facts", [])
-                for f in new_facts:
-                    if f not in current_facts:
-                        current_facts.append(f)
-                self._state_manager.update_state(session_id, {"user_facts": current_facts})
-            return new_facts
-        t_facts = loop.run_in_executor(None, _extract_and_store_facts)
-        
-        # T4: 搜索意图分析
-        t_intent = loop.run_in_executor(None, self._search_intent.analyze, latest_text, history_str)
-        
-        # T5: 画像更新
-        def _profile_and_store():
-            p = self._persona.profile(window)
+        # LLM 调用直接以协程运行在事件循环上；向量库与状态文件读写仍放在执行器中
+
+        # 本轮回复不依赖的副作用交给后台任务队列: 消息摄入、事实提取 (同一会话积压的任务会合并)
+        await self._jobs.enqueue("ingest", session_id, {"messages": full_history})
+        if latest_text:
+            await self._jobs.enqueue("facts", session_id, {"texts": [latest_text], "history": history_str})
+
+        # 基础分析 (情绪, 机会, 话题)
+        async def _analyze(fused):
+            emotion = _fused_part(fused, "emotion")
+            topics = _fused_part(fused, "topics")
+            if emotion is None or topics is None:
+                res = await self.aanalyze_conversation(task_context)
+            else:
+                res = {"emotion": emotion, "opportunity_score": self._opportunity.score(latest_text), "topics": topics}
+            await _emit("analysis", {"emotion": res.get("emotion"), "topics": res.get("topics", [])})
+            return res
+        graph.add(
+            "analyze", _analyze, deps=["fused"],
+            fallback=lambda: {"emotion": {}, "opportunity_score": self._opportunity.score(latest_text), "topics": []},
+            reserve=reserve,
+        )
+
+        # 搜索意图分析
+        async def _intent(fused):
+            intent = _fused_part(fused, "search_intent")
+            if intent is None:
+                intent = await self._search_intent.aanalyze(latest_text, history_str)
+            return intent
+        graph.add("intent", _intent, deps=["fused"], optional=True, default={}, reserve=reserve)
+
+        # 画像: 允许滞后一轮。已有画像时本轮直接沿用，刷新交给后台任务；新会话才同步生成
+        async def _profile_and_store(fused):
+            if reuse_persona:
+                return current_state["persona"]
+            p = _fused_part(fused, "persona")
+            if p is None:
+                stored = current_state.get("persona")
+                if stored:
+                    await self._jobs.enqueue("persona", session_id, {"window": window, "mark": analysis_mark})
+                    return stored
+                p = await self._persona.aprofile(window)
             if p:
-                self._state_manager.update_persona(session_id, p)
+                await self._jobs.enqueue("persona", session_id, {"persona": p, "mark": analysis_mark})
             return p
-        t_persona = loop.run_in_executor(None, _profile_and_store)
-        
-        # T6: 历史检索
-        t_retrieval_agg = loop.run_in_executor(None, self._retrieval.aggregate, latest_text)
-        
-        # T7: 事实检索
+        # 超时降级时沿用上次保存的画像
+        graph.add(
+            "persona", _profile_and_store, deps=["fused"], optional=True,
+            fallback=lambda: current_state.get("persona") or {}, reserve=reserve,
+        )
+
+        # 历史检索
+        async def _retrieve_history():
+            return await loop.run_in_executor(None, lambda: self._retrieval.aggregate(latest_text, session_id=session_id))
+        graph.add("retrieval", _retrieve_history, optional=True, default=[], reserve=reserve)
+
+        # 事实检索
         def _retrieve_facts():
             relevant = []
             # 检索经验教训
-            lesson_docs = self._fact_vs.similarity_search("用户偏好调整 策略教训", n_results=3, where={"type": "strategy_lesson"})
+            lesson_docs = self._fact_vs.similarity_search(FACT_QUERY_LESSONS, n_results=3, where={"type": "strategy_lesson"}, session_id=session_id)
             relevant.extend([d["text"] for d in lesson_docs])
             # Contextual
             if latest_text:
-                docs = self._fact_vs.similarity_search(latest_text, n_results=3)
+                docs = self._fact_vs.similarity_search(latest_text, n_results=3, session_id=session_id)
                 existing = set(relevant)
                 for d in docs:
                     if d["text"] not in existing:
                         relevant.append(d["text"])
             return relevant
-        t_fact_retrieval = loop.run_in_executor(None, _retrieve_facts)
-        
-        # T8: Relationship Update
-        current_state = self._state_manager.get_state(session_id)
-        provided_stage = task_context.get("relationship_stage")
-        
-        def _update_relationship():
+
+        async def _fact_retrieval():
+            return await loop.run_in_executor(None, _retrieve_facts)
+        graph.add("fact_retrieval", _fact_retrieval, optional=True, default=[], reserve=reserve)
+
+        # 关系更新 (使用开头读取的 current_state)；失败时由 relationship 阶段回退到完整分析
+        async def _update_relationship(fused):
+            if reuse_relationship:
+                return {k: current_state[k] for k in RELATIONSHIP_FIELDS if k in current_state}
             if not provided_stage:
-                return self._relationship.update_state(history_str, current_state)
+                rel = _fused_part(fused, "relationship")
+                if rel is None:
+                    rel = await self._relationship.aupdate_state(history_str, current_state)
+                return rel
             return {}
-        t_rel_update = loop.run_in_executor(None, _update_relationship)
- 
-        # Await Group 1
-        (
-            _, 
-            analysis_res, 
-            _, 
-            intent_res,
-            persona_res,
-            retrieval_ctx,
-            relevant_facts,
-            rel_update_info
-        ) = await asyncio.gather(
-            t_ingest, t_analyze, t_facts, t_intent, t_persona, t_retrieval_agg, t_fact_retrieval, t_rel_update
-        )
- 
-        # Update State
-        radar_data = {}
-        overall_analysis = ""
-        if rel_update_info:
-            current_state.update(rel_update_info)
-            radar_data = rel_update_info.get("radar", {})
-            overall_analysis = rel_update_info.get("overall_analysis", "")
-            loop.run_in_executor(None, self._state_manager.update_state, session_id, current_state)
- 
-        # Determine Relationship Parameters
-        relationship_stage = provided_stage or current_state.get("relationship_stage", "陌生/破冰")
-        provided_intimacy = task_context.get("intimacy_level")
-        intimacy_level = int(provided_intimacy) if provided_intimacy is not None else int(current_state.get("intimacy_level", 1))
-        
-        # Fallback for missing relationship info
-        if not all([relationship_stage, intimacy_level is not None]) or not radar_data:
-            # Quick sync fallback if update didn't work or wasn't called or radar missing
-            rel_analysis = await loop.run_in_executor(None, self._relationship.analyze, history_str)
-            relationship_stage = rel_analysis.get("relationship_stage", "陌生/破冰")
-            intimacy_level = rel_analysis.get("intimacy_level", 1)
-            radar_data = rel_analysis.get("radar", {})
-            overall_analysis = rel_analysis.get("overall_analysis", "")
-            # Also save this fallback analysis to state
-            self._state_manager.update_state(session_id, {
+        graph.add("rel_update", _update_relationship, deps=["fused"], optional=True, default={}, reserve=reserve)
+
+        def _stored_relationship():
+            provided_intimacy = task_context.get("intimacy_level")
+            return {
+                "relationship_stage": provided_stage or current_state.get("relationship_stage", "陌生/破冰"),
+                "intimacy_level": int(provided_intimacy) if provided_intimacy is not None else int(current_state.get("intimacy_level", 1)),
+                "radar": current_state.get("radar", {}),
+                "overall_analysis": current_state.get("overall_analysis", ""),
+            }
+
+        # 确定关系参数
+        async def _resolve_relationship(rel_update):
+            radar_data = {}
+            overall_analysis = ""
+            if rel_update:
+                current_state.update(rel_update)
+                radar_data = rel_update.get("radar", {})
+                overall_analysis = rel_update.get("overall_analysis", "")
+                if not reuse_relationship:
+                    # 只写关系分析产出的字段，不回写整个状态快照 (后台写入)
+                    updates = dict(rel_update)
+                    updates["relationship_mark"] = analysis_mark
+                    await self._jobs.enqueue("relationship", session_id, {"updates": updates})
+
+            relationship_stage = provided_stage or current_state.get("relationship_stage", "陌生/破冰")
+            provided_intimacy = task_context.get("intimacy_level")
+            intimacy_level = int(provided_intimacy) if provided_intimacy is not None else int(current_state.get("intimacy_level", 1))
+
+            needs_analysis = not all([relationship_stage, intimacy_level is not None]) or not radar_data
+            # 本阶段需在截止时间前 reserve 秒结束，剩余预算不足时不再发起完整分析
+            remaining = graph.remaining()
+            out_of_budget = remaining is not None and remaining <= reserve
+            if ("rel_update" in graph.degraded and not provided_stage) or (needs_analysis and out_of_budget):
+                # 关系分析未能按时完成: 沿用上次保存的雷达与分析，不再追加 LLM 调用
+                return _stored_relationship()
+            # Fallback for missing relationship info
+            if needs_analysis:
+                # Quick fallback if update didn't work or wasn't called or radar missing
+                rel_analysis = await self._relationship.aanalyze(history_str)
+                relationship_stage = rel_analysis.get("relationship_stage", "陌生/破冰")
+                intimacy_level = rel_analysis.get("intimacy_level", 1)
+                radar_data = rel_analysis.get("radar", {})
+                overall_analysis = rel_analysis.get("overall_analysis", "")
+                # Also save this fallback analysis to state (后台写入，与正常路径一致地记录增量检测标记)
+                await self._jobs.enqueue("relationship", session_id, {"updates": {
+                    "relationship_stage": relationship_stage,
+                    "intimacy_level": intimacy_level,
+                    "radar": radar_data,
+                    "overall_analysis": overall_analysis,
+                    "relationship_mark": analysis_mark,
+                }})
+            return {
                 "relationship_stage": relationship_stage,
                 "intimacy_level": intimacy_level,
                 "radar": radar_data,
-                "overall_analysis": overall_analysis
-            })
+                "overall_analysis": overall_analysis,
+            }
+        graph.add("relationship", _resolve_relationship, deps=["rel_update"], fallback=_stored_relationship, reserve=reserve)
 
-        # 2. Parallel Task Group 2: Subtext & Conditional Search & Planning
-        
-        # T9: Subtext Decoding
-        t_subtext = loop.run_in_executor(None, self._subtext_decoder.decode, latest_text, history_str, relationship_stage)
-        
-        # T10: Search Knowledge
-        async def _search_task():
-            if intent_res.get("need_search"):
-                query = intent_res.get("search_keywords")
-                return await loop.run_in_executor(None, self.search_knowledge, analysis_res.get("topics", []), query)
-            return self.search_knowledge(analysis_res.get("topics", []))
-        t_search = _search_task()
+        # 潜台词解读 (仅用于返回结果，回复生成不等待它)
+        async def _subtext_task(relationship):
+            res = await self._subtext_decoder.adecode(latest_text, history_str, relationship["relationship_stage"])
+            await _emit("subtext", {"subtext": res})
+            return res
+        graph.add("subtext", _subtext_task, deps=["relationship"], optional=True, default={})
 
-        # T11: Planning
-        provided_humor = task_context.get("humor_level")
-        humor_level = int(provided_humor) if provided_humor is not None else 3
-        current_appellation = task_context.get("current_appellation") or current_state.get("current_appellation", "你")
-        user_gender = task_context.get("user_gender") or "未知"
-        target_gender = task_context.get("target_gender") or "未知"
-        
-        t_planner = loop.run_in_executor(None, self._planner.plan, 
-            persona_res, 
-            analysis_res.get("emotion", {}),
-            relationship_stage,
-            intimacy_level,
-            humor_level,
-            current_appellation,
-            user_gender,
-            target_gender,
-            history_str
+        # 知识检索
+        async def _search_task(intent, analyze):
+            if intent.get("need_search"):
+                query = intent.get("search_keywords")
+                return await loop.run_in_executor(None, self.search_knowledge, analyze.get("topics", []), query)
+            return self.search_knowledge(analyze.get("topics", []))
+        graph.add("search", _search_task, deps=["intent", "analyze"], optional=True, default={}, reserve=reserve)
+
+        # 策略规划
+        async def _plan(persona, analyze, relationship):
+            planner_out = await self._planner.aplan(
+                persona,
+                analyze.get("emotion", {}),
+                relationship["relationship_stage"],
+                relationship["intimacy_level"],
+                humor_level,
+                task_context.get("current_appellation") or current_state.get("current_appellation", "你"),
+                user_gender,
+                target_gender,
+                history_str
+            )
+            await _emit("strategy", {"strategy": planner_out})
+            if planner_out:
+                # 保存本轮策略，供下一轮推测生成使用
+                await self._jobs.enqueue("strategy", session_id, {"updates": {"last_strategy": planner_out}})
+            return planner_out
+        # 超出预算时沿用上一轮的策略
+        graph.add(
+            "plan", _plan, deps=["persona", "analyze", "relationship"],
+            fallback=lambda: current_state.get("last_strategy") or {}, reserve=reserve,
         )
-        
-        subtext_res, kb_ctx, planner_out = await asyncio.gather(t_subtext, t_search, t_planner)
-        
-        # 3. Task Group 3: Post-Planning Processing
-        reply_strategy = planner_out.get("reply_strategy") or "温柔体贴"
-        language_style = planner_out.get("language_style") or "生活化、自然"
-        topic_management = planner_out.get("topic_management") or {}
-        boundary_assessment = planner_out.get("boundary_assessment") or {}
-        app_update = planner_out.get("appellation_update") or {}
-        action_guide = planner_out.get("action_guide") or {}
-        continuation_assessment = planner_out.get("continuation_assessment") or {}
-        
-        if app_update.get("should_update"):
-            current_appellation = app_update.get("new_appellation") or current_appellation
-            # Update appellation in state
-            self._state_manager.update_state(session_id, {"current_appellation": current_appellation})
-
-        # 4. Task Group 4: Generation & Safety
-        emotion_label = analysis_res.get("emotion", {}).get("emotion", "neutral")
-        
-        async def _generate_and_check_safety(is_retry=False, temp=None):
-            if emotion_label == "negative" and not is_retry:
-                # First attempt for negative emotion uses EmpathyEngine
-                import functools
-                aid = await loop.run_in_executor(None, functools.partial(
-                    self._empathy.generate,
-                    target_message=latest_text,
-                    current_emotion=emotion_label,
-                    emotion_score=int(analysis_res.get("emotion", {}).get("detail", {}).get("emotion_score", 4) or 4),
-                    relationship_stage=relationship_stage,
-                    persona=persona_res,
-                    user_facts=relevant_facts
-                ))
-                candidates = aid.get("replies") or []
-            elif emotion_label == "negative" and is_retry:
-                # Retry for negative uses EmpathyEngine with higher temp
-                import functools
-                aid = await loop.run_in_executor(None, functools.partial(
-                    self._empathy.generate,
-                    target_message=latest_text,
-                    current_emotion=emotion_label,
-                    emotion_score=int(analysis_res.get("emotion", {}).get("detail", {}).get("emotion_score", 4) or 4),
-                    relationship_stage=relationship_stage,
-                    persona=persona_res,
-                    user_facts=relevant_facts,
-                    temperature=temp or 0.9
-                ))
-                candidates = aid.get("replies") or []
-            else:
-                # Normal generation
-                kwargs = {
-                    "target_message": latest_text,
-                    "relationship_stage": relationship_stage,
-                    "intimacy_level": intimacy_level,
-                    "humor_level": humor_level,
-                    "reply_strategy": reply_strategy,
-                    "language_style": language_style,
-                    "current_appellation": current_appellation,
-                    "kb_context": kb_ctx,
-                    "retrieval_context": retrieval_ctx,
-                    "user_gender": user_gender,
-                    "target_gender": target_gender,
-                    "topic_management": topic_management,
-                    "boundary_assessment": boundary_assessment,
-                    "continuation_assessment": continuation_assessment,
-                    "action_guide": action_guide,
-                    "user_facts": relevant_facts,
-                }
-                if temp:
-                    kwargs["temperature"] = temp
-                    
-                import functools
-                gen = await loop.run_in_executor(None, functools.partial(self._reply.generate, **kwargs))
-                candidates = gen.get("replies") or []
-            
-            valid_replies = []
-            for r in candidates:
-                text = r.get("text") or ""
-                risk = await loop.run_in_executor(None, self._safety.check, text)
-                if not (risk.get("safety_risk") or risk.get("emergency_brake")):
-                    valid_replies.append(r)
-            return valid_replies
 
-        safe_replies = await _generate_and_check_safety()
-        
-        if not safe_replies:
-            # Retry with higher temperature / different engine
-            safe_replies = await _generate_and_check_safety(is_retry=True, temp=1.0)
+        def _reply_kwargs(plan, relationship, search, retrieval, fact_retrieval, current_appellation):
+            return {
+                "target_message": latest_text,
+                "relationship_stage": relationship["relationship_stage"],
+                "intimacy_level": relationship["intimacy_level"],
+                "humor_level": humor_level,
+                "reply_strategy": plan.get("reply_strategy") or "温柔体贴",
+                "language_style": plan.get("language_style") or "生活化、自然",
+                "current_appellation": current_appellation,
+                "kb_context": search,
+                "retrieval_context": retrieval,
+                "user_gender": user_gender,
+                "target_gender": target_gender,
+                "topic_management": plan.get("topic_management") or {},
+                "boundary_assessment": plan.get("boundary_assessment") or {},
+                "continuation_assessment": plan.get("continuation_assessment") or {},
+                "action_guide": plan.get("action_guide") or {},
+                "user_facts": fact_retrieval,
+            }
+
+        # 推测生成: 以上一轮保存的策略提前开始生成，与本轮策略规划并行；
+        # 规划结果与推测所用策略足够相似时直接采用推测的候选，否则丢弃重新生成
+        use_speculation = task_context.get("speculative")
+        if use_speculation is None:
+            use_speculation = self._speculation_default
+        last_strategy = current_state.get("last_strategy") or {}
+        spec_tasks: List[asyncio.Future] = []
+        # 推测生成的流式增量先缓存，确认采用后再推送
+        spec_stream = {"deltas": [], "live": False}
+
+        async def _speculate(analyze, relationship, search, retrieval, fact_retrieval):
+            if not use_speculation:
+                return None
+            if not last_strategy or analyze.get("emotion", {}).get("emotion") == "negative":
+                # 没有可用的上一轮策略，或本轮走共情引擎 (不使用策略)
+                self._speculation_stats.record_skip()
+                return None
+
+            async def _buffer_token(delta: str):
+                if spec_stream["live"]:
+                    await _emit("token", {"delta": delta})
+                else:
+                    spec_stream["deltas"].append(delta)
+
+            spec = {"started": time.perf_counter(), "finished": None}
+            kwargs = _reply_kwargs(
+                last_strategy, relationship, search, retrieval, fact_retrieval,
+                task_context.get("current_appellation") or current_state.get("current_appellation", "你"),
+            )
+
+            async def _run():
+                gen = await self._reply.agenerate(**kwargs, on_token=_buffer_token if on_event is not None else None)
+                spec["finished"] = time.perf_counter()
+                return gen
+            spec["task"] = asyncio.ensure_future(_run())
+            spec_tasks.append(spec["task"])
+            return spec
+        graph.add(
+            "speculate", _speculate, deps=["analyze", "relationship", "search", "retrieval", "fact_retrieval"],
+            optional=True, default=None,
+        )
+
+        # 规划完成后决定是否采用推测生成的结果，返回 (生成结果, 推测信息)
+        async def _resolve_speculation(spec, plan) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+            plan_ready = time.perf_counter()
+            similarity = strategy_similarity(last_strategy, plan, self._speculation_fields)
+            renamed = (plan.get("appellation_update") or {}).get("should_update")
+            info = {"hit": False, "similarity": round(similarity, 3), "saved_ms": 0.0}
+            if similarity >= self._speculation_threshold and not renamed:
+                try:
+                    while spec_stream["deltas"]:
+                        await _emit("token", {"delta": spec_stream["deltas"].pop(0)})
+                    spec_stream["live"] = True
+                    gen = await spec["task"]
+                except Exception as e:
+                    print(f"推测生成失败，重新生成: {e}")
+                else:
+                    # 不推测时生成会在规划完成后才开始，耗时相同
+                    duration = spec["finished"] - spec["started"]
+                    saved_ms = (plan_ready + duration - max(spec["finished"], plan_ready)) * 1000
+                    self._speculation_stats.record_hit(saved_ms)
+                    info.update(hit=True, saved_ms=round(saved_ms, 2))
+                    return gen, info
+            spec["task"].cancel()
+            wasted_until = spec["finished"] or time.perf_counter()
+            self._speculation_stats.record_miss((wasted_until - spec["started"]) * 1000)
+            return None, info
+
+        # 回复生成 & 安全检查
+        async def _generate(analyze, persona, relationship, search, retrieval, fact_retrieval, plan, speculate):
+            relationship_stage = relationship["relationship_stage"]
+            current_appellation = task_context.get("current_appellation") or current_state.get("current_appellation", "你")
+            app_update = plan.get("appellation_update") or {}
+
+            if app_update.get("should_update"):
+                current_appellation = app_update.get("new_appellation") or current_appellation
+                # 称呼变更随其他回复后的状态写入一起在后台落盘
+                await self._jobs.enqueue("strategy", session_id, {"updates": {"current_appellation": current_appellation}})
+
+            emotion_label = analyze.get("emotion", {}).get("emotion", "neutral")
+
+            speculative_gen, speculation_info = None, None
+            if speculate is not None:
+                speculative_gen, speculation_info = await _resolve_speculation(speculate, plan)
+
+            # 流式模式下最终生成使用模型的流式输出，逐段推送 token 事件
+            async def _on_token(delta: str):
+                await _emit("token", {"delta": delta})
+            on_token = _on_token if on_event is not None else None
+            # 最近一次回复生成的提示词用量 (共情引擎路径不产生)
+            prompt_usage: Dict[str, Any] = {}
+
+            async def _generate_and_check_safety(is_retry=False, temp=None, precomputed=None):
+                if emotion_label == "negative" and not is_retry:
+                    # First attempt for negative emotion uses EmpathyEngine
+                    aid = await self._empathy.agenerate(
+                        target_message=latest_text,
+                        current_emotion=emotion_label,
+                        emotion_score=int(analyze.get("emotion", {}).get("detail", {}).get("emotion_score", 4) or 4),
+                        relationship_stage=relationship_stage,
+                        persona=persona,
+                        user_facts=fact_retrieval,
+                        on_token=on_token
+                    )
+                    candidates = aid.get("replies") or []
+                elif emotion_label == "negative" and is_retry:
+                    # Retry for negative uses EmpathyEngine with higher temp
+                    aid = await self._empathy.agenerate(
+                        target_message=latest_text,
+                        current_emotion=emotion_label,
+                        emotion_score=int(analyze.get("emotion", {}).get("detail", {}).get("emotion_score", 4) or 4),
+                        relationship_stage=relationship_stage,
+                        persona=persona,
+                        user_facts=fact_retrieval,
+                        temperature=temp or 0.9,
+                        on_token=on_token
+                    )
+                    candidates = aid.get("replies") or []
+                else:
+                    # Normal generation (推测命中时直接使用推测的结果)
+                    if precomputed is not None:
+                        gen = precomputed
+                    else:
+                        kwargs = _reply_kwargs(plan, relationship, search, retrieval, fact_retrieval, current_appellation)
+                        if temp:
+                            kwargs["temperature"] = temp
+                        gen = await self._reply.agenerate(**kwargs, on_token=on_token)
+                    candidates = gen.get("replies") or []
+                    prompt_usage.clear()
+                    prompt_usage.update(gen.get("prompt_usage") or {})
+
+                # 所有候选一次性送检 (批量模式为一次调用，否则逐条并发)
+                verdicts = await self._safety.acheck_all(
+                    [r.get("text") or "" for r in candidates], batch=self._safety_batch
+                )
+                valid_replies = []
+                for r, risk in zip(candidates, verdicts):
+                    if not self._safety.is_blocked(risk):
+                        valid_replies.append(r)
+                        await _emit("reply", {"reply": r})
+                return valid_replies
+
+            safe_replies = await _generate_and_check_safety(precomputed=speculative_gen)
+
+            remaining = graph.remaining()
+            if not safe_replies and (remaining is None or remaining > 0):
+                # Retry with higher temperature / different engine (超出时间预算时不再重试)
+                await _emit("retry", {"reason": "no_safe_replies"})
+                safe_replies = await _generate_and_check_safety(is_retry=True, temp=1.0)
+            return {"replies": safe_replies, "prompt_usage": prompt_usage or None, "speculation": speculation_info}
+        graph.add(
+            "generate", _generate,
+            deps=["analyze", "persona", "relationship", "search", "retrieval", "fact_retrieval", "plan", "speculate"],
+            fallback=lambda: {"replies": [], "prompt_usage": None, "speculation": None},
+        )
+
+        try:
+            out = await graph.run(deadline=deadline_ms / 1000 if deadline_ms else None)
+        finally:
+            # 流水线失败时不再需要的推测生成
+            for task in spec_tasks:
+                if not task.done():
+                    task.cancel()
+        stale = []
+        for stage, field in STALE_FIELDS:
+            if stage in graph.degraded and field not in stale:
+                stale.append(field)
+        analysis_res = out["analyze"]
+        relationship = out["relationship"]
+        planner_out = out["plan"]
 
         ret = {
-            "replies": safe_replies[:6],
+            "replies": out["generate"]["replies"][:6],
             "analysis": {
                 "emotion": analysis_res.get("emotion"),
                 "topics": analysis_res.get("topics", []),
-                "persona": persona_res,
+                "persona": out["persona"],
                 "strategy": planner_out,
-                "kb_context": kb_ctx, 
-                "search_intent": intent_res, 
-                "facts": relevant_facts, 
-                "subtext": subtext_res, 
-                "radar": radar_data,
-                "overall_analysis": overall_analysis,
-                "action_guide": action_guide,
-                "continuation_assessment": continuation_assessment,
+                "kb_context": out["search"],
+                "search_intent": out["intent"],
+                "facts": out["fact_retrieval"],
+                "subtext": out["subtext"],
+                "radar": relationship["radar"],
+                "overall_analysis": relationship["overall_analysis"],
+                "action_guide": planner_out.get("action_guide") or {},
+                "continuation_assessment": planner_out.get("continuation_assessment") or {},
+                "analysis_mode": "fused" if use_fused else "separate",
+                "prompt_usage": out["generate"]["prompt_usage"],
+                "speculation": out["generate"]["speculation"],
+                "stale": stale,
+                "reused": reused,
+                "pipeline": {"critical_path": graph.critical_path(), "stages": graph.timings},
             },
         }
         return ret
 
+    async def aclose(self):
+        """
+        释放资源 (等待后台任务与任务队列，关闭 LLM 连接池，状态缓存落盘)
+        """
+        if self._background_tasks:
+            await asyncio.gather(*list(self._background_tasks), return_exceptions=True)
+        await self._jobs.close(self._jobs_drain_timeout)
+        await self._client.aclose()
+        if isinstance(self._state_manager, CachedStateManager):
+            self._state_manager.close()
+
 
 def load_config(path: str) -> Dict[str, Any]:
     with open(path, "r", encoding="utf-8") as f:
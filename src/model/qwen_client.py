@@ -1,7 +1,57 @@
-from typing import Any, Dict, List
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 import os
 import json
-from openai import OpenAI
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultAsyncHttpxClient
+from src.model.response_cache import ResponseCache
+
+
+def _parse_json_content(content: str) -> Dict[str, Any]:
+    """
+    解析模型返回的 JSON 文本
+
+    兼容 markdown 代码块包裹的输出，解析失败时尝试提取 { } 之间的内容。
+    """
+    try:
+        text = content
+        # 处理 markdown json 代码块
+        if text.startswith("```json"):
+            text = text.replace("```json", "").replace("```", "")
+        elif text.startswith("```"):
+            text = text.replace("```", "")
+        return json.loads(text)
+    except Exception as e:
+        print(f"JSON 解析错误: {e}, 内容: {content}")
+        # 降级策略: 尝试提取 { } 之间的内容
+        try:
+            start = content.find("{")
+            end = content.rfind("}")
+            if start != -1 and end != -1:
+                json_str = content[start : end + 1]
+                return json.loads(json_str)
+        except:
+            pass
+        return {}
+
+
+def _build_chat_kwargs(
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: float,
+    enable_search: bool = False,
+) -> Dict[str, Any]:
+    kwargs = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+    }
+    # 仅当模型支持时才添加 response_format (qwen-turbo/plus/max 通常支持)
+    # 但为了稳健性，我们主要依赖 Prompt 约束，并在此处进行解析尝试
+    # kwargs["response_format"] = {"type": "json_object"} 
+
+    if enable_search:
+        kwargs["extra_body"] = {"enable_search": True}
+    return kwargs
 
 
 class QwenClient:
@@ -10,22 +60,77 @@ class QwenClient:
     
     负责与通义千问 (Qwen) 模型 API 进行交互，提供文本和视觉对话能力。
     """
-    def __init__(self):
+    def __init__(self, cache: Optional[ResponseCache] = None):
         """
         初始化客户端
         
         从环境变量读取 API Key 和 Base URL。
+
+        Args:
+            cache: 可选的响应缓存，chat_json 指定 cache_ttl 时生效
         """
+        self._cache = cache
         api_key = os.getenv("DASHSCOPE_API_KEY")
         base_url = os.getenv("OPENAI_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
         self._client = OpenAI(api_key=api_key, base_url=base_url) if api_key else None
 
+    def _cache_lookup(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        enable_search: bool,
+        cache_ttl: Optional[float],
+    ) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        查询响应缓存
+
+        Returns:
+            (缓存键, 命中的响应)；不使用缓存时缓存键为 None
+        """
+        if self._cache is None or not cache_ttl or self._cache.should_bypass(temperature):
+            return None, None
+        key = ResponseCache.make_key(model, messages, temperature, enable_search)
+        return key, self._cache.get(key)
+
+    def _cache_store(self, key: Optional[str], result: Dict[str, Any], cache_ttl: Optional[float]):
+        # 解析失败的空结果不写入缓存，下次重新请求
+        if key is not None and result:
+            self._cache.set(key, result, cache_ttl)
+
+    async def _acache_lookup(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        enable_search: bool,
+        cache_ttl: Optional[float],
+    ) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        查询响应缓存 (异步版本，磁盘层不阻塞事件循环)
+        """
+        if self._cache is None or not cache_ttl or self._cache.should_bypass(temperature):
+            return None, None
+        key = ResponseCache.make_key(model, messages, temperature, enable_search)
+        return key, await self._cache.aget(key)
+
+    async def _acache_store(self, key: Optional[str], result: Dict[str, Any], cache_ttl: Optional[float]):
+        if key is not None and result:
+            await self._cache.aset(key, result, cache_ttl)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """
+        获取响应缓存的命中统计
+        """
+        return self._cache.stats() if self._cache is not None else {}
+
     def chat_json(
         self,
         model: str,
         messages: List[Dict[str, str]],
         temperature: float = 0.7,
         enable_search: bool = False,
+        cache_ttl: Optional[float] = None,
     ) -> Dict[str, Any]:
         """
         发送聊天请求并期望返回 JSON 格式数据
@@ -35,48 +140,24 @@ class QwenClient:
             messages: 消息列表
             temperature: 随机性参数
             enable_search: 是否启用网络搜索 (Qwen 插件能力)
+            cache_ttl: 响应缓存有效期 (秒)，为空则不使用缓存
             
         Returns:
             Dict: 解析后的 JSON 响应
         """
         if self._client is None:
             raise RuntimeError("DASHSCOPE_API_KEY 未设置，无法使用 LLM。")
+
+        key, cached = self._cache_lookup(model, messages, temperature, enable_search, cache_ttl)
+        if cached is not None:
+            return cached
             
-        kwargs = {
-            "model": model,
-            "messages": messages,
-            "temperature": temperature,
-        }
-        # 仅当模型支持时才添加 response_format (qwen-turbo/plus/max 通常支持)
-        # 但为了稳健性，我们主要依赖 Prompt 约束，并在此处进行解析尝试
-        # kwargs["response_format"] = {"type": "json_object"} 
-        
-        if enable_search:
-            kwargs["extra_body"] = {"enable_search": True}
-            
+        kwargs = _build_chat_kwargs(model, messages, temperature, enable_search)
         resp = self._client.chat.completions.create(**kwargs)
         # print(f"DEBUG LLM RAW RESP: {resp.choices[0].message.content}") 
-        try:
-            content = resp.choices[0].message.content
-            # 处理 markdown json 代码块
-            if content.startswith("```json"):
-                content = content.replace("```json", "").replace("```", "")
-            elif content.startswith("```"):
-                content = content.replace("```", "")
-            return json.loads(content)
-        except Exception as e:
-            print(f"JSON 解析错误: {e}, 内容: {resp.choices[0].message.content}")
-            # 降级策略: 尝试提取 { } 之间的内容
-            try:
-                content = resp.choices[0].message.content
-                start = content.find("{")
-                end = content.rfind("}")
-                if start != -1 and end != -1:
-                    json_str = content[start : end + 1]
-                    return json.loads(json_str)
-            except:
-                pass
-            return {}
+        result = _parse_json_content(resp.choices[0].message.content)
+        self._cache_store(key, result, cache_ttl)
+        return result
 
     def chat_vl(
         self,
@@ -101,11 +182,134 @@ class QwenClient:
         # if not model.endswith("vl-plus") and not model.endswith("vl-max"):
         #     model = "qwen-vl-plus"
             
-        kwargs = {
-            "model": model,
-            "messages": messages,
-            "temperature": temperature,
-        }
-        
+        kwargs = _build_chat_kwargs(model, messages, temperature)
         resp = self._client.chat.completions.create(**kwargs)
         return resp.choices[0].message.content
+
+
+class AsyncQwenClient(QwenClient):
+    """
+    异步 Qwen API 客户端
+
+    在同步接口之外提供 achat_json / achat_vl 协程，直接运行在事件循环上，
+    底层复用一个有上限的 keep-alive 连接池，避免每个分析任务占用一个线程。
+    同步接口 (chat_json / chat_vl) 依然可用，便于脚本和旧代码调用。
+    """
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        timeout: float = 60.0,
+        cache: Optional[ResponseCache] = None,
+    ):
+        """
+        初始化客户端
+
+        Args:
+            max_connections: 连接池最大连接数 (同时在途的 LLM 请求上限)
+            max_keepalive_connections: 保持存活的空闲连接数
+            timeout: 单次请求超时时间 (秒)
+            cache: 可选的响应缓存
+        """
+        super().__init__(cache)
+        api_key = os.getenv("DASHSCOPE_API_KEY")
+        base_url = os.getenv("OPENAI_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+        self._aclient = None
+        if api_key:
+            http_client = DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive_connections,
+                ),
+                timeout=timeout,
+            )
+            self._aclient = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+
+    async def achat_json(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        enable_search: bool = False,
+        cache_ttl: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """
+        异步发送聊天请求并期望返回 JSON 格式数据
+
+        参数与 chat_json 相同。
+        """
+        if self._aclient is None:
+            raise RuntimeError("DASHSCOPE_API_KEY 未设置，无法使用 LLM。")
+
+        key, cached = await self._acache_lookup(model, messages, temperature, enable_search, cache_ttl)
+        if cached is not None:
+            return cached
+
+        kwargs = _build_chat_kwargs(model, messages, temperature, enable_search)
+        resp = await self._aclient.chat.completions.create(**kwargs)
+        result = _parse_json_content(resp.choices[0].message.content)
+        await self._acache_store(key, result, cache_ttl)
+        return result
+
+    async def astream_json(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        enable_search: bool = False,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+    ) -> Dict[str, Any]:
+        """
+        以流式输出方式发送聊天请求，逐段回调增量文本，结束后返回解析的 JSON
+
+        Args:
+            model: 模型名称
+            messages: 消息列表
+            temperature: 随机性参数
+            enable_search: 是否启用网络搜索
+            on_delta: 每收到一段增量文本时调用的协程回调
+
+        Returns:
+            Dict: 完整输出解析后的 JSON
+        """
+        if self._aclient is None:
+            raise RuntimeError("DASHSCOPE_API_KEY 未设置，无法使用 LLM。")
+
+        kwargs = _build_chat_kwargs(model, messages, temperature, enable_search)
+        kwargs["stream"] = True
+        stream = await self._aclient.chat.completions.create(**kwargs)
+        parts = []
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                if on_delta is not None:
+                    await on_delta(delta)
+        return _parse_json_content("".join(parts))
+
+    async def achat_vl(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+    ) -> str:
+        """
+        异步发送视觉理解请求 (VL Model)
+
+        参数与 chat_vl 相同。
+        """
+        if self._aclient is None:
+            raise RuntimeError("DASHSCOPE_API_KEY 未设置，无法使用 LLM。")
+
+        kwargs = _build_chat_kwargs(model, messages, temperature)
+        resp = await self._aclient.chat.completions.create(**kwargs)
+        return resp.choices[0].message.content
+
+    async def aclose(self):
+        """
+        关闭底层连接池
+        """
+        if self._aclient is not None:
+            await self._aclient.close()
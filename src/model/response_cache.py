@@ -0,0 +1,225 @@
+from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    """
+    LLM 响应缓存
+
+    以 (model, messages, temperature, enable_search) 的内容哈希为键缓存 chat_json 的解析结果，
+    避免对相同 Prompt 重复请求模型。分为两级：
+    1. 内存 LRU (进程内，容量有限)
+    2. 可选的 SQLite 磁盘层 (跨进程 / 重启后仍可命中)
+
+    每个调用点可指定自己的 TTL；温度高于阈值的生成类调用直接绕过缓存。
+    异步调用方应使用 aget / aset，磁盘层的读写在线程中执行，不阻塞事件循环。
+    磁盘层在打开时以及每 PURGE_EVERY 次写入后清理过期条目，并按 max_disk_entries 淘汰最早过期的条目。
+    """
+    # 每写入多少次清理一次磁盘层
+    PURGE_EVERY = 256
+
+    def __init__(
+        self,
+        max_entries: int = 2048,
+        sqlite_path: Optional[str] = None,
+        bypass_temperature: float = 0.7,
+        max_disk_entries: int = 50000,
+    ):
+        """
+        初始化缓存
+
+        Args:
+            max_entries: 内存层最大条目数
+            sqlite_path: SQLite 缓存文件路径，为空则只使用内存层
+            bypass_temperature: 温度大于等于该值的请求不读写缓存
+            max_disk_entries: 磁盘层最大条目数
+        """
+        self._max_entries = max_entries
+        self._max_disk_entries = max_disk_entries
+        self._bypass_temperature = bypass_temperature
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._writes_since_purge = 0
+        self._stats = {"memory_hits": 0, "sqlite_hits": 0, "misses": 0, "bypassed": 0, "writes": 0, "purged": 0}
+
+        self._db = None
+        if sqlite_path:
+            db_dir = os.path.dirname(sqlite_path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir)
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_expires ON llm_cache (expires_at)")
+            self._db.commit()
+            self.purge()
+
+    @staticmethod
+    def make_key(
+        model: str,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        enable_search: bool,
+    ) -> str:
+        """
+        计算请求的内容哈希
+        """
+        payload = json.dumps(
+            {"model": model, "messages": messages, "temperature": temperature, "enable_search": enable_search},
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def should_bypass(self, temperature: float) -> bool:
+        """
+        判断请求是否应绕过缓存 (高温度生成类调用)
+        """
+        if temperature >= self._bypass_temperature:
+            with self._lock:
+                self._stats["bypassed"] += 1
+            return True
+        return False
+
+    def _get_memory(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return json.loads(value)
+                del self._memory[key]
+        return None
+
+    def _get_disk(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        row = None
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+        with self._lock:
+            if row and row[1] > now:
+                self._remember(key, row[0], row[1])
+                self._stats["sqlite_hits"] += 1
+                return json.loads(row[0])
+            self._stats["misses"] += 1
+        return None
+
+    def _set_disk(self, key: str, serialized: str, expires_at: float):
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, serialized, expires_at),
+            )
+            self._db.commit()
+            self._writes_since_purge += 1
+            due = self._writes_since_purge >= self.PURGE_EVERY
+        if due:
+            self.purge()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        读取缓存，未命中或已过期返回 None
+
+        返回值每次都从 JSON 重新解码，调用方可以放心修改。
+        """
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None:
+            return value
+        return self._get_disk(key, now)
+
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        读取缓存 (异步版本，磁盘层在线程中查询)
+        """
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None:
+            return value
+        if self._db is None:
+            return self._get_disk(key, now)
+        return await asyncio.to_thread(self._get_disk, key, now)
+
+    def _prepare(self, key: str, value: Dict[str, Any], ttl: float) -> tuple:
+        serialized = json.dumps(value, ensure_ascii=False)
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._remember(key, serialized, expires_at)
+            self._stats["writes"] += 1
+        return serialized, expires_at
+
+    def set(self, key: str, value: Dict[str, Any], ttl: float):
+        """
+        写入缓存
+
+        Args:
+            key: make_key 生成的键
+            value: 解析后的 JSON 响应
+            ttl: 有效期 (秒)
+        """
+        serialized, expires_at = self._prepare(key, value, ttl)
+        self._set_disk(key, serialized, expires_at)
+
+    async def aset(self, key: str, value: Dict[str, Any], ttl: float):
+        """
+        写入缓存 (异步版本): 内存层立即可见，磁盘层在线程中写入
+        """
+        serialized, expires_at = self._prepare(key, value, ttl)
+        if self._db is not None:
+            await asyncio.to_thread(self._set_disk, key, serialized, expires_at)
+
+    def purge(self) -> int:
+        """
+        清理磁盘层: 删除过期条目，超出 max_disk_entries 时淘汰最早过期的条目
+
+        Returns:
+            int: 删除的条目数
+        """
+        if self._db is None:
+            return 0
+        with self._db_lock:
+            removed = self._db.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),)).rowcount
+            count = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            overflow = count - self._max_disk_entries
+            if overflow > 0:
+                removed += self._db.execute(
+                    "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY expires_at LIMIT ?)",
+                    (overflow,),
+                ).rowcount
+            self._db.commit()
+            self._writes_since_purge = 0
+        with self._lock:
+            self._stats["purged"] += removed
+        return removed
+
+    def _remember(self, key: str, serialized: str, expires_at: float):
+        self._memory[key] = (serialized, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取命中统计
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_size"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["sqlite_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["sqlite_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
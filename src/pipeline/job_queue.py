@@ -0,0 +1,398 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+JobHandler = Callable[[str, Dict[str, Any]], Awaitable[Any]]
+JobMerger = Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]
+
+
+def replace_payload(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    默认合并策略: 新任务覆盖尚未执行的旧任务
+    """
+    return new
+
+
+class _Job:
+    def __init__(self, job_id: int, kind: str, session_id: str, payload: Dict[str, Any], enqueued_at: float, attempts: int = 0):
+        self.id = job_id
+        self.kind = kind
+        self.session_id = session_id
+        self.payload = payload
+        self.enqueued_at = enqueued_at
+        self.attempts = attempts
+        # 重试退避: 此时间之前不执行
+        self.not_before = 0.0
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return (self.kind, self.session_id)
+
+
+class _Journal:
+    """
+    任务日志 (SQLite)：入队时写入，完成后删除，进程重启时重放未完成的任务
+
+    写操作只在内存中登记 (同一任务只保留最后一次写入)，由 flush 在一个事务内批量落盘；
+    任务 ID 在内存中分配，因此登记写入不需要等待数据库。
+    """
+    def __init__(self, path: str):
+        persist_dir = os.path.dirname(path)
+        if persist_dir and not os.path.exists(persist_dir):
+            os.makedirs(persist_dir)
+        self._lock = threading.Lock()
+        # 串行化 flush，保证批次按登记顺序落盘
+        self._flush_lock = threading.Lock()
+        # 任务 ID -> 待写入的行 (None 表示删除)
+        self._buffer: Dict[int, Optional[tuple]] = {}
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                enqueued_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._db.commit()
+        self.last_id = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM jobs").fetchone()[0]
+
+    def save(self, job: _Job):
+        """
+        登记任务的写入 (新增或更新)
+        """
+        row = (job.id, job.kind, job.session_id, json.dumps(job.payload, ensure_ascii=False, default=str), job.enqueued_at, job.attempts)
+        with self._lock:
+            self._buffer[job.id] = row
+
+    def delete(self, job_id: int):
+        """
+        登记任务的删除
+        """
+        with self._lock:
+            self._buffer[job_id] = None
+
+    def flush(self):
+        """
+        把登记的写入在一个事务内落盘 (阻塞，应在线程中调用)
+        """
+        with self._flush_lock:
+            with self._lock:
+                buffer, self._buffer = self._buffer, {}
+            if not buffer:
+                return
+            upserts = [row for row in buffer.values() if row is not None]
+            deletes = [(job_id,) for job_id, row in buffer.items() if row is None]
+            with self._db:
+                if upserts:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO jobs (id, kind, session_id, payload, enqueued_at, attempts) VALUES (?, ?, ?, ?, ?, ?)",
+                        upserts,
+                    )
+                if deletes:
+                    self._db.executemany("DELETE FROM jobs WHERE id = ?", deletes)
+
+    def pending(self) -> List[_Job]:
+        with self._flush_lock:
+            rows = self._db.execute(
+                "SELECT id, kind, session_id, payload, enqueued_at, attempts FROM jobs ORDER BY id"
+            ).fetchall()
+        jobs = []
+        for job_id, kind, session_id, payload, enqueued_at, attempts in rows:
+            try:
+                jobs.append(_Job(job_id, kind, session_id, json.loads(payload), enqueued_at, attempts))
+            except json.JSONDecodeError:
+                self.delete(job_id)
+        return jobs
+
+    def close(self):
+        self.flush()
+        with self._flush_lock:
+            self._db.close()
+
+
+class JobQueue:
+    """
+    进程内后台任务队列
+
+    用于把不影响本轮回复的副作用 (消息摄入、事实提取、画像/关系状态写入)
+    移出请求的关键路径：
+    1. 同一 (任务类型, 会话) 尚未开始执行的任务会被合并，由注册时的 merge 函数决定如何合并
+    2. 同一 (任务类型, 会话) 同时只有一个任务在执行，保证同一会话的写入顺序
+    3. 配置了日志文件时，未完成的任务持久化在 SQLite 中，进程崩溃重启后重放
+       (日志写入在事件循环上只做登记，由后台任务在线程中批量落盘，不阻塞请求)
+    4. 失败的任务按 max_attempts 重试，第 n 次重试前等待 retry_backoff * 2^(n-1) 秒 (不超过 max_backoff)
+    """
+    def __init__(
+        self,
+        workers: int = 2,
+        journal_path: Optional[str] = None,
+        max_attempts: int = 3,
+        retry_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        """
+        Args:
+            workers: 并发执行的 worker 数
+            journal_path: SQLite 日志文件路径，为空则只保存在内存中
+            max_attempts: 单个任务的最大尝试次数
+            retry_backoff: 首次重试前的等待时间 (秒)，之后每次翻倍
+            max_backoff: 单次重试等待时间上限 (秒)
+        """
+        self._workers = max(1, workers)
+        self._journal = _Journal(journal_path) if journal_path else None
+        self._max_attempts = max(1, max_attempts)
+        self._retry_backoff = max(0.0, retry_backoff)
+        self._max_backoff = max_backoff
+        self._handlers: Dict[str, Tuple[JobHandler, JobMerger]] = {}
+        # 按入队顺序排列的待执行任务，键为 (kind, session_id)
+        self._pending: Dict[Tuple[str, str], _Job] = {}
+        self._running: Set[Tuple[str, str]] = set()
+        self._worker_tasks: List[asyncio.Task] = []
+        self._journal_task: Optional[asyncio.Task] = None
+        self._journal_dirty: Optional[asyncio.Event] = None
+        self._wakeup: Optional[asyncio.Condition] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._next_id = self._journal.last_id if self._journal is not None else 0
+        self._started = False
+        self._closed = False
+        self._stats = {
+            "enqueued": 0, "coalesced": 0, "processed": 0, "failed": 0, "retried": 0, "recovered": 0,
+            "total_lag_ms": 0.0, "max_lag_ms": 0.0,
+        }
+
+    def register(self, kind: str, handler: JobHandler, merge: JobMerger = replace_payload):
+        """
+        注册任务类型
+
+        Args:
+            kind: 任务类型
+            handler: 异步处理函数 (session_id, payload)
+            merge: 合并函数 (旧 payload, 新 payload) -> payload，payload 需可 JSON 序列化
+        """
+        self._handlers[kind] = (handler, merge)
+
+    async def start(self):
+        """
+        启动 worker 并重放任务日志中未完成的任务 (可重复调用)
+
+        服务启动时调用，使崩溃前遗留的任务不必等到下一次入队才执行；
+        未显式启动时在第一次入队时启动。
+        """
+        if self._started:
+            return
+        self._started = True
+        self._wakeup = asyncio.Condition()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        if self._journal is not None:
+            self._journal_dirty = asyncio.Event()
+            for job in await asyncio.to_thread(self._journal.pending):
+                self._stats["recovered"] += 1
+                self._add(job)
+            self._journal_task = asyncio.ensure_future(self._journal_writer())
+        self._worker_tasks = [asyncio.ensure_future(self._worker()) for _ in range(self._workers)]
+
+    def _journal_save(self, job: _Job):
+        if self._journal is not None:
+            self._journal.save(job)
+            self._journal_dirty.set()
+
+    def _journal_delete(self, job_id: int):
+        if self._journal is not None:
+            self._journal.delete(job_id)
+            self._journal_dirty.set()
+
+    async def _journal_writer(self):
+        """
+        后台落盘任务日志: 每次唤醒把期间登记的写入合并为一个事务，在线程中执行
+        """
+        while True:
+            await self._journal_dirty.wait()
+            self._journal_dirty.clear()
+            try:
+                await asyncio.to_thread(self._journal.flush)
+            except Exception as e:
+                print(f"Warning: Job journal flush failed: {e}")
+
+    def _add(self, job: _Job):
+        """
+        加入待执行队列；已有同键任务时按先后顺序合并为一个任务 (保留较早的入队时间)
+        """
+        existing = self._pending.get(job.key)
+        if existing is None:
+            self._pending[job.key] = job
+            self._idle.clear()
+            return
+        _, merge = self._handlers.get(job.kind, (None, replace_payload))
+        older, newer = (existing, job) if existing.enqueued_at <= job.enqueued_at else (job, existing)
+        existing.payload = merge(older.payload, newer.payload)
+        existing.enqueued_at = older.enqueued_at
+        # 合并进来的新任务不绕过失败任务的退避
+        existing.not_before = max(existing.not_before, job.not_before)
+        self._journal_save(existing)
+        self._journal_delete(job.id)
+
+    async def enqueue(self, kind: str, session_id: str, payload: Dict[str, Any]):
+        """
+        提交任务 (不等待执行)
+
+        Args:
+            kind: 任务类型 (需已注册)
+            session_id: 会话 ID
+            payload: 任务参数
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"未注册的任务类型: {kind}")
+        if self._closed:
+            raise RuntimeError("任务队列已关闭")
+        await self.start()
+        now = time.time()
+        key = (kind, session_id)
+        self._stats["enqueued"] += 1
+        existing = self._pending.get(key)
+        if existing is not None:
+            _, merge = self._handlers[kind]
+            existing.payload = merge(existing.payload, payload)
+            self._stats["coalesced"] += 1
+            self._journal_save(existing)
+            return
+        self._next_id += 1
+        job = _Job(self._next_id, kind, session_id, payload, now)
+        self._journal_save(job)
+        self._add(job)
+        async with self._wakeup:
+            self._wakeup.notify()
+
+    def _take(self) -> Tuple[Optional[_Job], Optional[float]]:
+        """
+        取出一个可执行的任务
+
+        Returns:
+            (任务, None)；没有可执行任务时为 (None, 最近一个退避中的任务还需等待的秒数，没有则为 None)
+        """
+        now = time.time()
+        wait = None
+        for key, job in self._pending.items():
+            if key in self._running:
+                continue
+            if job.not_before > now:
+                delay = job.not_before - now
+                wait = delay if wait is None else min(wait, delay)
+                continue
+            del self._pending[key]
+            self._running.add(key)
+            return job, None
+        return None, wait
+
+    async def _worker(self):
+        while True:
+            async with self._wakeup:
+                job, wait = self._take()
+                while job is None:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    job, wait = self._take()
+            lag_ms = (time.time() - job.enqueued_at) * 1000
+            self._stats["total_lag_ms"] += lag_ms
+            self._stats["max_lag_ms"] = max(self._stats["max_lag_ms"], lag_ms)
+            handler, _ = self._handlers.get(job.kind, (None, None))
+            try:
+                if handler is None:
+                    raise ValueError(f"未注册的任务类型: {job.kind}")
+                await handler(job.session_id, job.payload)
+                self._stats["processed"] += 1
+                self._journal_delete(job.id)
+            except asyncio.CancelledError:
+                # 关闭时中断的任务保留在日志中，下次启动重放
+                raise
+            except Exception as e:
+                job.attempts += 1
+                if handler is not None and job.attempts < self._max_attempts:
+                    delay = min(self._max_backoff, self._retry_backoff * 2 ** (job.attempts - 1))
+                    print(f"后台任务 {job.kind}({job.session_id}) 失败，{delay:.1f} 秒后重试: {e}")
+                    job.not_before = time.time() + delay
+                    self._stats["retried"] += 1
+                    self._journal_save(job)
+                    self._add(job)
+                else:
+                    print(f"后台任务 {job.kind}({job.session_id}) 失败，放弃: {e}")
+                    self._stats["failed"] += 1
+                    self._journal_delete(job.id)
+            finally:
+                self._running.discard(job.key)
+                async with self._wakeup:
+                    # 同键任务可能在执行期间入队，唤醒其他 worker
+                    self._wakeup.notify_all()
+                if not self._pending and not self._running:
+                    self._idle.set()
+
+    async def join(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待队列清空
+
+        Returns:
+            bool: 是否在超时前清空
+        """
+        if not self._worker_tasks:
+            return True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def close(self, drain_timeout: float = 10.0):
+        """
+        关闭队列: 先在 drain_timeout 内尽量执行完剩余任务，再停止 worker
+        (未完成的任务保留在日志中)
+        """
+        self._closed = True
+        await self.join(drain_timeout)
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        if self._journal_task is not None:
+            self._journal_task.cancel()
+            await asyncio.gather(self._journal_task, return_exceptions=True)
+            self._journal_task = None
+        if self._journal is not None:
+            await asyncio.to_thread(self._journal.close)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取队列深度、延迟与处理计数
+
+        Returns:
+            Dict: depth (待执行), running (执行中), lag_ms (最早待执行任务已等待的时间),
+                avg_lag_ms / max_lag_ms (任务从入队到开始执行的平均/最大等待时间) 及各计数
+        """
+        now = time.time()
+        oldest = min((job.enqueued_at for job in self._pending.values()), default=None)
+        started = self._stats["processed"] + self._stats["failed"] + self._stats["retried"]
+        return {
+            "depth": len(self._pending),
+            "running": len(self._running),
+            "lag_ms": round((now - oldest) * 1000, 2) if oldest is not None else 0.0,
+            "avg_lag_ms": round(self._stats["total_lag_ms"] / started, 2) if started else 0.0,
+            "max_lag_ms": round(self._stats["max_lag_ms"], 2),
+            "enqueued": self._stats["enqueued"],
+            "coalesced": self._stats["coalesced"],
+            "processed": self._stats["processed"],
+            "retried": self._stats["retried"],
+            "failed": self._stats["failed"],
+            "recovered": self._stats["recovered"],
+        }
@@ -0,0 +1,258 @@
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+import asyncio
+import threading
+import time
+
+
+class StageFailed(Exception):
+    """
+    必需阶段执行失败 (异常，或没有 fallback 时超时)
+    """
+    def __init__(self, stage: str, cause: BaseException):
+        super().__init__(f"阶段 {stage} 执行失败: {cause!r}")
+        self.stage = stage
+        self.cause = cause
+
+
+class Stage:
+    """
+    流水线中的一个命名阶段
+
+    func 以关键字参数接收各依赖阶段的输出 (参数名即阶段名)，返回本阶段输出。
+    """
+    def __init__(
+        self,
+        name: str,
+        func: Callable[..., Awaitable[Any]],
+        deps: Iterable[str] = (),
+        timeout: Optional[float] = None,
+        optional: bool = False,
+        default: Any = None,
+        fallback: Optional[Callable[[], Any]] = None,
+        reserve: float = 0.0,
+    ):
+        """
+        Args:
+            name: 阶段名 (同时是下游阶段接收其输出的参数名)
+            func: 异步函数
+            deps: 依赖的阶段名
+            timeout: 超时时间 (秒)，为空则不限
+            optional: 可选阶段失败、超时或超出请求截止时间时降级输出，不中断流水线
+            default: 可选阶段降级时的输出
+            fallback: 降级时调用以获取输出 (如读取上次保存的状态)，优先于 default；
+                必需阶段设置后同样受请求截止时间约束，超时时以其输出继续 (异常仍中断流水线)
+            reserve: 阶段需在请求截止时间前多少秒结束 (为下游阶段预留时间)
+        """
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.timeout = timeout
+        self.optional = optional
+        self.default = default
+        self.fallback = fallback
+        self.reserve = reserve
+
+
+class StageGraph:
+    """
+    按依赖关系调度的异步流水线 (有向无环图)
+
+    每个阶段在其依赖全部完成后立即启动，关键路径只由真实的数据依赖决定。
+    依赖必须先于使用它的阶段注册，因此图天然无环。
+
+    设置请求截止时间后，可选阶段与设置了 fallback 的必需阶段最多运行到 "截止时间 - reserve"，
+    来不及完成的阶段被取消并以降级值继续，
+    降级的阶段名记录在 degraded 中。
+    没有 fallback 的必需阶段只受各自 timeout 限制。
+    """
+    def __init__(self, timeouts: Optional[Dict[str, float]] = None, stats: Optional["StageStats"] = None):
+        """
+        Args:
+            timeouts: 阶段名 -> 超时时间 (秒)，覆盖注册时的 timeout
+            stats: 阶段耗时统计，为空则不统计
+        """
+        self._stages: Dict[str, Stage] = {}
+        self._timeouts = dict(timeouts or {})
+        self._stats = stats
+        self._deadline: Optional[float] = None
+        self.timings: Dict[str, Dict[str, Any]] = {}
+        self.errors: Dict[str, str] = {}
+        self.degraded: List[str] = []
+
+    def add(
+        self,
+        name: str,
+        func: Callable[..., Awaitable[Any]],
+        deps: Iterable[str] = (),
+        timeout: Optional[float] = None,
+        optional: bool = False,
+        default: Any = None,
+        fallback: Optional[Callable[[], Any]] = None,
+        reserve: float = 0.0,
+    ) -> "StageGraph":
+        """
+        注册阶段，参数同 Stage
+
+        Raises:
+            ValueError: 阶段重名或依赖未注册
+        """
+        if name in self._stages:
+            raise ValueError(f"阶段重复注册: {name}")
+        deps = list(deps)
+        missing = [d for d in deps if d not in self._stages]
+        if missing:
+            raise ValueError(f"阶段 {name} 的依赖未注册: {missing}")
+        if name in self._timeouts:
+            timeout = self._timeouts[name]
+        self._stages[name] = Stage(name, func, deps, timeout, optional, default, fallback, reserve)
+        return self
+
+    def remaining(self) -> Optional[float]:
+        """
+        距请求截止时间的剩余秒数，未设置截止时间时返回 None
+        """
+        if self._deadline is None:
+            return None
+        return self._deadline - time.perf_counter()
+
+    @staticmethod
+    def _bounded(stage: Stage) -> bool:
+        # 可选阶段总有降级值；必需阶段只有提供 fallback 时才能在截止时间被取消
+        return stage.optional or stage.fallback is not None
+
+    def _time_limit(self, stage: Stage) -> Optional[float]:
+        limits = []
+        if stage.timeout:
+            limits.append(stage.timeout)
+        if self._deadline is not None and self._bounded(stage):
+            limits.append(self._deadline - stage.reserve - time.perf_counter())
+        return min(limits) if limits else None
+
+    def _degrade(self, stage: Stage, status: str, cause: Optional[BaseException] = None) -> Any:
+        self.degraded.append(stage.name)
+        print(f"阶段 {stage.name} {status}，使用降级值: {cause!r}")
+        if stage.fallback is not None:
+            return stage.fallback()
+        return stage.default
+
+    async def _run_stage(self, stage: Stage, tasks: Dict[str, "asyncio.Future"], t0: float) -> Any:
+        inputs = {}
+        if stage.deps:
+            outputs = await asyncio.gather(*(tasks[d] for d in stage.deps))
+            inputs = dict(zip(stage.deps, outputs))
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            limit = self._time_limit(stage)
+            if limit is not None and limit <= 0:
+                status = "skipped"
+                return self._degrade(stage, status)
+            coro = stage.func(**inputs)
+            if limit is None:
+                return await coro
+            return await asyncio.wait_for(coro, limit)
+        except Exception as e:
+            status = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+            self.errors[stage.name] = repr(e)
+            if stage.optional or (status == "timeout" and self._bounded(stage)):
+                return self._degrade(stage, status, e)
+            raise StageFailed(stage.name, e) from e
+        finally:
+            end = time.perf_counter()
+            self.timings[stage.name] = {
+                "start_ms": round((start - t0) * 1000, 2),
+                "duration_ms": round((end - start) * 1000, 2),
+                "status": status,
+            }
+            if self._stats is not None:
+                self._stats.record(stage.name, (end - start) * 1000, status)
+
+    async def run(self, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """
+        执行所有阶段
+
+        Args:
+            deadline: 请求时间预算 (秒)，约束可选阶段与设置了 fallback 的必需阶段，为空则不限
+
+        Returns:
+            Dict[str, Any]: 阶段名 -> 输出
+
+        Raises:
+            StageFailed: 必需阶段失败时抛出，其余未完成的阶段会被取消
+        """
+        t0 = time.perf_counter()
+        self._deadline = t0 + deadline if deadline else None
+        self.timings = {}
+        self.errors = {}
+        self.degraded = []
+        tasks: Dict[str, asyncio.Future] = {}
+        for name, stage in self._stages.items():
+            tasks[name] = asyncio.ensure_future(self._run_stage(stage, tasks, t0))
+        try:
+            outputs = await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            # 等待取消完成，避免遗留未回收的任务
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return dict(zip(tasks.keys(), outputs))
+
+    def critical_path(self) -> List[str]:
+        """
+        根据最近一次运行的耗时，回溯决定总耗时的阶段链 (从最先到最后)
+        """
+        if not self.timings:
+            return []
+
+        def _end(name: str) -> float:
+            t = self.timings.get(name) or {}
+            return t.get("start_ms", 0.0) + t.get("duration_ms", 0.0)
+
+        path = []
+        current = max(self.timings, key=_end)
+        while current:
+            path.append(current)
+            deps = [d for d in self._stages[current].deps if d in self.timings]
+            current = max(deps, key=_end) if deps else None
+        path.reverse()
+        return path
+
+
+class StageStats:
+    """
+    阶段耗时统计 (跨请求累计，线程安全)
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, float]] = {}
+
+    def record(self, name: str, duration_ms: float, status: str):
+        with self._lock:
+            s = self._stages.setdefault(name, {"runs": 0, "total_ms": 0.0, "max_ms": 0.0, "errors": 0, "timeouts": 0, "skipped": 0})
+            s["runs"] += 1
+            s["total_ms"] += duration_ms
+            s["max_ms"] = max(s["max_ms"], duration_ms)
+            if status == "error":
+                s["errors"] += 1
+            elif status == "timeout":
+                s["timeouts"] += 1
+            elif status == "skipped":
+                s["skipped"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        获取各阶段的运行次数、平均/最大耗时与失败/超时/跳过次数
+        """
+        with self._lock:
+            return {
+                name: {
+                    "runs": int(s["runs"]),
+                    "avg_ms": round(s["total_ms"] / s["runs"], 2) if s["runs"] else 0.0,
+                    "max_ms": round(s["max_ms"], 2),
+                    "errors": int(s["errors"]),
+                    "timeouts": int(s["timeouts"]),
+                    "skipped": int(s["skipped"]),
+                }
+                for name, s in self._stages.items()
+            }
@@ -0,0 +1,149 @@
+from typing import Any, Callable, Dict, List, Optional
+import hashlib
+import json
+import threading
+import time
+from src.progress.opportunity_detector import OpportunityDetector
+
+
+class ChangeDetector:
+    """
+    会话增量检测
+
+    画像和关系阶段变化很慢，不必每条消息都重新分析。
+    每次分析后在状态中记录一个标记 (窗口哈希、当时会话的消息总数、本地信号)，
+    下次请求时只有满足以下任一条件才重新分析，否则沿用状态中保存的结果：
+    1. 没有标记 (首次分析)
+    2. 自上次分析以来对方新发的消息数达到阈值
+    3. 本地信号剧烈变化: 机会评分变化超过 opportunity_delta，或情绪规则判断改变
+    窗口与上次完全相同 (如重复请求) 时总是沿用。
+    """
+    def __init__(
+        self,
+        thresholds: Optional[Dict[str, int]] = None,
+        opportunity_delta: float = 0.5,
+        emotion_rule: Optional[Callable[[str], str]] = None,
+        opportunity: Optional[OpportunityDetector] = None,
+        enabled: bool = True,
+    ):
+        """
+        Args:
+            thresholds: 分析类型 -> 触发重新分析所需的对方新消息数
+            opportunity_delta: 机会评分变化阈值
+            emotion_rule: 基于规则的情绪预判函数 (文本 -> 标签)
+            opportunity: 机会探测器
+            enabled: 关闭时总是重新分析
+        """
+        self._thresholds = dict(thresholds or {})
+        self._opportunity_delta = opportunity_delta
+        self._emotion_rule = emotion_rule
+        self._opportunity = opportunity or OpportunityDetector()
+        self._enabled = enabled
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def _fingerprint(text: str) -> str:
+        return hashlib.sha1((text or "").encode("utf-8")).hexdigest()[:16]
+
+    def signals(self, window: List[Dict[str, Any]], total: Optional[int] = None) -> Dict[str, Any]:
+        """
+        计算当前窗口的本地信号 (不调用模型)
+
+        Args:
+            window: 最近的对话窗口 (以会话最新一条消息结尾)
+            total: 会话的消息总数，用于给窗口内的消息编号；为空时无法计算新增消息数
+
+        Returns:
+            Dict: window_hash, total, target_positions (对方消息在会话中的序号), opportunity, emotion
+        """
+        offset = (total if total is not None else len(window)) - len(window)
+        targets = [(offset + i, m.get("content", "")) for i, m in enumerate(window) if m.get("speaker") != "user"]
+        latest_target = targets[-1][1] if targets else ""
+        # 计入消息总数: 窗口被相同内容填满时，新消息也会改变哈希
+        window_key = json.dumps(
+            [total, [[m.get("speaker"), m.get("content", "")] for m in window]], ensure_ascii=False
+        )
+        return {
+            "window_hash": self._fingerprint(window_key),
+            "total": total,
+            "target_positions": [pos for pos, _ in targets],
+            "opportunity": self._opportunity.score(latest_target),
+            "emotion": self._emotion_rule(latest_target) if self._emotion_rule else None,
+        }
+
+    @staticmethod
+    def mark(signals: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        生成分析完成后写入状态的标记
+        """
+        return {
+            "window_hash": signals.get("window_hash"),
+            "total": signals.get("total"),
+            "opportunity": signals.get("opportunity"),
+            "emotion": signals.get("emotion"),
+            "at": time.time(),
+        }
+
+    @staticmethod
+    def new_target_messages(mark: Dict[str, Any], signals: Dict[str, Any]) -> int:
+        """
+        自标记以来对方新发的消息数
+
+        按消息序号计数，重复发送的相同内容 (如 "哈哈") 也逐条计入；
+        标记或当前缺少消息总数、或历史被整体替换变短时，按窗口内全部对方消息计。
+        """
+        positions = signals.get("target_positions") or []
+        marked, total = mark.get("total"), signals.get("total")
+        if marked is None or total is None or marked > total:
+            return len(positions)
+        return sum(1 for pos in positions if pos >= marked)
+
+    def should_rerun(self, kind: str, mark: Optional[Dict[str, Any]], signals: Dict[str, Any]) -> bool:
+        """
+        判断某项慢变分析是否需要重新执行
+
+        Args:
+            kind: 分析类型 (persona / relationship)
+            mark: 状态中保存的上次分析标记
+            signals: 当前窗口的本地信号
+
+        Returns:
+            bool: True 需要重新分析，False 沿用保存的结果
+        """
+        reason = self._decide(kind, mark, signals)
+        rerun = reason is not None
+        with self._lock:
+            s = self._stats.setdefault(kind, {"reran": 0, "reused": 0})
+            if rerun:
+                s["reran"] += 1
+                s[reason] = s.get(reason, 0) + 1
+            else:
+                s["reused"] += 1
+        return rerun
+
+    def _decide(self, kind: str, mark: Optional[Dict[str, Any]], signals: Dict[str, Any]) -> Optional[str]:
+        """
+        返回重新分析的原因，沿用时返回 None
+        """
+        if not self._enabled:
+            return "disabled"
+        if not mark:
+            return "no_mark"
+        if mark.get("window_hash") == signals.get("window_hash"):
+            return None
+        if self.new_target_messages(mark, signals) >= self._thresholds.get(kind, 1):
+            return "new_messages"
+        prev_opportunity = mark.get("opportunity")
+        if prev_opportunity is not None and abs(signals.get("opportunity", 0) - prev_opportunity) >= self._opportunity_delta:
+            return "opportunity_shift"
+        if signals.get("emotion") is not None and mark.get("emotion") != signals.get("emotion"):
+            return "emotion_shift"
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取各分析类型重新分析 / 沿用的次数 (重新分析按原因细分)
+        """
+        with self._lock:
+            return {kind: dict(s) for kind, s in self._stats.items()}
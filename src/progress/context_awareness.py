@@ -1,4 +1,5 @@
 from typing import Dict, Any, Optional
+import asyncio
 import datetime
 import requests
 import json
@@ -59,6 +60,14 @@ class ContextAwareness:
             "timestamp": now.timestamp()
         }
 
+    async def aget_context(self, city: str = "北京") -> Dict[str, Any]:
+        """
+        获取当前环境上下文 (异步版本)
+
+        天气查询是阻塞的 HTTP 请求，放到线程中执行以免阻塞事件循环。
+        """
+        return await asyncio.to_thread(self.get_context, city)
+
     def _check_holiday(self, date_obj: datetime.datetime) -> Optional[str]:
         month = date_obj.month
         day = date_obj.day
@@ -24,3 +24,9 @@ class FeedbackHandler:
             Dict: 分析结果
         """
         return {"analysis": "Feedback analysis not available."}
+
+    async def aanalyze(self, user_feedback: str, last_agent_reply: str, current_state: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        分析用户反馈 (异步版本)
+        """
+        return self.analyze(user_feedback, last_agent_reply, current_state)
@@ -0,0 +1,242 @@
+from typing import Dict, Any, List, Optional
+import json
+import os
+import time
+from src.progress.state_manager import StateManager
+
+
+class LogStateManager(StateManager):
+    """
+    追加日志式状态管理
+
+    与 StateManager 接口一致，但把聊天历史与标量状态分开存储：
+    1. history_<id>.jsonl: 聊天历史，每行一条消息，新消息只做追加写
+    2. state_<id>.json: 除历史以外的小体积状态快照
+
+    追加一条消息的开销与历史长度无关；读取最近 N 条时只从文件末尾倒序读取。
+    日志在消息乱序写入、整体替换或追加次数达到阈值时进行压缩 (排序并重写)。
+    """
+    def __init__(self, persist_dir: str, compact_every: int = 500):
+        """
+        Args:
+            persist_dir: 数据目录
+            compact_every: 追加多少条消息后压缩一次日志
+        """
+        super().__init__(persist_dir)
+        self._compact_every = compact_every
+
+    def _get_log_path(self, session_id: str) -> str:
+        return os.path.join(self._persist_dir, f"history_{session_id}.jsonl")
+
+    # --- 快照 ---
+
+    def _load_snapshot(self, session_id: str) -> Dict[str, Any]:
+        path = self._get_path(session_id)
+        snapshot = None
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    content = f.read().strip()
+                    if content:
+                        snapshot = json.loads(content)
+            except (json.JSONDecodeError, OSError) as e:
+                print(f"Warning: Failed to load state from {path}: {e}. Returning default state.")
+        if snapshot is None:
+            snapshot = self._default_state()
+            snapshot.pop("history", None)
+            snapshot["history_count"] = 0
+            return snapshot
+        if "history" in snapshot:
+            # 旧版单文件格式: 把内嵌的历史迁移到日志
+            with self._session_lock(session_id):
+                history = snapshot.pop("history") or []
+                self._rewrite_log(session_id, history)
+                snapshot["history_count"] = len(history)
+                snapshot["appends_since_compaction"] = 0
+                self._save_snapshot(session_id, snapshot)
+        return snapshot
+
+    def _save_snapshot(self, session_id: str, snapshot: Dict[str, Any]):
+        self._atomic_write_json(self._get_path(session_id), snapshot)
+
+    # --- 日志 ---
+
+    def _read_log(self, session_id: str) -> List[Dict[str, Any]]:
+        path = self._get_log_path(session_id)
+        messages = []
+        if not os.path.exists(path):
+            return messages
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    messages.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # 写入中断留下的残行，压缩时会被清理
+                    continue
+        return messages
+
+    def _read_log_tail(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        从日志末尾倒序读取最近 limit 条消息
+        """
+        path = self._get_log_path(session_id)
+        if not os.path.exists(path):
+            return []
+        block_size = 8192
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            data = b""
+            # 多读一行以防第一行不完整
+            while pos > 0 and data.count(b"\n") <= limit:
+                read_size = min(block_size, pos)
+                pos -= read_size
+                f.seek(pos)
+                data = f.read(read_size) + data
+        lines = data.split(b"\n")
+        if pos > 0:
+            lines = lines[1:]
+        messages = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                messages.append(json.loads(line.decode("utf-8")))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+        return messages[-limit:]
+
+    def _append_log(self, session_id: str, messages: List[Dict[str, Any]]):
+        with open(self._get_log_path(session_id), "a", encoding="utf-8") as f:
+            for msg in messages:
+                f.write(json.dumps(msg, ensure_ascii=False) + "\n")
+
+    def _rewrite_log(self, session_id: str, messages: List[Dict[str, Any]]):
+        path = self._get_log_path(session_id)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for msg in messages:
+                f.write(json.dumps(msg, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, path)
+
+    def compact(self, session_id: str):
+        """
+        压缩日志: 丢弃残行、按时间戳排序并重写
+        
+        Args:
+            session_id: 会话 ID
+        """
+        with self._session_lock(session_id):
+            messages = self._read_log(session_id)
+            messages.sort(key=lambda x: x.get("timestamp", 0))
+            self._rewrite_log(session_id, messages)
+            snapshot = self._load_snapshot(session_id)
+            snapshot["history_count"] = len(messages)
+            snapshot["appends_since_compaction"] = 0
+            self._save_snapshot(session_id, snapshot)
+
+    def _after_append(self, session_id: str, snapshot: Dict[str, Any], added: int):
+        snapshot["history_count"] = snapshot.get("history_count", 0) + added
+        snapshot["appends_since_compaction"] = snapshot.get("appends_since_compaction", 0) + added
+        snapshot["last_updated"] = time.time()
+        self._save_snapshot(session_id, snapshot)
+        if snapshot["appends_since_compaction"] >= self._compact_every:
+            self.compact(session_id)
+
+    # --- StateManager 接口 ---
+
+    def _load_state(self, session_id: str) -> Dict[str, Any]:
+        state = self._load_snapshot(session_id)
+        state["history"] = self._read_log(session_id)
+        return state
+
+    def get_state(self, session_id: str, include_history: bool = True) -> Dict[str, Any]:
+        """
+        获取指定会话的状态 (include_history=False 时只读快照，不读日志)
+        """
+        if not include_history:
+            return self._load_snapshot(session_id)
+        return self._load_state(session_id)
+
+    def update_state(self, session_id: str, new_state: Dict[str, Any]):
+        """
+        更新状态
+        
+        包含 history 字段时视为整体替换历史，重写日志；其余字段只写快照。
+        """
+        fields = dict(new_state)
+        history = fields.pop("history", None)
+        with self._session_lock(session_id):
+            snapshot = self._load_snapshot(session_id)
+            snapshot.update(fields)
+            if history is not None:
+                self._rewrite_log(session_id, history)
+                snapshot["history_count"] = len(history)
+                snapshot["appends_since_compaction"] = 0
+            snapshot["last_updated"] = time.time()
+            self._save_snapshot(session_id, snapshot)
+
+    def get_history(self, session_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        获取聊天历史 (指定 limit 时只读取日志末尾)
+        """
+        if limit:
+            return self._read_log_tail(session_id, limit)
+        return self._read_log(session_id)
+
+    def count_messages(self, session_id: str) -> int:
+        """
+        获取聊天历史的消息条数 (读快照中的计数，不读日志)
+        """
+        return self._load_snapshot(session_id).get("history_count", 0)
+
+    def append_message(self, session_id: str, message: Dict[str, Any]):
+        """
+        追加一条消息到历史 (只追加一行日志，不重写历史)
+        """
+        # 确保有时间戳
+        if "timestamp" not in message or not message["timestamp"]:
+            message["timestamp"] = int(time.time())
+        with self._session_lock(session_id):
+            snapshot = self._load_snapshot(session_id)
+            self._append_log(session_id, [message])
+            self._after_append(session_id, snapshot, 1)
+
+    def merge_history(self, session_id: str, new_messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        合并新的消息到现有历史 (去重并排序)
+
+        新消息都不早于现有最后一条时直接追加；否则追加后立即压缩以恢复时间顺序。
+        """
+        with self._session_lock(session_id):
+            snapshot = self._load_snapshot(session_id)
+            current_history = self._read_log(session_id)
+            existing_signatures = set()
+            for msg in current_history:
+                existing_signatures.add((msg.get("timestamp", 0), msg.get("speaker", ""), msg.get("content", "").strip()))
+
+            added_messages = []
+            for msg in new_messages:
+                ts = msg.get("timestamp")
+                if ts is None:
+                    # 如果缺少时间戳，使用当前时间
+                    ts = int(time.time())
+                    msg["timestamp"] = ts
+                sig = (ts, msg.get("speaker", ""), msg.get("content", "").strip())
+                if sig not in existing_signatures:
+                    added_messages.append(msg)
+                    existing_signatures.add(sig)
+
+            if added_messages:
+                added_messages.sort(key=lambda x: x.get("timestamp", 0))
+                last_ts = current_history[-1].get("timestamp", 0) if current_history else None
+                self._append_log(session_id, added_messages)
+                self._after_append(session_id, snapshot, len(added_messages))
+                if last_ts is not None and added_messages[0].get("timestamp", 0) < last_ts:
+                    self.compact(session_id)
+
+            return added_messages
@@ -0,0 +1,286 @@
+from typing import Dict, Any, List, Optional
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from src.progress.state_manager import StateManager
+
+
+class SQLiteStateManager(StateManager):
+    """
+    SQLite 状态管理
+
+    与 StateManager 接口一致，所有会话共用一个 WAL 模式的数据库文件：
+    1. session_state: 每个状态字段一行 (值为 JSON)，更新单个字段不会重写其他字段
+    2. messages: 聊天历史，按 (session_id, timestamp) 建索引，
+       以 (session_id, seq) 为唯一键 (seq 为会话内递增的消息序号)；
+       与 JSON 后端一致，只有 merge_history (历史导入) 按 (timestamp, speaker, content) 去重，
+       append_message 会保留同一秒内重复发送的相同消息
+
+    每个写操作都是一个事务，字段级写入天然不会覆盖其他字段。
+    """
+    def __init__(self, persist_dir: str, db_name: str = "state.sqlite"):
+        """
+        Args:
+            persist_dir: 数据目录
+            db_name: 数据库文件名
+        """
+        super().__init__(persist_dir)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(persist_dir, db_name), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS session_state (
+                session_id TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (session_id, key)
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                timestamp INTEGER NOT NULL,
+                speaker TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                UNIQUE (session_id, seq)
+            );
+            """
+        )
+        self._migrate_messages()
+        self._db.executescript(
+            """
+            CREATE INDEX IF NOT EXISTS idx_messages_session_ts ON messages (session_id, timestamp, id);
+            CREATE INDEX IF NOT EXISTS idx_messages_signature ON messages (session_id, timestamp, speaker, content_hash);
+            """
+        )
+        self._db.commit()
+
+    def _migrate_messages(self):
+        """
+        旧版消息表以 (session_id, timestamp, speaker, content_hash) 为唯一键，
+        会丢弃同一秒内重复发送的相同消息；迁移为以 (session_id, seq) 为唯一键 (seq 沿用原 id)
+        """
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(messages)").fetchall()]
+        if "seq" in columns:
+            return
+        with self._db:
+            self._db.execute("DROP INDEX IF EXISTS idx_messages_session_ts")
+            self._db.execute("ALTER TABLE messages RENAME TO messages_old")
+            self._db.execute(
+                """
+                CREATE TABLE messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    timestamp INTEGER NOT NULL,
+                    speaker TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    UNIQUE (session_id, seq)
+                )
+                """
+            )
+            self._db.execute(
+                "INSERT INTO messages (id, session_id, seq, timestamp, speaker, content_hash, payload) "
+                "SELECT id, session_id, id, timestamp, speaker, content_hash, payload FROM messages_old"
+            )
+            self._db.execute("DROP TABLE messages_old")
+
+    @staticmethod
+    def _content_hash(content: str) -> str:
+        return hashlib.sha1((content or "").strip().encode("utf-8")).hexdigest()
+
+    def _insert_messages(self, session_id: str, messages: List[Dict[str, Any]], dedupe: bool = False) -> List[Dict[str, Any]]:
+        """
+        插入消息 (按顺序分配会话内序号)；调用方需持有锁
+
+        Args:
+            dedupe: 为 True 时跳过 (timestamp, speaker, content) 已存在的消息 (含本批次内重复的)
+
+        Returns:
+            List[Dict]: 实际插入的消息
+        """
+        row = self._db.execute("SELECT MAX(seq) FROM messages WHERE session_id = ?", (session_id,)).fetchone()
+        seq = row[0] or 0
+        inserted = []
+        for msg in messages:
+            timestamp = msg.get("timestamp", 0)
+            speaker = msg.get("speaker", "")
+            content_hash = self._content_hash(msg.get("content", ""))
+            if dedupe and self._db.execute(
+                "SELECT 1 FROM messages WHERE session_id = ? AND timestamp = ? AND speaker = ? AND content_hash = ? LIMIT 1",
+                (session_id, timestamp, speaker, content_hash),
+            ).fetchone():
+                continue
+            seq += 1
+            self._db.execute(
+                "INSERT INTO messages (session_id, seq, timestamp, speaker, content_hash, payload) VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, seq, timestamp, speaker, content_hash, json.dumps(msg, ensure_ascii=False)),
+            )
+            inserted.append(msg)
+        return inserted
+
+    def _load_state(self, session_id: str) -> Dict[str, Any]:
+        state = self._load_fields(session_id)
+        state["history"] = self.get_history(session_id)
+        return state
+
+    def _load_fields(self, session_id: str) -> Dict[str, Any]:
+        state = self._default_state()
+        state.pop("history", None)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key, value FROM session_state WHERE session_id = ?", (session_id,)
+            ).fetchall()
+        for key, value in rows:
+            state[key] = json.loads(value)
+        return state
+
+    def get_state(self, session_id: str, include_history: bool = True) -> Dict[str, Any]:
+        """
+        获取指定会话的状态 (include_history=False 时不查询消息表)
+        """
+        if not include_history:
+            return self._load_fields(session_id)
+        return self._load_state(session_id)
+
+    def update_state(self, session_id: str, new_state: Dict[str, Any]):
+        """
+        更新状态
+
+        只写入传入的字段；包含 history 字段时视为整体替换该会话的历史。
+        """
+        fields = dict(new_state)
+        history = fields.pop("history", None)
+        fields["last_updated"] = time.time()
+        with self._lock:
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO session_state (session_id, key, value) VALUES (?, ?, ?)",
+                    [(session_id, k, json.dumps(v, ensure_ascii=False)) for k, v in fields.items()],
+                )
+                if history is not None:
+                    self._db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                    self._insert_messages(session_id, history)
+
+    def extend_list_field(self, session_id: str, field: str, items: List[Any]) -> List[Any]:
+        """
+        原子地向列表字段追加元素 (在同一个事务内读-改-写)
+        """
+        with self._lock:
+            with self._db:
+                row = self._db.execute(
+                    "SELECT value FROM session_state WHERE session_id = ? AND key = ?", (session_id, field)
+                ).fetchone()
+                current = json.loads(row[0]) if row else []
+                added = []
+                for item in items:
+                    if item not in current:
+                        current.append(item)
+                        added.append(item)
+                if added:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO session_state (session_id, key, value) VALUES (?, ?, ?)",
+                        [
+                            (session_id, field, json.dumps(current, ensure_ascii=False)),
+                            (session_id, "last_updated", json.dumps(time.time())),
+                        ],
+                    )
+        return added
+
+    def get_history(self, session_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        获取聊天历史 (按时间正序，指定 limit 时只取最近 limit 条)
+        """
+        with self._lock:
+            if limit:
+                rows = self._db.execute(
+                    "SELECT payload FROM messages WHERE session_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+                    (session_id, limit),
+                ).fetchall()
+                rows.reverse()
+            else:
+                rows = self._db.execute(
+                    "SELECT payload FROM messages WHERE session_id = ? ORDER BY timestamp, id", (session_id,)
+                ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def count_messages(self, session_id: str) -> int:
+        """
+        获取聊天历史的消息条数
+        """
+        with self._lock:
+            row = self._db.execute("SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0]
+
+    def get_history_page(self, session_id: str, cursor: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+        """
+        分页获取聊天历史 (从最新往更早翻页)
+
+        游标为 "<timestamp>:<id>"，指向本页最早一条消息，走 (session_id, timestamp, id) 索引。
+        """
+        # SQLite 的负数 LIMIT 表示不限条数，必须在这里拦住
+        if limit < 1:
+            raise ValueError(f"Invalid history page limit: {limit}")
+        sql = "SELECT id, timestamp, payload FROM messages WHERE session_id = ?"
+        params: List[Any] = [session_id]
+        if cursor:
+            try:
+                ts, row_id = (int(x) for x in cursor.split(":", 1))
+            except ValueError:
+                raise ValueError(f"Invalid history cursor: {cursor}")
+            sql += " AND (timestamp < ? OR (timestamp = ? AND id < ?))"
+            params.extend([ts, ts, row_id])
+        sql += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+        # 多取一条用于判断是否还有更早的消息
+        params.append(limit + 1)
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        rows.reverse()
+        next_cursor = f"{rows[0][1]}:{rows[0][0]}" if has_more and rows else None
+        return {
+            "messages": [json.loads(r[2]) for r in rows],
+            "next_cursor": next_cursor
+        }
+
+    def append_message(self, session_id: str, message: Dict[str, Any]):
+        """
+        追加一条消息到历史
+        """
+        # 确保有时间戳
+        if "timestamp" not in message or not message["timestamp"]:
+            message["timestamp"] = int(time.time())
+        with self._lock:
+            with self._db:
+                self._insert_messages(session_id, [message])
+                self._db.execute(
+                    "INSERT OR REPLACE INTO session_state (session_id, key, value) VALUES (?, 'last_updated', ?)",
+                    (session_id, json.dumps(time.time())),
+                )
+
+    def merge_history(self, session_id: str, new_messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        合并新的消息到现有历史 (按 (timestamp, speaker, content) 索引去重，不读取已有历史)
+        """
+        for msg in new_messages:
+            if msg.get("timestamp") is None:
+                # 如果缺少时间戳，使用当前时间
+                msg["timestamp"] = int(time.time())
+        with self._lock:
+            with self._db:
+                added_messages = self._insert_messages(session_id, new_messages, dedupe=True)
+                if added_messages:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO session_state (session_id, key, value) VALUES (?, 'last_updated', ?)",
+                        (session_id, json.dumps(time.time())),
+                    )
+        added_messages.sort(key=lambda x: x.get("timestamp", 0))
+        return added_messages
@@ -0,0 +1,336 @@
+from typing import Dict, Any, Iterator, List, Optional
+from collections import OrderedDict
+from contextlib import contextmanager
+import atexit
+import copy
+import threading
+import time
+from src.progress.state_manager import StateManager
+
+
+class CachedStateManager:
+    """
+    带热状态缓存的状态管理
+
+    包装任意 StateManager 后端，接口与其一致：
+    1. 标量状态字段 (阶段、雷达、画像、事实等) 解码后缓存在进程内 LRU 中，
+       容量超限或空闲超过 TTL 时淘汰
+    2. 标量字段的更新只标记为脏，由后台线程定期合并写回 (同一轮内的多次更新只写一次)
+    3. 聊天历史的读写直接透传给后端，不进入缓存
+
+    进程退出前需调用 flush() 把脏数据落盘。
+    条目被淘汰时其脏字段可能仍在写回途中，此时重新加载会在后端状态上叠加这些字段，避免读到旧值。
+    未命中时在缓存锁外读取后端 (同一会话只加载一次)，冷会话的磁盘读取不阻塞其他会话和后台写回。
+    """
+    def __init__(
+        self,
+        backend: StateManager,
+        max_entries: int = 256,
+        idle_ttl: float = 1800.0,
+        flush_interval: float = 0.5,
+    ):
+        """
+        Args:
+            backend: 实际负责持久化的状态后端
+            max_entries: 最多缓存的会话数
+            idle_ttl: 会话空闲多少秒后从缓存淘汰
+            flush_interval: 后台写回间隔 (秒)
+        """
+        self._backend = backend
+        self._max_entries = max_entries
+        self._idle_ttl = idle_ttl
+        self._flush_interval = flush_interval
+        # session_id -> {"fields": 已解码的状态, "dirty": 待写回的字段, "last_access": 时间,
+        #                "hits" / "misses": 该会话在缓存期间的命中次数}
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 串行化对后端的写回，避免后台线程与淘汰/关闭时的写回交错
+        self._flush_lock = threading.Lock()
+        # session_id -> 已从条目取出、正在写回后端的脏字段 (按取出顺序)
+        self._inflight: Dict[str, List[Dict[str, Any]]] = {}
+        # session_id -> 正在从后端加载的事件 (加载完成后 set)
+        self._loading: Dict[str, threading.Event] = {}
+        self._totals = {"hits": 0, "misses": 0}
+        self._flush_stats = {"flushes": 0, "fields_written": 0, "total_latency_ms": 0.0, "max_latency_ms": 0.0}
+
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_loop, name="state-flusher", daemon=True)
+        self._flusher.start()
+        # 后台线程是守护线程，进程退出时兜底落盘
+        atexit.register(self.close)
+
+    # --- 缓存 ---
+
+    def _load(self, session_id: str) -> bool:
+        """
+        确保会话条目已在缓存中，未命中时在锁外从后端加载；调用方不能持有 self._lock
+
+        Returns:
+            bool: 是否由本次调用从后端加载
+        """
+        while True:
+            with self._lock:
+                if session_id in self._entries:
+                    return False
+                loading = self._loading.get(session_id)
+                if loading is None:
+                    loading = self._loading[session_id] = threading.Event()
+                    # 读取期间可能写回完成并注销，先记下此刻仍在写回途中的字段
+                    inflight = list(self._inflight.get(session_id, []))
+                    break
+            # 其他线程正在加载同一会话，等待其完成后重新检查
+            loading.wait()
+
+        try:
+            fields = self._backend.get_state(session_id, include_history=False)
+        except BaseException:
+            with self._lock:
+                self._loading.pop(session_id, None)
+            loading.set()
+            raise
+        with self._lock:
+            # 尚未落盘 (或读取期间才落盘) 的写回比读到的后端值更新
+            seen = {id(d) for d in inflight}
+            for dirty in inflight + [d for d in self._inflight.get(session_id, []) if id(d) not in seen]:
+                fields.update(copy.deepcopy(dirty))
+            self._totals["misses"] += 1
+            self._entries[session_id] = {"fields": fields, "dirty": {}, "hits": 0, "misses": 1, "last_access": time.time()}
+            self._loading.pop(session_id, None)
+        loading.set()
+        return True
+
+    @contextmanager
+    def _entry(self, session_id: str) -> Iterator[Dict[str, Any]]:
+        """
+        持有 self._lock 并产出会话的缓存条目，未命中时先在锁外加载
+        """
+        while True:
+            loaded = self._load(session_id)
+            self._lock.acquire()
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                break
+            # 加载后、加锁前条目已被淘汰，重新加载
+            self._lock.release()
+        try:
+            self._entries.move_to_end(session_id)
+            if not loaded:
+                entry["hits"] += 1
+                self._totals["hits"] += 1
+            entry["last_access"] = time.time()
+            yield entry
+        finally:
+            self._lock.release()
+
+    def _take_dirty(self, session_id: str, dirty: Dict[str, Any]) -> tuple:
+        """
+        登记即将写回的脏字段；调用方需持有 self._lock
+        """
+        self._inflight.setdefault(session_id, []).append(dirty)
+        return (session_id, dirty)
+
+    def _release(self, session_id: str, dirty: Dict[str, Any]):
+        """
+        写回结束后注销；调用方需持有 self._lock
+        """
+        pending = self._inflight.get(session_id, [])
+        for i, d in enumerate(pending):
+            if d is dirty:
+                del pending[i]
+                break
+        if not pending:
+            self._inflight.pop(session_id, None)
+
+    def _collect_evictions(self) -> List[tuple]:
+        """
+        淘汰超出容量或空闲过久的条目；调用方需持有 self._lock
+
+        Returns:
+            List[tuple]: 被淘汰且仍有脏字段的 (session_id, dirty)，需要由调用方在锁外写回
+        """
+        now = time.time()
+        evicted = []
+        for session_id in list(self._entries.keys()):
+            entry = self._entries[session_id]
+            over_capacity = len(self._entries) > self._max_entries
+            idle = now - entry["last_access"] > self._idle_ttl
+            if not over_capacity and not idle:
+                # 按 LRU 顺序遍历，遇到第一个无需淘汰的即可停止
+                break
+            del self._entries[session_id]
+            if entry["dirty"]:
+                evicted.append(self._take_dirty(session_id, entry["dirty"]))
+        return evicted
+
+    def _write_back(self, pending: List[tuple]):
+        for i, (session_id, dirty) in enumerate(pending):
+            start = time.time()
+            try:
+                self._backend.update_state(session_id, dirty)
+            except Exception:
+                # 写回失败时把字段放回脏集合，等待下次重试 (期间的新更新优先)
+                with self._lock:
+                    for failed_id, failed in pending[i:]:
+                        self._release(failed_id, failed)
+                        entry = self._entries.get(failed_id)
+                        if entry is None:
+                            continue
+                        merged = dict(failed)
+                        merged.update(entry["dirty"])
+                        entry["dirty"] = merged
+                raise
+            latency_ms = (time.time() - start) * 1000
+            with self._lock:
+                self._release(session_id, dirty)
+                self._flush_stats["flushes"] += 1
+                self._flush_stats["fields_written"] += len(dirty)
+                self._flush_stats["total_latency_ms"] += latency_ms
+                self._flush_stats["max_latency_ms"] = max(self._flush_stats["max_latency_ms"], latency_ms)
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self._flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Warning: Background state flush failed: {e}")
+
+    def flush(self):
+        """
+        把所有脏字段写回后端 (阻塞直到完成)
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending = []
+                for session_id, entry in self._entries.items():
+                    if entry["dirty"]:
+                        pending.append(self._take_dirty(session_id, entry["dirty"]))
+                        entry["dirty"] = {}
+                pending.extend(self._collect_evictions())
+            self._write_back(pending)
+
+    def close(self):
+        """
+        停止后台写回线程并落盘 (可重复调用)
+        """
+        self._closed = True
+        self._wakeup.set()
+        self._flusher.join(timeout=5)
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取缓存指标
+
+        Returns:
+            Dict: 总体命中率、当前缓存中每个会话的命中/未命中次数以及写回次数和耗时
+        """
+        with self._lock:
+            sessions = {sid: {"hits": e["hits"], "misses": e["misses"]} for sid, e in self._entries.items()}
+            flush = dict(self._flush_stats)
+            cached = len(self._entries)
+            dirty = sum(1 for e in self._entries.values() if e["dirty"])
+            hits, misses = self._totals["hits"], self._totals["misses"]
+        flush["avg_latency_ms"] = round(flush["total_latency_ms"] / flush["flushes"], 3) if flush["flushes"] else 0.0
+        flush["total_latency_ms"] = round(flush["total_latency_ms"], 3)
+        flush["max_latency_ms"] = round(flush["max_latency_ms"], 3)
+        return {
+            "cached_sessions": cached,
+            "dirty_sessions": dirty,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "flush": flush,
+            "sessions": sessions,
+        }
+
+    # --- StateManager 接口 ---
+
+    def get_state(self, session_id: str, include_history: bool = True) -> Dict[str, Any]:
+        """
+        获取指定会话的状态 (返回副本，调用方可以放心修改)
+        """
+        with self._entry(session_id) as entry:
+            state = copy.deepcopy(entry["fields"])
+        if include_history:
+            state["history"] = self._backend.get_history(session_id)
+        return state
+
+    def update_state(self, session_id: str, new_state: Dict[str, Any]):
+        """
+        更新状态
+
+        标量字段先写入缓存并由后台线程合并写回；history 字段直接写穿到后端。
+        """
+        fields = dict(new_state)
+        history = fields.pop("history", None)
+        if history is not None:
+            self._backend.update_state(session_id, {"history": history})
+        with self._entry(session_id) as entry:
+            fields["last_updated"] = time.time()
+            fields = copy.deepcopy(fields)
+            entry["fields"].update(fields)
+            entry["dirty"].update(fields)
+            evicted = self._collect_evictions()
+        if evicted:
+            with self._flush_lock:
+                self._write_back(evicted)
+
+    def extend_list_field(self, session_id: str, field: str, items: List[Any]) -> List[Any]:
+        """
+        原子地向列表字段追加元素 (在缓存锁内读-改-写，随后台写回落盘)
+        """
+        with self._entry(session_id) as entry:
+            current = list(entry["fields"].get(field) or [])
+            added = []
+            for item in items:
+                if item not in current:
+                    current.append(copy.deepcopy(item))
+                    added.append(item)
+            if added:
+                now = time.time()
+                entry["fields"][field] = current
+                entry["fields"]["last_updated"] = now
+                entry["dirty"][field] = copy.deepcopy(current)
+                entry["dirty"]["last_updated"] = now
+        return added
+
+    def update_radar(self, session_id: str, radar_data: Dict[str, Any]):
+        """
+        更新关系雷达数据
+        """
+        self.update_state(session_id, {"radar": radar_data})
+
+    def update_persona(self, session_id: str, persona_data: Dict[str, Any]):
+        """
+        更新人物画像数据
+        """
+        self.update_state(session_id, {"persona": persona_data})
+
+    def _touch(self, session_id: str):
+        # 历史写操作由后端更新 last_updated，这里同步缓存中的值
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                entry["fields"]["last_updated"] = time.time()
+
+    def get_history(self, session_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self._backend.get_history(session_id, limit=limit)
+
+    def count_messages(self, session_id: str) -> int:
+        return self._backend.count_messages(session_id)
+
+    def get_history_page(self, session_id: str, cursor: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+        return self._backend.get_history_page(session_id, cursor=cursor, limit=limit)
+
+    def append_message(self, session_id: str, message: Dict[str, Any]):
+        self._backend.append_message(session_id, message)
+        self._touch(session_id)
+
+    def merge_history(self, session_id: str, new_messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        added = self._backend.merge_history(session_id, new_messages)
+        if added:
+            self._touch(session_id)
+        return added
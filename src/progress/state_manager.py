@@ -1,6 +1,7 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 import json
 import os
+import threading
 import time
 
 class StateManager:
@@ -15,26 +16,68 @@ class StateManager:
     5. 人物画像 (Persona)
     6. 用户事实 (User Facts)
     
-    数据存储在本地 JSON 文件中。
+    数据存储在本地 JSON 文件中。所有写操作都在会话级锁内完成读-改-写，
+    并通过临时文件 + 原子重命名落盘，不同会话之间的写入互不阻塞。
     """
     def __init__(self, persist_dir: str):
         self._persist_dir = persist_dir
         if not os.path.exists(persist_dir):
             os.makedirs(persist_dir)
-            
+        self._session_locks: Dict[str, threading.RLock] = {}
+        self._session_locks_guard = threading.Lock()
+        # 会话 -> (状态文件签名, 消息条数)，文件未变时 count_messages 无需解析整个历史
+        self._history_counts: Dict[str, Tuple[Tuple[int, int], int]] = {}
+
+    def _session_lock(self, session_id: str) -> threading.RLock:
+        """
+        获取会话级写锁 (可重入，同一线程内的嵌套写操作不会死锁)
+        """
+        with self._session_locks_guard:
+            lock = self._session_locks.get(session_id)
+            if lock is None:
+                lock = threading.RLock()
+                self._session_locks[session_id] = lock
+            return lock
+
+    @staticmethod
+    def _atomic_write_json(path: str, data: Any, indent: Optional[int] = None):
+        """
+        先写临时文件再原子替换，避免并发读到写了一半的文件
+        """
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+        os.replace(tmp_path, path)
+
     def _get_path(self, session_id: str) -> str:
         return os.path.join(self._persist_dir, f"state_{session_id}.json")
 
-    def get_state(self, session_id: str) -> Dict[str, Any]:
+    @staticmethod
+    def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+        # 修改时间 + 文件大小，用于判断状态文件是否被改写过
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def get_state(self, session_id: str, include_history: bool = True) -> Dict[str, Any]:
         """
         获取指定会话的状态
         
         Args:
             session_id: 会话 ID
+            include_history: 是否包含完整聊天历史 (只需要标量字段时传 False)
             
         Returns:
             Dict: 状态字典
         """
+        state = self._load_state(session_id)
+        if not include_history:
+            state.pop("history", None)
+        return state
+
+    def _load_state(self, session_id: str) -> Dict[str, Any]:
         path = self._get_path(session_id)
         if os.path.exists(path):
             try:
@@ -45,6 +88,9 @@ class StateManager:
             except (json.JSONDecodeError, OSError) as e:
                 print(f"Warning: Failed to load state from {path}: {e}. Returning default state.")
                 
+        return self._default_state()
+
+    def _default_state(self) -> Dict[str, Any]:
         # 默认状态
         return {
             "relationship_stage": "陌生/破冰",
@@ -60,26 +106,54 @@ class StateManager:
         """
         更新状态
         
+        字段级合并: 只覆盖传入的字段，其余字段以锁内重新读取的最新值为准，
+        因此并发的多个阶段各自只写自己负责的字段时不会互相覆盖。
+        
         Args:
             session_id: 会话 ID
             new_state: 需要更新的状态字段
         """
-        state = self.get_state(session_id)
-        # 简单更新，后续可考虑深度合并
-        state.update(new_state)
-        state["last_updated"] = time.time()
+        with self._session_lock(session_id):
+            state = self._load_state(session_id)
+            state.update(new_state)
+            state["last_updated"] = time.time()
+            path = self._get_path(session_id)
+            self._atomic_write_json(path, state, indent=2)
+            # 每次写入都有完整状态在手，顺带记录消息条数
+            signature = self._file_signature(path)
+            if signature is not None:
+                self._history_counts[session_id] = (signature, len(state.get("history") or []))
+
+    def extend_list_field(self, session_id: str, field: str, items: List[Any]) -> List[Any]:
+        """
+        原子地向列表字段追加元素 (已存在的元素跳过)
         
-        path = self._get_path(session_id)
-        # print(f"DEBUG: Saving state to {path}. Content keys: {state.keys()} History len: {len(state.get('history', []))}")
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(state, f, ensure_ascii=False, indent=2)
+        Args:
+            session_id: 会话 ID
+            field: 字段名，如 user_facts
+            items: 待追加的元素
+            
+        Returns:
+            List: 实际新增的元素
+        """
+        with self._session_lock(session_id):
+            current = list(self.get_state(session_id, include_history=False).get(field) or [])
+            added = []
+            for item in items:
+                if item not in current:
+                    current.append(item)
+                    added.append(item)
+            if added:
+                self.update_state(session_id, {field: current})
+            return added
 
-    def get_history(self, session_id: str) -> List[Dict[str, Any]]:
+    def get_history(self, session_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         获取聊天历史
         
         Args:
             session_id: 会话 ID
+            limit: 只返回最近的 limit 条消息，为空则返回全部
             
         Returns:
             List[Dict]: 消息列表
@@ -87,8 +161,62 @@ class StateManager:
         state = self.get_state(session_id)
         hist = state.get("history", [])
         # print(f"DEBUG: get_history for {session_id} returned {len(hist)} items")
+        if limit:
+            return hist[-limit:]
         return hist
 
+    def count_messages(self, session_id: str) -> int:
+        """
+        获取聊天历史的消息条数
+        
+        状态文件自上次写入 (或计数) 后未变化时直接返回记录的条数，不重新解析历史。
+        
+        Args:
+            session_id: 会话 ID
+            
+        Returns:
+            int: 消息条数
+        """
+        signature = self._file_signature(self._get_path(session_id))
+        cached = self._history_counts.get(session_id)
+        if cached is not None and signature is not None and cached[0] == signature:
+            return cached[1]
+        # 先取签名再读取: 读取期间文件被改写时签名不再匹配，下次调用会重新计数
+        count = len(self.get_history(session_id))
+        if signature is not None:
+            self._history_counts[session_id] = (signature, count)
+        return count
+
+    def get_history_page(self, session_id: str, cursor: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+        """
+        分页获取聊天历史 (从最新往更早翻页)
+        
+        Args:
+            session_id: 会话 ID
+            cursor: 上一页返回的 next_cursor，为空表示从最新一页开始
+            limit: 每页条数 (至少 1)
+            
+        Returns:
+            Dict: {"messages": 按时间正序的本页消息, "next_cursor": 更早一页的游标，没有更多时为 None}
+
+        Raises:
+            ValueError: 游标无效或 limit 小于 1
+        """
+        if limit < 1:
+            raise ValueError(f"Invalid history page limit: {limit}")
+        hist = self.get_history(session_id)
+        end = len(hist)
+        if cursor:
+            try:
+                end = max(0, min(int(cursor), len(hist)))
+            except ValueError:
+                raise ValueError(f"Invalid history cursor: {cursor}")
+        start = max(0, end - limit)
+        return {
+            "messages": hist[start:end],
+            "next_cursor": str(start) if start > 0 else None
+        }
+
     def append_message(self, session_id: str, message: Dict[str, Any]):
         """
         追加一条消息到历史
@@ -97,16 +225,16 @@ class StateManager:
             session_id: 会话 ID
             message: 消息字典 {speaker: 'user'/'target', content: '...', timestamp: ...}
         """
-        state = self.get_state(session_id)
-        if "history" not in state:
-            state["history"] = []
-        
         # 确保有时间戳
         if "timestamp" not in message or not message["timestamp"]:
             message["timestamp"] = int(time.time())
             
-        state["history"].append(message)
-        self.update_state(session_id, {"history": state["history"]})
+        with self._session_lock(session_id):
+            state = self.get_state(session_id)
+            if "history" not in state:
+                state["history"] = []
+            state["history"].append(message)
+            self.update_state(session_id, {"history": state["history"]})
 
     def update_radar(self, session_id: str, radar_data: Dict[str, Any]):
         """
@@ -139,6 +267,10 @@ class StateManager:
         Returns:
             List[Dict]: 实际新增的消息列表
         """
+        with self._session_lock(session_id):
+            return self._merge_history(session_id, new_messages)
+
+    def _merge_history(self, session_id: str, new_messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         state = self.get_state(session_id)
         current_history = state.get("history", [])
         
@@ -1,4 +1,4 @@
-from typing import Dict, Any
+from typing import Dict, Any, List
 from src.model.qwen_client import QwenClient
 from src.prompts.prompts import STRATEGY_PLANNING_PROMPT
 
@@ -10,10 +10,41 @@ class StrategyPlanner:
     负责基于当前的人物画像、关系状态、情感分析等信息，
     规划下一步的聊天策略。
     """
+    # 响应缓存有效期 (秒)
+    CACHE_TTL = 300
+
     def __init__(self, client: QwenClient, model: str):
         self._client = client
         self._model = model
 
+    def _build_messages(
+        self,
+        personality_profile: Dict[str, Any],
+        emotion_analysis: Dict[str, Any],
+        relationship_stage: str,
+        intimacy_level: int,
+        humor_level: int,
+        current_appellation: str,
+        user_gender: str,
+        target_gender: str,
+        conversation_history: str,
+    ) -> List[Dict[str, str]]:
+        user_prompt = (
+            STRATEGY_PLANNING_PROMPT.replace("{personality_profile}", str(personality_profile))
+            .replace("{emotion_analysis}", str(emotion_analysis))
+            .replace("{relationship_stage}", str(relationship_stage))
+            .replace("{intimacy_level}", str(intimacy_level))
+            .replace("{humor_level}", str(humor_level))
+            .replace("{current_appellation}", str(current_appellation))
+            .replace("{user_gender}", str(user_gender))
+            .replace("{target_gender}", str(target_gender))
+            .replace("{conversation_history}", str(conversation_history))
+        )
+        return [
+            {"role": "system", "content": "你是中文恋爱策略规划助手，严格输出JSON对象。"},
+            {"role": "user", "content": user_prompt},
+        ]
+
     def plan(
         self,
         personality_profile: Dict[str, Any],
@@ -43,20 +74,30 @@ class StrategyPlanner:
         Returns:
             Dict: 包含策略建议的 JSON
         """
-        user_prompt = (
-            STRATEGY_PLANNING_PROMPT.replace("{personality_profile}", str(personality_profile))
-            .replace("{emotion_analysis}", str(emotion_analysis))
-            .replace("{relationship_stage}", str(relationship_stage))
-            .replace("{intimacy_level}", str(intimacy_level))
-            .replace("{humor_level}", str(humor_level))
-            .replace("{current_appellation}", str(current_appellation))
-            .replace("{user_gender}", str(user_gender))
-            .replace("{target_gender}", str(target_gender))
-            .replace("{conversation_history}", str(conversation_history))
+        messages = self._build_messages(
+            personality_profile, emotion_analysis, relationship_stage, intimacy_level, humor_level,
+            current_appellation, user_gender, target_gender, conversation_history,
         )
-        messages = [
-            {"role": "system", "content": "你是中文恋爱策略规划助手，严格输出JSON对象。"},
-            {"role": "user", "content": user_prompt},
-        ]
-        resp = self._client.chat_json(self._model, messages, temperature=0.3)
+        resp = self._client.chat_json(self._model, messages, temperature=0.3, cache_ttl=self.CACHE_TTL)
         return resp
+
+    async def aplan(
+        self,
+        personality_profile: Dict[str, Any],
+        emotion_analysis: Dict[str, Any],
+        relationship_stage: str,
+        intimacy_level: int,
+        humor_level: int,
+        current_appellation: str,
+        user_gender: str = "未知",
+        target_gender: str = "未知",
+        conversation_history: str = "",
+    ) -> Dict[str, Any]:
+        """
+        制定聊天策略 (异步版本)
+        """
+        messages = self._build_messages(
+            personality_profile, emotion_analysis, relationship_stage, intimacy_level, humor_level,
+            current_appellation, user_gender, target_gender, conversation_history,
+        )
+        return await self._client.achat_json(self._model, messages, temperature=0.3, cache_ttl=self.CACHE_TTL)
@@ -0,0 +1,168 @@
+from typing import Any, Dict, List, Optional, Tuple
+import json
+from src.prompts.token_budget import estimate_tokens, truncate_to_tokens
+
+# 可裁剪的段落及其优先级 (数值越小越先被裁剪)
+SECTION_PRIORITIES: Dict[str, int] = {
+    "retrieval_materials": 1,
+    "kb_materials": 2,
+    "user_facts": 3,
+    "topic_management": 4,
+    "continuation_assessment": 5,
+    "boundary_assessment": 6,
+    "action_guide": 7,
+}
+
+# 未配置的模型使用的默认预算
+DEFAULT_BUDGET = 2400
+
+_EMPTY = "无"
+
+
+def _prune(value: Any) -> Any:
+    """
+    递归去掉空值 (None / 空串 / 空容器)，减少无意义的 token
+    """
+    if isinstance(value, dict):
+        pruned = {k: _prune(v) for k, v in value.items()}
+        return {k: v for k, v in pruned.items() if v not in (None, "", [], {})}
+    if isinstance(value, list):
+        pruned = [_prune(v) for v in value]
+        return [v for v in pruned if v not in (None, "", [], {})]
+    return value
+
+
+def compact_json(value: Any) -> str:
+    """
+    紧凑 JSON 序列化 (去空值、不转义中文、无多余空格)
+
+    Args:
+        value: 任意可序列化对象
+
+    Returns:
+        str: 序列化结果，内容为空时返回 "无"
+    """
+    pruned = _prune(value)
+    if pruned in (None, "", [], {}):
+        return _EMPTY
+    return json.dumps(pruned, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class PromptAssembler:
+    """
+    回复生成提示词组装器
+
+    把检索结果、知识库和规划器输出紧凑地序列化后填入模板，
+    并按本地估算的 token 数把整段提示词控制在模型预算内：
+    超出预算时按 SECTION_PRIORITIES 从低到高依次裁剪段落
+    (列表段落从末尾丢弃条目，其余段落截断文本)。
+    """
+    def __init__(self, budgets: Optional[Dict[str, int]] = None):
+        """
+        Args:
+            budgets: 模型名 -> 提示词 token 预算，"default" 为未列出模型的预算
+        """
+        self._budgets = dict(budgets or {})
+
+    def budget_for(self, model: str) -> int:
+        """
+        获取模型对应的提示词预算
+        """
+        return int(self._budgets.get(model, self._budgets.get("default", DEFAULT_BUDGET)))
+
+    @staticmethod
+    def serialize_retrieval(docs: List[Dict[str, Any]] | None) -> List[str]:
+        """
+        历史检索结果只保留文本，每条一行
+        """
+        lines = []
+        for d in docs or []:
+            text = d.get("text") if isinstance(d, dict) else d
+            text = str(text or "").strip()
+            if text:
+                lines.append(f"- {text}")
+        return lines
+
+    @staticmethod
+    def serialize_facts(facts: List[str] | None) -> List[str]:
+        """
+        用户事实去重后每条一行
+        """
+        lines = []
+        seen = set()
+        for f in facts or []:
+            f = str(f or "").strip()
+            if f and f not in seen:
+                seen.add(f)
+                lines.append(f"- {f}")
+        return lines
+
+    def assemble(
+        self,
+        template: str,
+        model: str,
+        fixed: Dict[str, Any],
+        sections: Dict[str, Any],
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        组装提示词
+
+        Args:
+            template: 含 {占位符} 的提示词模板
+            model: 模型名 (决定预算)
+            fixed: 不参与裁剪的占位符取值
+            sections: 可裁剪段落的取值，键需在 SECTION_PRIORITIES 中；
+                值为 List[str] 时按行裁剪，否则视为已序列化的文本
+
+        Returns:
+            Tuple[str, Dict]: (提示词, 用量报告)，用量报告包含 budget、total
+                以及 sections 下每个段落的 tokens 与 trimmed 标记
+        """
+        prompt = template
+        for key, value in fixed.items():
+            prompt = prompt.replace("{" + key + "}", str(value))
+
+        values: Dict[str, Any] = {k: (list(v) if isinstance(v, list) else str(v)) for k, v in sections.items()}
+        trimmed = {k: False for k in values}
+
+        def _render(v: Any) -> str:
+            if isinstance(v, list):
+                return "\n" + "\n".join(v) if v else _EMPTY
+            return v or _EMPTY
+
+        def _cost(v: Any) -> int:
+            return estimate_tokens(_render(v))
+
+        base = prompt
+        for key in values:
+            base = base.replace("{" + key + "}", "")
+        budget = self.budget_for(model)
+        costs = {k: _cost(v) for k, v in values.items()}
+        overflow = estimate_tokens(base) + sum(costs.values()) - budget
+
+        for key in sorted(values, key=lambda k: SECTION_PRIORITIES.get(k, 0)):
+            if overflow <= 0:
+                break
+            value = values[key]
+            allowed = max(0, costs[key] - overflow)
+            if isinstance(value, list):
+                while value and _cost(value) > allowed:
+                    value.pop()
+            else:
+                value = truncate_to_tokens(value, allowed) if allowed > estimate_tokens(_EMPTY) else ""
+            values[key] = value
+            new_cost = _cost(value)
+            trimmed[key] = new_cost < costs[key]
+            overflow -= costs[key] - new_cost
+            costs[key] = new_cost
+
+        for key, value in values.items():
+            prompt = prompt.replace("{" + key + "}", _render(value))
+
+        usage = {
+            "model": model,
+            "budget": budget,
+            "total": estimate_tokens(prompt),
+            "sections": {k: {"tokens": costs[k], "trimmed": trimmed[k]} for k in values},
+        }
+        return prompt, usage
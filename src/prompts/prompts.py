@@ -469,3 +469,65 @@ SAFETY_CHECK_PROMPT = """
     "reason": "判断理由"
 }
 """
+
+FUSED_ANALYSIS_PROMPT = """
+你是一位资深的中文恋爱对话分析师，需要基于同一段对话一次性完成多项分析任务。
+
+【对话历史】
+{context_history}
+
+【对方最新消息】
+{current_message}
+
+下面列出了各项分析任务，任务中提到的“对话历史”“对话内容”“最新消息”均指上方内容。
+
+{tasks}
+
+请将所有任务的结果合并为一个JSON对象返回，顶层键必须且只能为：{task_keys}
+每个键的值为对应任务要求返回的JSON对象，不要输出任何额外说明。
+"""
+
+SAFETY_BATCH_CHECK_PROMPT = """
+你是一位内容安全审核员，请逐条检查以下回复候选是否包含有害、违规或不适宜的内容。
+
+回复候选（按编号列出）：
+{reply_list}
+
+检查标准：
+1. 政治敏感：是否涉及敏感政治话题。
+2. 色情暴力：是否包含露骨色情或暴力描述。
+3. 侮辱谩骂：是否包含攻击性语言。
+4. 价值观：是否违背社会公序良俗。
+
+请对每一条候选分别给出判断，以JSON格式返回（results 数组需覆盖全部编号）：
+{
+    "results": [
+        {
+            "index": 1,
+            "is_safe": true/false,
+            "risk_category": "无/政治/色情/暴力/侮辱/价值观",
+            "reason": "判断理由"
+        }
+    ]
+}
+"""
+
+CONVERSATION_SUMMARY_PROMPT = """
+你是一位对话记录整理员，请把较早的聊天内容整理为滚动摘要，供后续分析使用。
+
+已有摘要（可能为空）：
+{previous_summary}
+
+需要并入摘要的新对话（"我"为用户，"对方"为聊天对象）：
+{new_messages}
+
+要求：
+1. 在已有摘要的基础上合并新对话，输出一份完整的新摘要，而不是只总结新对话。
+2. 保留关键事实（时间、地点、计划、喜好、承诺）、话题走向和情绪变化，省略寒暄和重复内容。
+3. 摘要不超过 {max_chars} 个字。
+
+请以JSON格式返回：
+{
+    "summary": "更新后的完整摘要"
+}
+"""
@@ -0,0 +1,83 @@
+from typing import List
+import re
+
+# 汉字、日文假名、全角标点等按 1 字 1 token 估算
+_CJK = re.compile(r"[　-〿぀-ヿ㐀-鿿豈-﫿＀-￯]")
+# 英文单词 / 数字串
+_WORD = re.compile(r"[A-Za-z0-9_]+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    本地估算文本的 token 数 (不调用模型)
+
+    通义千问系列的分词对中文大约 1 字 1 token，英文大约 4 个字符 1 token，
+    其余符号按 1 个字符 1 token 计。估算结果偏保守，用于预算控制。
+
+    Args:
+        text: 文本
+
+    Returns:
+        int: 估算的 token 数
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    words = _WORD.findall(text)
+    word_chars = sum(len(w) for w in words)
+    word_tokens = sum((len(w) + 3) // 4 for w in words)
+    others = len(text) - cjk - word_chars
+    # 空白通常与相邻词合并，不单独计
+    others -= sum(1 for ch in text if ch.isspace())
+    return cjk + word_tokens + max(0, others)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, suffix: str = "…") -> str:
+    """
+    把文本截断到不超过 max_tokens 个 token (保留开头)
+
+    Args:
+        text: 文本
+        max_tokens: token 上限
+        suffix: 截断后追加的省略标记
+
+    Returns:
+        str: 截断后的文本
+    """
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # 二分查找最长的满足预算的前缀
+    lo, hi = 0, len(text)
+    budget = max_tokens - estimate_tokens(suffix)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo] + suffix
+
+
+def fit_lines_from_end(lines: List[str], max_tokens: int) -> List[str]:
+    """
+    从末尾开始保留尽可能多的行，使总 token 数不超过预算 (用于保留最近的对话)
+
+    Args:
+        lines: 按时间顺序排列的行
+        max_tokens: token 上限
+
+    Returns:
+        List[str]: 保留下来的行 (仍按原顺序)
+    """
+    kept = []
+    used = 0
+    for line in reversed(lines):
+        cost = estimate_tokens(line)
+        if kept and used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    kept.reverse()
+    return kept
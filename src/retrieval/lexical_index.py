@@ -0,0 +1,212 @@
+from typing import List, Dict, Any, Optional
+import json
+import math
+import os
+import re
+import threading
+from src.vectorstore.metadata_filter import match_where
+
+# 连续的汉字 / 其他 CJK 字符
+_CJK_RUN = re.compile(r"[㐀-鿿豈-﫿]+")
+# 英文单词与数字 (电影名、地名中的英文和数字部分)
+_WORD = re.compile(r"[A-Za-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    字符二元组分词
+
+    汉字按相邻两字切分 (单字片段保留单字)，英文和数字按整词小写。
+    不依赖分词词典，对人名、地名、片名这类未登录词也能精确命中。
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        List[str]: 词项列表 (保留重复，用于计算词频)
+    """
+    tokens = []
+    for run in _CJK_RUN.findall(text or ""):
+        if len(run) == 1:
+            tokens.append(run)
+            continue
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(w.lower() for w in _WORD.findall(text or ""))
+    return tokens
+
+
+class _Partition:
+    """
+    单个分区 (会话) 的倒排表与文档长度统计
+    """
+    def __init__(self):
+        # term -> {doc_id: tf}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_len: Dict[str, int] = {}
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.total_len = 0
+
+    def index(self, id: str, tokens: List[str], text: str, metadata: Dict[str, Any]):
+        self.docs[id] = {"text": text, "metadata": metadata}
+        self.doc_len[id] = len(tokens)
+        self.total_len += len(tokens)
+        for token in tokens:
+            posting = self.postings.setdefault(token, {})
+            posting[id] = posting.get(id, 0) + 1
+
+    def scores(self, terms: set, k1: float, b: float) -> Dict[str, float]:
+        n_docs = len(self.docs)
+        if n_docs == 0:
+            return {}
+        avg_len = self.total_len / n_docs
+        scores: Dict[str, float] = {}
+        for term in terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, tf in posting.items():
+                norm = k1 * (1 - b + b * self.doc_len[doc_id] / avg_len)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+        return scores
+
+
+class LexicalIndex:
+    """
+    BM25 倒排索引
+
+    与向量库并行维护的词项索引，由 HistoryIngestor 增量写入。
+    按元数据中的 partition_field (默认 session_id) 分区，每个会话单独统计文档频率和平均长度，
+    不同用户的聊天不会互相影响 IDF。
+    纯内存检索，可选把文档追加写入 JSONL 文件，重启时重建索引。
+    """
+    def __init__(self, persist_path: Optional[str] = None, k1: float = 1.5, b: float = 0.75, partition_field: str = "session_id"):
+        """
+        Args:
+            persist_path: 文档持久化文件路径，为空则只保存在内存中
+            k1: BM25 词频饱和参数
+            b: BM25 文档长度归一化参数
+            partition_field: 分区依据的元数据字段，缺少该字段的文档归入同一个默认分区
+        """
+        self._persist_path = persist_path
+        self._k1 = k1
+        self._b = b
+        self._partition_field = partition_field
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._partitions: Dict[str, _Partition] = {}
+        # doc_id -> 所在分区
+        self._doc_partition: Dict[str, str] = {}
+
+    def _ensure_loaded(self):
+        """
+        首次使用时从持久化文件重建索引；调用方需持有锁
+        """
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self._persist_path or not os.path.exists(self._persist_path):
+            return
+        with open(self._persist_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    doc = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._index(doc["id"], doc["text"], doc.get("metadata") or {})
+
+    def _partition_key(self, metadata: Dict[str, Any]) -> str:
+        return str(metadata.get(self._partition_field) or "")
+
+    def _index(self, id: str, text: str, metadata: Dict[str, Any]) -> bool:
+        if id in self._doc_partition:
+            return False
+        key = self._partition_key(metadata)
+        partition = self._partitions.get(key)
+        if partition is None:
+            partition = self._partitions[key] = _Partition()
+        partition.index(id, tokenize(text), text, metadata)
+        self._doc_partition[id] = key
+        return True
+
+    def add_texts(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]) -> int:
+        """
+        增量添加文档，已存在的 ID 跳过
+
+        Returns:
+            int: 实际新增的条数
+        """
+        with self._lock:
+            self._ensure_loaded()
+            added = []
+            for id, text, meta in zip(ids, texts, metadatas):
+                if self._index(id, text, dict(meta or {})):
+                    added.append({"id": id, "text": text, "metadata": meta})
+            if added and self._persist_path:
+                persist_dir = os.path.dirname(self._persist_path)
+                if persist_dir and not os.path.exists(persist_dir):
+                    os.makedirs(persist_dir)
+                with open(self._persist_path, "a", encoding="utf-8") as f:
+                    for doc in added:
+                        f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+            return len(added)
+
+    def search(
+        self,
+        query: str,
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        BM25 检索
+
+        Args:
+            query: 查询文本
+            n_results: 返回结果数量
+            where: 元数据过滤条件 (Chroma 风格)
+            session_id: 只在该会话的分区内检索 (使用该会话自己的词项统计)；
+                为空时检索所有分区，各分区按自己的统计打分后合并
+
+        Returns:
+            List[Dict]: 包含 id, text, metadata, score 的结果列表，按得分降序
+        """
+        terms = set(tokenize(query))
+        if not terms or n_results <= 0:
+            return []
+        with self._lock:
+            self._ensure_loaded()
+            if session_id is not None:
+                partition = self._partitions.get(str(session_id))
+                partitions = [partition] if partition is not None else []
+            else:
+                partitions = list(self._partitions.values())
+            scored = []
+            for partition in partitions:
+                for doc_id, score in partition.scores(terms, self._k1, self._b).items():
+                    scored.append((score, doc_id, partition))
+
+            results = []
+            for score, doc_id, partition in sorted(scored, key=lambda x: x[0], reverse=True):
+                doc = partition.docs[doc_id]
+                if where and not match_where(doc["metadata"], where):
+                    continue
+                results.append({"id": doc_id, "text": doc["text"], "metadata": dict(doc["metadata"]), "score": score})
+                if len(results) >= n_results:
+                    break
+            return results
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取索引规模
+        """
+        with self._lock:
+            self._ensure_loaded()
+            return {
+                "documents": len(self._doc_partition),
+                "partitions": len(self._partitions),
+                "terms": sum(len(p.postings) for p in self._partitions.values()),
+            }
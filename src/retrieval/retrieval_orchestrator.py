@@ -1,5 +1,18 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+import time
 from src.vectorstore.chroma_store import ChromaStore
+from src.retrieval.lexical_index import LexicalIndex
+
+DAY = 86400
+# 分桶边界的时间粒度 (秒): 基准时间按此取整，同一分钟内的查询使用相同的过滤条件
+TIME_STEP = 60
+# 分桶 -> (最小年龄, 最大年龄) 秒，最大年龄为 None 表示不设上限；各桶互不重叠
+TIME_BUCKETS = {
+    "hot": (0, DAY),
+    "valid_7d": (DAY, 7 * DAY),
+    "background_30d": (7 * DAY, 30 * DAY),
+    "background_legacy": (30 * DAY, None),
+}
 
 
 class RetrievalOrchestrator:
@@ -8,32 +21,183 @@ class RetrievalOrchestrator:
     
     负责协调从向量数据库中检索相关信息。
     支持多种检索策略 (Hot, Valid, Background) 并聚合结果。
+    分桶按消息时间戳在查询时计算的时间范围过滤，不依赖写入时打的静态标签。
+    配置了词项索引时，向量结果与 BM25 结果按倒数排名融合 (RRF)，
+    弥补向量检索对片名、地名等精确实体的漏召回；BM25 结果同样按会话和分桶时间范围过滤并受配额限制。
     """
-    def __init__(self, store: ChromaStore):
+    def __init__(
+        self,
+        store: ChromaStore,
+        lexical_index: Optional[LexicalIndex] = None,
+        lexical_top_k: int = 10,
+        rrf_k: int = 60,
+        recency_half_life_days: float = 0,
+    ):
+        """
+        Args:
+            store: 历史聊天向量库
+            lexical_index: 历史聊天的 BM25 索引，为空则只做向量检索
+            lexical_top_k: 参与融合的 BM25 结果数
+            rrf_k: RRF 平滑常数
+            recency_half_life_days: 时间衰减重排的半衰期 (天)，0 表示不重排
+        """
         self._store = store
+        self._lexical = lexical_index
+        self._lexical_top_k = lexical_top_k
+        self._rrf_k = rrf_k
+        self._recency_half_life = recency_half_life_days * DAY
+
+    def lookup(
+        self,
+        query: str,
+        n_results: int = 5,
+        where: Dict[str, Any] | None = None,
+        session_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        只用 BM25 做实体查找 (不访问向量库，不计算 Embedding)
+        
+        Args:
+            query: 查询文本 (如片名、地名)
+            n_results: 返回结果数量
+            where: 元数据过滤条件
+            session_id: 只查找该会话的消息
+            
+        Returns:
+            List[Dict]: 包含 id, text, metadata, score 的结果列表
+        """
+        if self._lexical is None:
+            return []
+        return self._lexical.search(query, n_results=n_results, where=where, session_id=session_id)
+
+    @staticmethod
+    def _scope(where: Dict[str, Any] | None, session_id: Optional[str]) -> Dict[str, Any] | None:
+        """
+        给过滤条件附加 session_id
+        """
+        if not session_id:
+            return where or None
+        if not where:
+            return {"session_id": session_id}
+        return {"$and": [where, {"session_id": session_id}]}
+
+    @staticmethod
+    def _bucket_of(age: float) -> Optional[str]:
+        for bucket, (min_age, max_age) in TIME_BUCKETS.items():
+            if age >= min_age and (max_age is None or age < max_age):
+                return bucket
+        return None
 
-    def aggregate(self, query: str, quotas: Dict[str, int] | None = None) -> List[Dict[str, Any]]:
+    def _fuse(self, vector_docs: List[Dict[str, Any]], lexical_docs: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+        """
+        倒数排名融合: score = Σ 1 / (rrf_k + rank)
+        """
+        scores: Dict[str, float] = {}
+        docs: Dict[str, Dict[str, Any]] = {}
+        for ranking in (vector_docs, lexical_docs):
+            for rank, d in enumerate(ranking):
+                scores[d["id"]] = scores.get(d["id"], 0.0) + 1.0 / (self._rrf_k + rank + 1)
+                if d["id"] not in docs:
+                    docs[d["id"]] = {
+                        "id": d["id"],
+                        "text": d["text"],
+                        "metadata": d["metadata"],
+                        "distance": d.get("distance"),
+                    }
+        ranked = sorted(docs.keys(), key=lambda x: scores[x], reverse=True)
+        return [docs[i] for i in ranked[:limit]]
+
+    def aggregate(
+        self,
+        query: str,
+        quotas: Dict[str, int] | None = None,
+        now: Optional[float] = None,
+        session_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
         """
         聚合检索结果
         
         Args:
             query: 查询文本
-            quotas: 各类检索结果的配额字典
+            quotas: 各类检索结果的配额字典 (混合检索时配额之和也是融合后的结果上限)
+            now: 计算时间范围的基准时间，为空则取当前时间 (分桶边界按 TIME_STEP 向下取整)
+            session_id: 只检索该会话的消息，为空则不限会话
             
         Returns:
             List[Dict]: 检索到的文档列表
         """
         quotas = quotas or {"hot": 4, "valid_7d": 4, "background_30d": 2, "background_legacy": 1}
+        now = time.time() if now is None else now
+        bucket_now = now - now % TIME_STEP
         results = []
         seen = set()
-        hot_docs = self._store.similarity_search(query, n_results=quotas.get("hot", 0), where={"hot": True})
-        valid_docs = self._store.similarity_search(query, n_results=quotas.get("valid_7d", 0), where={"time_category": "valid_7d"})
-        bg30_docs = self._store.similarity_search(query, n_results=quotas.get("background_30d", 0), where={"time_category": "background_30d"})
-        legacy_docs = self._store.similarity_search(query, n_results=quotas.get("background_legacy", 0), where={"time_category": "background_legacy"})
-        for bucket in [hot_docs, valid_docs, bg30_docs, legacy_docs]:
-            for d in bucket:
+        # 查询向量只计算一次，各个分桶的过滤查询共用
+        emb = self._store.embed_query(query)
+        for bucket, (min_age, max_age) in TIME_BUCKETS.items():
+            docs = self._store.similarity_search(
+                query,
+                n_results=quotas.get(bucket, 0),
+                where=self._scope(self._time_range(bucket_now, min_age, max_age), session_id),
+                query_embedding=emb,
+            )
+            for d in docs:
                 if d["id"] in seen:
                     continue
                 seen.add(d["id"])
                 results.append(d)
+        if self._lexical is not None:
+            lexical_docs = self._lexical_search(query, quotas, bucket_now, session_id)
+            if lexical_docs:
+                results = self._fuse(results, lexical_docs, limit=sum(quotas.values()))
+        if self._recency_half_life:
+            results = self._rerank_by_recency(results, now)
+        return results
+
+    def _lexical_search(self, query: str, quotas: Dict[str, int], now: float, session_id: Optional[str]) -> List[Dict[str, Any]]:
+        """
+        BM25 检索: 限定在有配额的分桶覆盖的时间范围内，每个分桶最多保留其配额条
+        """
+        active = [TIME_BUCKETS[b] for b, q in quotas.items() if q > 0 and b in TIME_BUCKETS]
+        if not active:
+            return []
+        min_age = min(a for a, _ in active)
+        max_age = None if any(m is None for _, m in active) else max(m for _, m in active)
+        window = self._time_range(now, min_age, max_age) if min_age > 0 or max_age is not None else None
+        docs = self._lexical.search(query, n_results=self._lexical_top_k, where=window, session_id=session_id)
+        taken: Dict[str, int] = {}
+        results = []
+        for d in docs:
+            ts = (d.get("metadata") or {}).get("timestamp")
+            if not isinstance(ts, (int, float)):
+                continue
+            bucket = self._bucket_of(max(0.0, now - ts))
+            if bucket is None or taken.get(bucket, 0) >= quotas.get(bucket, 0):
+                continue
+            taken[bucket] = taken.get(bucket, 0) + 1
+            results.append(d)
         return results
+
+    @staticmethod
+    def _time_range(now: float, min_age: float, max_age: Optional[float]) -> Dict[str, Any]:
+        """
+        把 "距今 [min_age, max_age) 秒" 转换为 timestamp 上的范围过滤
+        """
+        conds = []
+        if max_age is not None:
+            conds.append({"timestamp": {"$gte": int(now - max_age)}})
+        if min_age > 0:
+            conds.append({"timestamp": {"$lt": int(now - min_age)}})
+        if len(conds) == 1:
+            return conds[0]
+        return {"$and": conds}
+
+    def _rerank_by_recency(self, docs: List[Dict[str, Any]], now: float) -> List[Dict[str, Any]]:
+        """
+        时间衰减重排: 排名得分 1 / (rrf_k + rank) 乘以 0.5 ^ (消息年龄 / 半衰期)
+        """
+        def _score(item):
+            rank, d = item
+            ts = (d.get("metadata") or {}).get("timestamp")
+            age = max(0.0, now - ts) if isinstance(ts, (int, float)) else 0.0
+            return (1.0 / (self._rrf_k + rank + 1)) * 0.5 ** (age / self._recency_half_life)
+        return [d for _, d in sorted(enumerate(docs), key=_score, reverse=True)]
@@ -1,6 +1,8 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+import asyncio
 from src.model.qwen_client import QwenClient
-from src.prompts.prompts import SAFETY_CHECK_PROMPT
+from src.safety.safety_prefilter import SafetyPrefilter
+from src.prompts.prompts import SAFETY_CHECK_PROMPT, SAFETY_BATCH_CHECK_PROMPT
 
 
 class SafetyChecker:
@@ -10,9 +12,62 @@ class SafetyChecker:
     负责对 Agent 生成的回复进行安全检查，确保不包含
     政治敏感、色情暴力、侮辱谩骂等不适宜内容。
     """
-    def __init__(self, client: QwenClient, model: str):
+    # 响应缓存有效期 (秒)：相同候选文本的安全判定结果稳定，缓存一天
+    CACHE_TTL = 86400
+
+    def __init__(self, client: QwenClient, model: str, prefilter: Optional[SafetyPrefilter] = None):
+        """
+        Args:
+            client: LLM 客户端
+            model: 模型名称
+            prefilter: 可选的本地预过滤器，只有判定为 uncertain 的候选才调用 LLM
+        """
         self._client = client
         self._model = model
+        self._prefilter = prefilter
+
+    @staticmethod
+    def is_blocked(verdict: Dict[str, Any]) -> bool:
+        """
+        判断检查结果是否应拦截该回复
+        """
+        return bool(
+            verdict.get("safety_risk")
+            or verdict.get("emergency_brake")
+            or verdict.get("is_safe") is False
+        )
+
+    def _build_messages(self, reply_content: str) -> List[Dict[str, str]]:
+        user_prompt = SAFETY_CHECK_PROMPT.replace("{reply_content}", str(reply_content))
+        return [
+            {"role": "system", "content": "你是回复安全检测助手，严格输出JSON对象。"},
+            {"role": "user", "content": user_prompt},
+        ]
+
+    def _build_batch_messages(self, reply_contents: List[str]) -> List[Dict[str, str]]:
+        reply_list = "\n".join(f"{i}. {text}" for i, text in enumerate(reply_contents, start=1))
+        user_prompt = SAFETY_BATCH_CHECK_PROMPT.replace("{reply_list}", reply_list)
+        return [
+            {"role": "system", "content": "你是回复安全检测助手，严格输出JSON对象。"},
+            {"role": "user", "content": user_prompt},
+        ]
+
+    @staticmethod
+    def _split_batch(count: int, resp: Dict[str, Any]) -> List[Dict[str, Any] | None]:
+        """
+        按编号拆分批量结果，缺失的编号对应 None
+        """
+        verdicts: List[Dict[str, Any] | None] = [None] * count
+        for item in resp.get("results") or []:
+            if not isinstance(item, dict):
+                continue
+            try:
+                idx = int(item.get("index")) - 1
+            except (TypeError, ValueError):
+                continue
+            if 0 <= idx < count:
+                verdicts[idx] = item
+        return verdicts
 
     def check(self, reply_content: str) -> Dict[str, Any]:
         """
@@ -24,11 +79,90 @@ class SafetyChecker:
         Returns:
             Dict: 包含 is_safe 字段的检查结果
         """
-        user_prompt = SAFETY_CHECK_PROMPT.replace("{reply_content}", str(reply_content))
-        messages = [
-            {"role": "system", "content": "你是回复安全检测助手，严格输出JSON对象。"},
-            {"role": "user", "content": user_prompt},
-        ]
-        resp = self._client.chat_json(self._model, messages, temperature=0.0)
+        messages = self._build_messages(reply_content)
+        resp = self._client.chat_json(self._model, messages, temperature=0.0, cache_ttl=self.CACHE_TTL)
         return resp
 
+    async def acheck(self, reply_content: str) -> Dict[str, Any]:
+        """
+        检查回复内容安全性 (异步版本)
+        """
+        messages = self._build_messages(reply_content)
+        return await self._client.achat_json(self._model, messages, temperature=0.0, cache_ttl=self.CACHE_TTL)
+
+    def check_batch(self, reply_contents: List[str]) -> List[Dict[str, Any]]:
+        """
+        一次调用批量检查多条回复
+        
+        Args:
+            reply_contents: 回复内容列表
+            
+        Returns:
+            List[Dict]: 与输入顺序一致的检查结果；批量结果中缺失的条目单独补查
+        """
+        if not reply_contents:
+            return []
+        messages = self._build_batch_messages(reply_contents)
+        resp = self._client.chat_json(self._model, messages, temperature=0.0, cache_ttl=self.CACHE_TTL)
+        verdicts = self._split_batch(len(reply_contents), resp)
+        return [v if v is not None else self.check(text) for v, text in zip(verdicts, reply_contents)]
+
+    async def acheck_batch(self, reply_contents: List[str]) -> List[Dict[str, Any]]:
+        """
+        一次调用批量检查多条回复 (异步版本)
+        """
+        if not reply_contents:
+            return []
+        messages = self._build_batch_messages(reply_contents)
+        resp = await self._client.achat_json(self._model, messages, temperature=0.0, cache_ttl=self.CACHE_TTL)
+        verdicts = self._split_batch(len(reply_contents), resp)
+        missing = [i for i, v in enumerate(verdicts) if v is None]
+        if missing:
+            retried = await asyncio.gather(*(self.acheck(reply_contents[i]) for i in missing))
+            for i, v in zip(missing, retried):
+                verdicts[i] = v
+        return verdicts
+
+    async def acheck_all(self, reply_contents: List[str], batch: bool = True) -> List[Dict[str, Any]]:
+        """
+        检查全部候选回复
+        
+        配置了预过滤器时，先做本地判定，只有 uncertain 的候选才送 LLM 复核。
+        
+        Args:
+            reply_contents: 回复内容列表
+            batch: True 时合并为一次调用；False 时逐条并发检查
+            
+        Returns:
+            List[Dict]: 与输入顺序一致的检查结果
+        """
+        verdicts: List[Dict[str, Any] | None] = [None] * len(reply_contents)
+        if self._prefilter is not None:
+            for i, text in enumerate(reply_contents):
+                local = self._prefilter.classify(text)
+                if local["decision"] == SafetyPrefilter.PASS:
+                    verdicts[i] = {"is_safe": True, "risk_category": "无", "reason": "本地预过滤放行", "source": "prefilter"}
+                elif local["decision"] == SafetyPrefilter.BLOCK:
+                    verdicts[i] = {
+                        "is_safe": False,
+                        "risk_category": "本地敏感词",
+                        "reason": f"命中敏感词: {', '.join(local['hits'])}",
+                        "source": "prefilter",
+                    }
+
+        pending = [i for i, v in enumerate(verdicts) if v is None]
+        if pending:
+            texts = [reply_contents[i] for i in pending]
+            if batch:
+                checked = await self.acheck_batch(texts)
+            else:
+                checked = await asyncio.gather(*(self.acheck(text) for text in texts))
+            for i, v in zip(pending, checked):
+                verdicts[i] = v
+        return verdicts
+
+    def prefilter_stats(self) -> Dict[str, Any]:
+        """
+        获取本地预过滤统计
+        """
+        return self._prefilter.stats() if self._prefilter is not None else {}
@@ -0,0 +1,162 @@
+from typing import Dict, Any, Iterable, List, Optional
+from collections import deque
+import json
+import re
+import threading
+
+# 命中即直接拦截的高危词 (辱骂 / 暴力威胁 / 明确违法)
+DEFAULT_BLOCK_TERMS = [
+    "傻逼", "煞笔", "操你", "草泥马", "你妈的", "贱人", "婊子", "去死吧", "杀了你", "弄死你",
+    "砍死你", "打死你", "约炮", "卖淫", "嫖娼", "吸毒", "贩毒",
+]
+
+# 命中后无法本地判定、需要交给 LLM 复核的敏感词
+# 只收录多字短语: 单字 (杀、刀、胸、党…) 会命中 "杀时间""刀削面""胸有成竹" 这类日常用语，使大部分消息都送 LLM 复核
+DEFAULT_DOUBT_TERMS = [
+    "去死", "想死", "自杀", "割腕", "跳楼", "轻生", "自残", "杀人", "捅你", "开枪", "持刀", "流血",
+    "下毒", "毒品", "赌博", "赌钱",
+    "开房", "上床", "睡你", "裸照", "裸体", "性感", "胸部", "身材", "脱光", "脱衣服",
+    "滚开", "滚蛋", "闭嘴", "蠢货", "蠢猪", "废物", "恶心", "丑八怪",
+    "政治", "政府", "共产党", "国民党", "主席", "领导人", "游行", "抗议", "示威", "台独", "宗教",
+]
+
+_NORMALIZE_RE = re.compile(r"[\s　`~!@#$%^&*()_\-+=\[\]{}|\;:'\",.<>/?，。！？、；：“”‘’（）【】《》…·]+")
+
+
+class _AhoCorasick:
+    """
+    Aho-Corasick 多模式匹配自动机
+
+    一次扫描即可找出文本中出现的所有词条，耗时与文本长度线性相关，与词表大小无关。
+    """
+    def __init__(self, patterns: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]
+        for p in patterns:
+            if p:
+                self._insert(p)
+        self._build()
+
+    def _insert(self, pattern: str):
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = nxt
+        self._output[node].append(pattern)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+    def find_all(self, text: str) -> List[str]:
+        """
+        返回文本中命中的全部词条 (去重，按首次出现顺序)
+        """
+        hits: List[str] = []
+        seen = set()
+        node = 0
+        for ch in text:
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for p in self._output[node]:
+                if p not in seen:
+                    seen.add(p)
+                    hits.append(p)
+        return hits
+
+
+class SafetyPrefilter:
+    """
+    本地安全预过滤器
+
+    基于敏感词表的快速判定，放在 LLM 安全检查之前：
+    - pass: 未命中任何词条且长度正常，直接放行
+    - block: 命中高危词，直接拦截
+    - uncertain: 命中需复核的敏感词 (或文本过长)，交给 SafetyChecker 调用 LLM 判断
+    """
+    PASS = "pass"
+    BLOCK = "block"
+    UNCERTAIN = "uncertain"
+
+    def __init__(
+        self,
+        block_terms: Optional[List[str]] = None,
+        doubt_terms: Optional[List[str]] = None,
+        lexicon_path: Optional[str] = None,
+        max_pass_length: int = 200,
+    ):
+        """
+        初始化预过滤器
+
+        Args:
+            block_terms: 高危词表，默认使用 DEFAULT_BLOCK_TERMS
+            doubt_terms: 待复核词表，默认使用 DEFAULT_DOUBT_TERMS
+            lexicon_path: 可选的 JSON 词表文件 ({"block": [...], "doubt": [...]})，与默认词表合并
+            max_pass_length: 超过该长度的文本不直接放行
+        """
+        block = list(block_terms if block_terms is not None else DEFAULT_BLOCK_TERMS)
+        doubt = list(doubt_terms if doubt_terms is not None else DEFAULT_DOUBT_TERMS)
+        if lexicon_path:
+            with open(lexicon_path, "r", encoding="utf-8") as f:
+                extra = json.load(f)
+            block.extend(extra.get("block", []))
+            doubt.extend(extra.get("doubt", []))
+        self._block = {self._normalize(t) for t in block if t}
+        self._doubt = {self._normalize(t) for t in doubt if t}
+        self._matcher = _AhoCorasick(self._block | self._doubt)
+        self._max_pass_length = max_pass_length
+        self._lock = threading.Lock()
+        self._stats = {self.PASS: 0, self.BLOCK: 0, self.UNCERTAIN: 0}
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        # 去掉空白与标点，避免“傻 逼”“傻.逼”之类的间隔绕过
+        return _NORMALIZE_RE.sub("", text).lower()
+
+    def classify(self, text: str) -> Dict[str, Any]:
+        """
+        对单条文本做本地判定
+        
+        Args:
+            text: 待检查文本
+            
+        Returns:
+            Dict: {"decision": pass/block/uncertain, "hits": 命中的词条}
+        """
+        hits = self._matcher.find_all(self._normalize(text or ""))
+        if any(h in self._block for h in hits):
+            decision = self.BLOCK
+        elif hits or len(text or "") > self._max_pass_length:
+            decision = self.UNCERTAIN
+        else:
+            decision = self.PASS
+        with self._lock:
+            self._stats[decision] += 1
+        return {"decision": decision, "hits": hits}
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取判定统计 (含跳过 LLM 的比例)
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        total = sum(stats.values())
+        stats["total"] = total
+        stats["llm_skipped_ratio"] = round((stats[self.PASS] + stats[self.BLOCK]) / total, 4) if total else 0.0
+        return stats
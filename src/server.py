@@ -1,8 +1,11 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 import os
 import sys
+import json
+import asyncio
 import base64
 
 # 将项目根目录添加到系统路径，以便导入 src 模块
@@ -27,6 +30,27 @@ except Exception as e:
     print(f"Error initializing LoveAgent: {e}")
     agent = None
 
+@app.on_event("startup")
+async def startup():
+    """
+    服务启动时启动后台任务队列 (重放未完成的任务)、预热 Embedding 并打印向量库报告 (只读元数据，不加载向量索引)，确认持久化数据已就绪
+    """
+    if agent:
+        await agent.astart()
+        for item in agent.vector_store_report():
+            print(
+                f"Vector store {item['collection']}: {item['count']} items "
+                f"(persistent={item['persistent']}, partition={item['partition']}, partitions={item['partitions']})"
+            )
+
+@app.on_event("shutdown")
+async def shutdown():
+    """
+    服务关闭时释放 LLM 连接池
+    """
+    if agent:
+        await agent.aclose()
+
 # --- 数据模型定义 (Pydantic Models) ---
 
 class Message(BaseModel):
@@ -82,6 +106,9 @@ class ChatRequest(BaseModel):
     target_gender: Optional[str] = Field(None, description="对方性别 (可选)")
     messages: List[Message] = Field(default=[], description="完整的对话历史记录 (可选)")
     new_message: Optional[Message] = Field(None, description="最新的一条消息 (推荐使用此字段进行增量更新)")
+    fused_analysis: Optional[bool] = Field(None, description="是否使用合并分析模式 (一次 LLM 调用完成情绪/话题/意图/画像/关系分析)，不传则使用服务端默认配置")
+    speculative: Optional[bool] = Field(None, description="是否启用推测生成 (用上一轮策略提前生成回复，与策略规划并行)，不传则使用服务端默认配置")
+    deadline_ms: Optional[int] = Field(None, ge=0, description="本次请求的时间预算 (毫秒)，来不及完成的阶段使用上次保存的结果或空结果。不传则使用服务端默认配置，0 为不限")
 
 class Reply(BaseModel):
     """
@@ -105,6 +132,12 @@ class Analysis(BaseModel):
     radar: Optional[Dict[str, Any]] = Field(None, description="关系雷达评分")
     overall_analysis: Optional[str] = Field(None, description="整体局势分析")
     action_guide: Optional[Dict[str, Any]] = Field(None, description="关键行动指南")
+    analysis_mode: Optional[str] = Field(None, description="分析模式: 'fused' (合并调用) 或 'separate' (分项调用)")
+    prompt_usage: Optional[Dict[str, Any]] = Field(None, description="回复生成提示词的 token 用量 (预算、总量及各段落用量)")
+    speculation: Optional[Dict[str, Any]] = Field(None, description="推测生成结果: 是否命中、策略相似度、节省的时间 (未推测时为空)")
+    stale: Optional[List[str]] = Field(None, description="因超出时间预算而沿用旧值或留空的分析字段")
+    reused: Optional[List[str]] = Field(None, description="对话变化不大、直接沿用上次结果的分析 (persona / relationship)")
+    pipeline: Optional[Dict[str, Any]] = Field(None, description="流水线各阶段的起止耗时与关键路径")
 
 class ChatResponse(BaseModel):
     """
@@ -210,7 +243,7 @@ async def profile(session_id: str):
         # Get structured profile data
         profile_data = agent.get_profile(session_id)
         # Generate summary
-        summary = agent.generate_profile_summary(session_id)
+        summary = await agent.agenerate_profile_summary(session_id)
         
         return {
             "summary": summary,
@@ -237,10 +270,26 @@ async def radar(session_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics")
+async def metrics():
+    """
+    获取运行指标
+
+    包含 LLM 响应缓存的命中/未命中计数等。
+    """
+    if not agent:
+        raise HTTPException(status_code=500, detail="LoveAgent not initialized properly.")
+    return agent.get_metrics()
+
+# /history 单页最多返回的条数
+HISTORY_PAGE_MAX = 500
+
 @app.get("/history")
-async def history(session_id: str):
+async def history(session_id: str, cursor: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=HISTORY_PAGE_MAX)):
     """
     获取聊天历史记录
+    
+    不传 cursor/limit 时返回全部历史；否则按页返回 (从最新往更早翻页)。
     """
     if not agent:
         raise HTTPException(status_code=500, detail="LoveAgent not initialized properly.")
@@ -254,8 +303,28 @@ async def history(session_id: str):
         # However, `_state_manager` is accessible in python.
         # Better: use `agent._state_manager.get_history(session_id)`
         
-        history_data = agent._state_manager.get_history(session_id)
-        return {"history": history_data}
+        if cursor is None and limit is None:
+            history_data = agent._state_manager.get_history(session_id)
+            return {"history": history_data}
+        page = agent._state_manager.get_history_page(session_id, cursor=cursor, limit=limit or 50)
+        return {"history": page["messages"], "next_cursor": page["next_cursor"]}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/history/search")
+async def search_history(session_id: str, q: str, limit: int = 10):
+    """
+    在聊天历史中查找实体 (片名、地名等)
+
+    只查询 BM25 词项索引 (retrieval.hybrid 关闭时返回空列表)。
+    """
+    if not agent:
+        raise HTTPException(status_code=500, detail="LoveAgent not initialized properly.")
+    try:
+        results = await agent.search_history(session_id, q, limit=limit)
+        return {"results": results}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -269,7 +338,7 @@ async def initiative(session_id: str):
     if not agent:
         raise HTTPException(status_code=500, detail="LoveAgent not initialized properly.")
     try:
-        return agent.generate_initiative(session_id)
+        return await agent.agenerate_initiative(session_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -319,7 +388,7 @@ async def chat(request: ChatRequest):
             latest_msg = request.messages[-1]
             
         if latest_msg and latest_msg.type == "image" and latest_msg.url:
-            reply_text = agent.handle_image(request.session_id, latest_msg.url)
+            reply_text = await agent.ahandle_image(request.session_id, latest_msg.url)
             return {
                 "replies": [{"text": reply_text, "reason": "基于图片内容的视觉理解"}],
                 "analysis": {
@@ -350,6 +419,64 @@ async def chat(request: ChatRequest):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """
+    编码一条 Server-Sent Event
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    流式聊天接口 (Server-Sent Events)
+    
+    与 /chat 相同的处理流程，但每个阶段完成后立即推送部分结果:
+    analysis -> subtext -> strategy -> token (生成增量) -> reply (逐条通过安全检查的候选) -> done (完整结果)。
+    出错时推送 error 事件。
+    """
+    if not agent:
+        raise HTTPException(status_code=500, detail="LoveAgent not initialized properly.")
+
+    latest_msg = request.new_message or (request.messages[-1] if request.messages else None)
+    input_data = request.model_dump()
+
+    async def event_stream():
+        if latest_msg and latest_msg.type == "image" and latest_msg.url:
+            reply_text = await agent.ahandle_image(request.session_id, latest_msg.url)
+            yield _sse("done", {
+                "replies": [{"text": reply_text, "reason": "基于图片内容的视觉理解"}],
+                "analysis": {"emotion": {}, "topics": ["图片分享"], "persona": {}, "strategy": {}, "subtext": {}},
+            })
+            return
+
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def on_event(event: str, data: Dict[str, Any]):
+            await queue.put((event, data))
+
+        async def run():
+            try:
+                result = await agent.generate_replies(input_data, on_event=on_event)
+                await queue.put(("done", result))
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                await queue.put(("error", {"detail": str(e)}))
+
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event, data = await queue.get()
+                yield _sse(event, data)
+                if event in ("done", "error"):
+                    break
+        finally:
+            # 客户端断开时取消仍在运行的流水线
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8090)
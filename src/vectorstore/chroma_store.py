@@ -1,7 +1,13 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+import hashlib
 import os
-import chromadb
-from chromadb.config import Settings
+import threading
+import time
+from src.vectorstore.embedding_service import EmbeddingService
+
+# 按会话分区的方式
+PARTITION_MODES = ("none", "where", "collection")
 
 
 class ChromaStore:
@@ -9,39 +15,249 @@ class ChromaStore:
     ChromaDB 向量数据库封装
     
     负责文本数据的向量化存储和检索。
+    默认使用 PersistentClient 把数据写入 persist_directory，服务重启后无需重新摄入；
+    集合在第一次使用时才打开，向量索引由 Chroma 在首次查询时从磁盘加载，
+    因此以首次查询的耗时 (含打开集合与加载索引) 作为加载耗时。
     """
-    def __init__(self, persist_directory: str, collection_name: str):
+    def __init__(
+        self,
+        persist_directory: str,
+        collection_name: str,
+        batch_size: int = 512,
+        embedding_service: Optional[EmbeddingService] = None,
+        persistent: bool = True,
+        partition: str = "none",
+        max_open_partitions: int = 64,
+    ):
         """
         初始化向量数据库
         
         Args:
             persist_directory: 数据持久化目录
             collection_name: 集合名称
+            batch_size: 批量查重/写入时每批的 ID 数量
+            embedding_service: 共享的查询向量服务，为空则单独创建一个
+            persistent: 是否持久化到磁盘，False 时使用进程内的临时库 (重启即丢失)
+            partition: 按会话分区的方式
+                - none: 不分区，所有会话共用一个集合
+                - where: 共用一个集合，读写时强制附加 session_id 过滤条件
+                - collection: 每个会话一个集合，按需打开
+            max_open_partitions: collection 分区模式下同时保持打开的集合数 (LRU)
+        """
+        if partition not in PARTITION_MODES:
+            raise ValueError(f"Unknown partition mode: {partition}")
+        # 延迟导入: 使用 numpy 后端时不需要加载 chromadb
+        import chromadb
+        from chromadb.config import Settings
+
+        settings = Settings(allow_reset=True, anonymized_telemetry=False)
+        if persistent:
+            self._client = chromadb.PersistentClient(path=persist_directory, settings=settings)
+        else:
+            self._client = chromadb.EphemeralClient(settings=settings)
+        self._persistent = persistent
+        self._collection_name = collection_name
+        # 查询向量统一由 EmbeddingService 计算并缓存，文档向量同样由它计算后显式写入
+        # (集合不绑定 Embedding 函数，因此可以使用任意提供方)
+        self._embeddings = embedding_service or EmbeddingService()
+        self._coll = None
+        self._coll_lock = threading.Lock()
+        self._partition = partition
+        self._max_open_partitions = max_open_partitions
+        self._partitions: "OrderedDict[str, Any]" = OrderedDict()
+        self._load_ms: Optional[float] = None
+        # 不超过服务端允许的单批上限
+        max_batch = getattr(self._client, "get_max_batch_size", lambda: batch_size)()
+        self._batch_size = max(1, min(batch_size, max_batch))
+
+    @property
+    def _collection(self):
+        """
+        延迟打开集合 (第一次读写时)
+        """
+        if self._coll is None:
+            with self._coll_lock:
+                if self._coll is None:
+                    self._coll = self._client.get_or_create_collection(name=self._collection_name)
+        return self._coll
+
+    def _partition_name(self, session_id: str) -> str:
+        # 会话 ID 可能含有集合名不允许的字符，统一取哈希
+        digest = hashlib.sha1(session_id.encode("utf-8")).hexdigest()[:16]
+        return f"{self._collection_name}-s-{digest}"
+
+    def _resolve(self, session_id: Optional[str]):
+        """
+        获取本次读写应使用的集合
+
+        Args:
+            session_id: 会话 ID，分区模式下必填
+
+        Returns:
+            Collection: 未分区或 where 分区时为共享集合，collection 分区时为该会话的集合
+        """
+        if self._partition == "none":
+            return self._collection
+        if not session_id:
+            raise ValueError(f"session_id is required for partitioned collection {self._collection_name}")
+        if self._partition == "where":
+            return self._collection
+        with self._coll_lock:
+            coll = self._partitions.get(session_id)
+            if coll is not None:
+                self._partitions.move_to_end(session_id)
+                return coll
+            coll = self._client.get_or_create_collection(name=self._partition_name(session_id))
+            self._partitions[session_id] = coll
+            while len(self._partitions) > self._max_open_partitions:
+                self._partitions.popitem(last=False)
+            return coll
+
+    def _scope_where(self, where: Optional[Dict[str, Any]], session_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        where 分区模式下给过滤条件附加 session_id
+        """
+        if self._partition != "where":
+            return where if where else None
+        scope = {"session_id": session_id}
+        if not where:
+            return scope
+        return {"$and": [where, scope]}
+
+    def _scope_metadatas(self, metadatas: List[Dict[str, Any]], session_id: Optional[str]) -> List[Dict[str, Any]]:
+        """
+        where 分区模式下确保写入的元数据带有 session_id
         """
-        self._client = chromadb.Client(Settings(persist_directory=persist_directory, allow_reset=True))
-        self._collection = self._client.get_or_create_collection(name=collection_name)
+        if self._partition != "where":
+            return metadatas
+        return [dict(m or {}, session_id=session_id) for m in metadatas]
 
-    def add_texts(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+    def describe(self) -> Dict[str, Any]:
+        """
+        获取集合概况
+
+        只读取 Chroma 的集合元数据 (不创建集合、不加载向量索引)；
+        collection 分区模式下统计所有会话集合。
+
+        Returns:
+            Dict: 集合名称、条数、分区数、首次查询耗时 (毫秒，尚未查询时为 None) 以及是否持久化
+        """
+        prefix = f"{self._collection_name}-s-"
+        names = [getattr(c, "name", c) for c in self._client.list_collections()]
+        if self._partition == "collection":
+            targets = [n for n in names if n.startswith(prefix)]
+        else:
+            targets = [n for n in names if n == self._collection_name]
+        count = sum(self._client.get_collection(name=n).count() for n in targets)
+        return {
+            "collection": self._collection_name,
+            "count": count,
+            "load_ms": self._load_ms,
+            "persistent": self._persistent,
+            "partition": self._partition,
+            "partitions": len(targets) if self._partition == "collection" else 0,
+            "open_partitions": len(self._partitions),
+        }
+
+    def add_texts(
+        self,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        session_id: Optional[str] = None,
+    ):
         """
         添加文本到向量库
+        
+        Args:
+            session_id: 所属会话，分区模式下必填
         """
-        self._collection.add(ids=ids, documents=texts, metadatas=metadatas)
+        coll = self._resolve(session_id)
+        coll.add(
+            ids=ids,
+            documents=texts,
+            embeddings=self._embeddings.embed_documents(texts),
+            metadatas=self._scope_metadatas(metadatas, session_id),
+        )
 
-    def has_id(self, id: str) -> bool:
+    def has_id(self, id: str, session_id: Optional[str] = None) -> bool:
         """
         检查指定 ID 是否已存在
         """
-        res = self._collection.get(ids=[id])
+        res = self._resolve(session_id).get(ids=[id], include=[])
         return bool(res.get("ids"))
 
-    def add_text_if_not_exists(self, id: str, text: str, metadata: Dict[str, Any]):
+    def add_text_if_not_exists(self, id: str, text: str, metadata: Dict[str, Any], session_id: Optional[str] = None):
         """
         如果 ID 不存在则添加文本（用于去重）
         """
-        if not self.has_id(id):
-            self._collection.add(ids=[id], documents=[text], metadatas=[metadata])
+        if not self.has_id(id, session_id=session_id):
+            self.add_texts([id], [text], [metadata], session_id=session_id)
+
+    def add_texts_if_not_exist(
+        self,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        chunk_size: Optional[int] = None,
+        session_id: Optional[str] = None,
+    ) -> int:
+        """
+        批量添加文本，已存在的 ID 跳过（用于去重）
+        
+        按块执行: 每块一次 get 查询已存在的 ID，再一次 add 写入缺失的部分，
+        只有真正新增的文本才会计算 Embedding。
+        
+        Args:
+            ids: ID 列表
+            texts: 文本列表
+            metadatas: 元数据列表
+            chunk_size: 每块的 ID 数量，为空则使用初始化时的 batch_size
+            session_id: 所属会话，分区模式下必填
+            
+        Returns:
+            int: 实际新增的条数
+        """
+        chunk_size = chunk_size or self._batch_size
+        coll = self._resolve(session_id)
+        metadatas = self._scope_metadatas(metadatas, session_id)
+        added = 0
+        for start in range(0, len(ids), chunk_size):
+            chunk_ids = ids[start:start + chunk_size]
+            existing = set(coll.get(ids=chunk_ids, include=[]).get("ids") or [])
+            new_ids, new_texts, new_metas = [], [], []
+            for i, id in enumerate(chunk_ids):
+                if id in existing:
+                    continue
+                # 同一块内重复的 ID 只保留第一条
+                existing.add(id)
+                new_ids.append(id)
+                new_texts.append(texts[start + i])
+                new_metas.append(metadatas[start + i])
+            if new_ids:
+                coll.add(
+                    ids=new_ids,
+                    documents=new_texts,
+                    embeddings=self._embeddings.embed_documents(new_texts),
+                    metadatas=new_metas,
+                )
+                added += len(new_ids)
+        return added
+
+    def embed_query(self, query: str) -> List[float]:
+        """
+        计算查询文本的向量 (经共享缓存，供多次 similarity_search 复用)
+        """
+        return self._embeddings.embed_query(query)
 
-    def similarity_search(self, query: str, n_results: int = 5, where: Dict[str, Any] | None = None):
+    def similarity_search(
+        self,
+        query: str,
+        n_results: int = 5,
+        where: Dict[str, Any] | None = None,
+        query_embedding: Optional[List[float]] = None,
+        session_id: Optional[str] = None,
+    ):
         """
         执行相似度搜索
         
@@ -49,13 +265,23 @@ class ChromaStore:
             query: 查询文本
             n_results: 返回结果数量
             where: 过滤条件 (Metadata 过滤)
+            query_embedding: 预先计算好的查询向量，为空则经共享缓存计算 query 的向量
+            session_id: 只检索该会话的数据，分区模式下必填
             
         Returns:
             List[Dict]: 包含 id, text, metadata, distance 的结果列表
         """
-        # 处理空 where 子句，如果是空字典则传入 None
-        query_where = where if where else None
-        res = self._collection.query(query_texts=[query], n_results=n_results, where=query_where)
+        if n_results <= 0:
+            return []
+        # 处理空 where 子句，如果是空字典则传入 None；where 分区模式下附加 session_id
+        query_where = self._scope_where(where, session_id)
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+        start = time.time()
+        coll = self._resolve(session_id)
+        res = coll.query(query_embeddings=[query_embedding], n_results=n_results, where=query_where)
+        if self._load_ms is None:
+            self._load_ms = round((time.time() - start) * 1000, 3)
         docs = []
         for i in range(len(res["documents"][0])):
             docs.append(
@@ -0,0 +1,178 @@
+from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+
+# Embedding 提供方
+EMBEDDING_PROVIDERS = ("chroma", "dashscope")
+
+
+class APIEmbeddingFunction:
+    """
+    基于 OpenAI 兼容接口的 Embedding 函数 (默认 DashScope text-embedding-v3)
+
+    不依赖 chromadb，numpy 后端默认使用；复用 DASHSCOPE_API_KEY / OPENAI_BASE_URL 环境变量。
+    """
+    def __init__(self, model: str = "text-embedding-v3", batch_size: int = 10, dimensions: Optional[int] = None):
+        """
+        Args:
+            model: Embedding 模型名称
+            batch_size: 每次请求的文本条数 (DashScope 单次上限为 10)
+            dimensions: 输出向量维度，为空则使用模型默认值
+        """
+        from openai import OpenAI
+
+        api_key = os.getenv("DASHSCOPE_API_KEY")
+        base_url = os.getenv("OPENAI_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+        self._client = OpenAI(api_key=api_key, base_url=base_url) if api_key else None
+        self._model = model
+        self._batch_size = max(1, batch_size)
+        self._dimensions = dimensions
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        if self._client is None:
+            raise RuntimeError("DASHSCOPE_API_KEY 未设置，无法计算 Embedding。")
+        kwargs = {"dimensions": self._dimensions} if self._dimensions else {}
+        vectors = []
+        for start in range(0, len(input), self._batch_size):
+            resp = self._client.embeddings.create(
+                model=self._model, input=list(input[start:start + self._batch_size]), **kwargs
+            )
+            vectors.extend(item.embedding for item in sorted(resp.data, key=lambda d: d.index))
+        return vectors
+
+
+def build_embedding_function(
+    provider: Optional[str] = None,
+    backend: str = "chroma",
+    model: str = "text-embedding-v3",
+    batch_size: int = 10,
+    dimensions: Optional[int] = None,
+) -> Any:
+    """
+    按配置创建 Embedding 函数
+
+    Args:
+        provider: chroma (Chroma 自带的本地 ONNX 模型，需要 chromadb) 或 dashscope (API)，
+            为空时 chroma 后端使用 chroma，numpy 后端使用 dashscope
+        backend: 向量库后端
+        model / batch_size / dimensions: dashscope 提供方的参数
+
+    Returns:
+        可调用对象: 文本列表 -> 向量列表
+    """
+    provider = provider or ("dashscope" if backend == "numpy" else "chroma")
+    if provider not in EMBEDDING_PROVIDERS:
+        raise ValueError(f"Unknown embedding provider: {provider}")
+    if provider == "dashscope":
+        return APIEmbeddingFunction(model=model, batch_size=batch_size, dimensions=dimensions)
+    from chromadb.utils import embedding_functions
+    return embedding_functions.DefaultEmbeddingFunction()
+
+
+class EmbeddingService:
+    """
+    查询向量服务
+
+    由所有向量库共享，负责计算查询文本的 Embedding：
+    1. 按文本哈希缓存在有界 LRU 中，同一请求内多次检索同一文本只计算一次
+    2. 支持启动时预热固定查询语句 (如 "用户喜好 习惯")
+    """
+    def __init__(self, embedding_fn: Optional[Any] = None, max_entries: int = 4096):
+        """
+        Args:
+            embedding_fn: Embedding 函数 (文本列表 -> 向量列表)，
+                为空则在首次使用时创建 Chroma 自带的默认模型
+            max_entries: 缓存的最大向量条数
+        """
+        self._embedding_fn = embedding_fn
+        self._max_entries = max_entries
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    @property
+    def embedding_fn(self) -> Any:
+        """
+        实际使用的 Embedding 函数 (未指定时延迟创建默认模型)
+        """
+        if self._embedding_fn is None:
+            with self._lock:
+                if self._embedding_fn is None:
+                    self._embedding_fn = build_embedding_function("chroma")
+        return self._embedding_fn
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        计算文档向量 (不经缓存，供不自带 Embedding 的向量库写入时使用)
+        """
+        if not texts:
+            return []
+        return [[float(x) for x in v] for v in self.embedding_fn(texts)]
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        批量计算查询向量，只对未命中缓存的文本调用模型
+
+        Args:
+            texts: 查询文本列表
+
+        Returns:
+            List[List[float]]: 与输入顺序一致的向量列表
+        """
+        keys = [self._key(t) for t in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        missing: Dict[str, List[int]] = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                vec = self._cache.get(key)
+                if vec is not None:
+                    self._cache.move_to_end(key)
+                    self._stats["hits"] += 1
+                    results[i] = vec
+                else:
+                    self._stats["misses"] += 1
+                    missing.setdefault(key, []).append(i)
+
+        if missing:
+            miss_keys = list(missing.keys())
+            miss_texts = [texts[missing[k][0]] for k in miss_keys]
+            vectors = [[float(x) for x in v] for v in self.embedding_fn(miss_texts)]
+            with self._lock:
+                for key, vec in zip(miss_keys, vectors):
+                    for i in missing[key]:
+                        results[i] = vec
+                    self._cache[key] = vec
+                    self._cache.move_to_end(key)
+                while len(self._cache) > self._max_entries:
+                    self._cache.popitem(last=False)
+        return results
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        计算单条查询文本的向量 (带缓存)
+        """
+        return self.embed_queries([text])[0]
+
+    def warm_up(self, texts: List[str]):
+        """
+        预先计算固定查询语句的向量
+        """
+        if texts:
+            self.embed_queries(texts)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._cache)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,58 @@
+from typing import Any, Dict, Optional
+
+
+def match_where(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """
+    判断元数据是否满足 Chroma 风格的 where 过滤条件
+
+    支持 字段等值、$eq/$ne/$gt/$gte/$lt/$lte/$in/$nin 以及 $and/$or 组合。
+
+    Args:
+        metadata: 元数据字典
+        where: 过滤条件，为空表示不过滤
+
+    Returns:
+        bool: 是否匹配
+    """
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(match_where(metadata, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(match_where(metadata, c) for c in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = metadata.get(key)
+            for op, target in cond.items():
+                if not compare_value(value, op, target):
+                    return False
+        elif metadata.get(key) != cond:
+            return False
+    return True
+
+
+def compare_value(value: Any, op: str, target: Any) -> bool:
+    """
+    对单个字段值求值一个比较运算 (None 与任何值的大小比较均为 False)
+    """
+    if op == "$eq":
+        return value == target
+    if op == "$ne":
+        return value != target
+    if op == "$in":
+        return value in target
+    if op == "$nin":
+        return value not in target
+    if value is None:
+        return False
+    if op == "$gt":
+        return value > target
+    if op == "$gte":
+        return value >= target
+    if op == "$lt":
+        return value < target
+    if op == "$lte":
+        return value <= target
+    raise ValueError(f"Unsupported where operator: {op}")
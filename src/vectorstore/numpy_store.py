@@ -0,0 +1,494 @@
+from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+import time
+import numpy as np
+from src.vectorstore.chroma_store import PARTITION_MODES
+from src.vectorstore.embedding_service import EmbeddingService
+from src.vectorstore.metadata_filter import compare_value
+
+# 可在数值列上向量化求值的比较运算
+_NUMERIC_OPS = {"$gt": np.greater, "$gte": np.greater_equal, "$lt": np.less, "$lte": np.less_equal}
+
+
+class NumpyStore:
+    """
+    纯 NumPy 向量库
+
+    与 ChromaStore 接口一致的进程内实现，适合中小规模部署：
+    1. 向量以 float32 (已归一化) 存放在内存映射的矩阵文件 vectors.f32 中
+    2. id / 文本 / 元数据存放在追加写的 meta.jsonl 旁表中
+    3. 检索为分块向量化的暴力余弦相似度，where 条件在按需构建的元数据列上向量化求值
+       (时间戳等数值字段为 float64 列，范围条件不随条件取值变化而产生额外缓存)
+
+    返回的 distance 为余弦距离 (1 - 余弦相似度)。
+    """
+    def __init__(
+        self,
+        persist_directory: str,
+        collection_name: str,
+        batch_size: int = 512,
+        embedding_service: Optional[EmbeddingService] = None,
+        persistent: bool = True,
+        partition: str = "none",
+        max_open_partitions: int = 64,
+        search_block_rows: int = 65536,
+    ):
+        """
+        初始化向量库
+
+        Args:
+            persist_directory: 数据持久化目录
+            collection_name: 集合名称 (对应子目录)
+            batch_size: 批量写入时每批计算 Embedding 的条数
+            embedding_service: 共享的查询向量服务，为空则单独创建一个
+            persistent: 是否持久化到磁盘，False 时只保存在内存中
+            partition: 按会话分区的方式 (none / where / collection，含义同 ChromaStore)
+            max_open_partitions: collection 分区模式下同时保持加载的会话数 (LRU)
+            search_block_rows: 检索时每块计算的向量行数，限制临时内存
+        """
+        if partition not in PARTITION_MODES:
+            raise ValueError(f"Unknown partition mode: {partition}")
+        self._persist_directory = persist_directory
+        self._collection_name = collection_name
+        self._batch_size = max(1, batch_size)
+        self._embeddings = embedding_service or EmbeddingService()
+        self._persistent = persistent
+        self._partition = partition
+        self._max_open_partitions = max_open_partitions
+        self._search_block_rows = search_block_rows
+        self._partitions: "OrderedDict[str, NumpyStore]" = OrderedDict()
+        self._dir = os.path.join(persist_directory, collection_name)
+        self._lock = threading.RLock()
+
+        # 延迟加载，首次读写时才打开矩阵和旁表
+        self._loaded = False
+        self._load_ms: Optional[float] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._dim: Optional[int] = None
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._id_index: Dict[str, int] = {}
+        # (字段, 是否数值列) -> 元数据列 (数据只追加不修改，新增后增量扩展)
+        self._columns: Dict[tuple, np.ndarray] = {}
+
+    # --- 存储 ---
+
+    def _vectors_path(self) -> str:
+        return os.path.join(self._dir, "vectors.f32")
+
+    def _meta_path(self) -> str:
+        return os.path.join(self._dir, "meta.jsonl")
+
+    @staticmethod
+    def _parse_row(raw: bytes) -> Optional[Dict[str, Any]]:
+        """
+        解析旁表的一行，无法解析时返回 None
+
+        旧版本在残行之后直接追加，残行与下一条完整记录会拼在同一行，此时取行内最后一条记录。
+        """
+        text = raw.decode("utf-8", errors="replace").strip()
+        if not text:
+            return None
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            pos = text.rfind('{"id": ')
+            if pos <= 0:
+                return None
+            try:
+                return json.loads(text[pos:])
+            except json.JSONDecodeError:
+                return None
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            start = time.time()
+            if self._persistent and os.path.exists(self._meta_path()):
+                # 最后一个完整行 (以换行结尾) 的结束位置
+                valid_end = 0
+                with open(self._meta_path(), "rb") as f:
+                    for raw in f:
+                        if not raw.endswith(b"\n"):
+                            # 写入中断留下的残行，其向量行同样作废
+                            break
+                        valid_end += len(raw)
+                        row = self._parse_row(raw)
+                        if row is None:
+                            continue
+                        if self._dim is None:
+                            self._dim = row["dim"] if "dim" in row else None
+                        self._id_index[row["id"]] = len(self._ids)
+                        self._ids.append(row["id"])
+                        self._texts.append(row["text"])
+                        self._metadatas.append(row.get("metadata") or {})
+                if valid_end < os.path.getsize(self._meta_path()):
+                    # 截掉残行，之后的追加从新行开始；向量文件按旁表行数寻址，残行占用的向量行会被下一条覆盖
+                    with open(self._meta_path(), "r+b") as f:
+                        f.truncate(valid_end)
+                if self._ids and os.path.exists(self._vectors_path()):
+                    size = os.path.getsize(self._vectors_path())
+                    capacity = size // (4 * self._dim)
+                    self._matrix = np.memmap(self._vectors_path(), dtype=np.float32, mode="r+", shape=(capacity, self._dim))
+            self._load_ms = round((time.time() - start) * 1000, 3)
+            self._loaded = True
+
+    def _reserve(self, rows: int):
+        """
+        确保矩阵至少能容纳 rows 行 (容量按倍数增长)；调用方需持有锁
+        """
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if rows <= capacity:
+            return
+        new_capacity = max(rows, capacity * 2, 1024)
+        if not self._persistent:
+            matrix = np.zeros((new_capacity, self._dim), dtype=np.float32)
+            if self._matrix is not None:
+                matrix[:capacity] = self._matrix
+            self._matrix = matrix
+            return
+        os.makedirs(self._dir, exist_ok=True)
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        with open(self._vectors_path(), "ab") as f:
+            f.truncate(new_capacity * self._dim * 4)
+        self._matrix = np.memmap(self._vectors_path(), dtype=np.float32, mode="r+", shape=(new_capacity, self._dim))
+
+    def _append(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+        """
+        计算 Embedding 并追加写入；调用方需持有锁
+        """
+        for start in range(0, len(ids), self._batch_size):
+            chunk_texts = texts[start:start + self._batch_size]
+            vectors = np.asarray(self._embeddings.embed_documents(chunk_texts), dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            vectors = vectors / norms
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(
+                    f"Embedding dimension {vectors.shape[1]} does not match collection "
+                    f"{self._collection_name} ({self._dim}); was the embedding provider changed?"
+                )
+            begin = len(self._ids)
+            self._reserve(begin + len(chunk_texts))
+            self._matrix[begin:begin + len(chunk_texts)] = vectors
+
+            chunk_ids = ids[start:start + self._batch_size]
+            chunk_metas = metadatas[start:start + self._batch_size]
+            if self._persistent:
+                # 先落盘向量，再追加旁表，旁表的行数即为有效向量数
+                self._matrix.flush()
+                with open(self._meta_path(), "a", encoding="utf-8") as f:
+                    for id, text, meta in zip(chunk_ids, chunk_texts, chunk_metas):
+                        f.write(json.dumps({"id": id, "text": text, "metadata": meta, "dim": self._dim}, ensure_ascii=False) + "\n")
+            for id, text, meta in zip(chunk_ids, chunk_texts, chunk_metas):
+                self._id_index[id] = len(self._ids)
+                self._ids.append(id)
+                self._texts.append(text)
+                self._metadatas.append(dict(meta or {}))
+
+    def _column(self, field: str, numeric: bool) -> np.ndarray:
+        """
+        获取元数据字段的列；调用方需持有锁
+
+        数值列为 float64 (缺失或非数值为 NaN，与任何值比较均为 False)，其余为 object 列。
+        """
+        key = (field, numeric)
+        column = self._columns.get(key)
+        done = 0 if column is None else len(column)
+        count = len(self._ids)
+        if done < count:
+            values = [self._metadatas[i].get(field) for i in range(done, count)]
+            if numeric:
+                new = np.array(
+                    [v if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan for v in values],
+                    dtype=np.float64,
+                )
+            else:
+                new = np.empty(len(values), dtype=object)
+                new[:] = values
+            column = new if column is None else np.concatenate([column, new])
+            self._columns[key] = column
+        return column
+
+    def _compare_column(self, field: str, op: str, target: Any) -> np.ndarray:
+        if op in _NUMERIC_OPS and isinstance(target, (int, float)) and not isinstance(target, bool):
+            return _NUMERIC_OPS[op](self._column(field, True), target)
+        column = self._column(field, False)
+        if op == "$eq" and not isinstance(target, (list, dict)):
+            return np.asarray(column == target, dtype=bool)
+        if op == "$ne" and not isinstance(target, (list, dict)):
+            return np.asarray(column != target, dtype=bool)
+        # $in / $nin 等按行求值，语义与 match_where 一致
+        return np.fromiter((compare_value(v, op, target) for v in column), dtype=bool, count=len(column))
+
+    def _mask(self, where: Dict[str, Any]) -> np.ndarray:
+        """
+        计算 where 条件的行掩码 (语义同 match_where)；调用方需持有锁
+        """
+        mask = np.ones(len(self._ids), dtype=bool)
+        for key, cond in where.items():
+            if key == "$and":
+                for c in cond:
+                    mask &= self._mask(c)
+            elif key == "$or":
+                matched = np.zeros(len(self._ids), dtype=bool)
+                for c in cond:
+                    matched |= self._mask(c)
+                mask &= matched
+            elif isinstance(cond, dict):
+                for op, target in cond.items():
+                    mask &= self._compare_column(key, op, target)
+            else:
+                mask &= self._compare_column(key, "$eq", cond)
+        return mask
+
+    def _filter_rows(self, where: Dict[str, Any]) -> np.ndarray:
+        """
+        计算满足 where 条件的行号；调用方需持有锁
+        """
+        return np.flatnonzero(self._mask(where))
+
+    # --- 分区 ---
+
+    def _resolve(self, session_id: Optional[str]) -> "NumpyStore":
+        if self._partition == "none":
+            return self
+        if not session_id:
+            raise ValueError(f"session_id is required for partitioned collection {self._collection_name}")
+        if self._partition == "where":
+            return self
+        with self._lock:
+            store = self._partitions.get(session_id)
+            if store is not None:
+                self._partitions.move_to_end(session_id)
+                return store
+            digest = hashlib.sha1(session_id.encode("utf-8")).hexdigest()[:16]
+            store = NumpyStore(
+                self._persist_directory,
+                f"{self._collection_name}-s-{digest}",
+                batch_size=self._batch_size,
+                embedding_service=self._embeddings,
+                persistent=self._persistent,
+                search_block_rows=self._search_block_rows,
+            )
+            self._partitions[session_id] = store
+            # 非持久化模式下淘汰即丢失数据，不做 LRU 淘汰
+            while self._persistent and len(self._partitions) > self._max_open_partitions:
+                self._partitions.popitem(last=False)
+            return store
+
+    def _scope_where(self, where: Optional[Dict[str, Any]], session_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        if self._partition != "where":
+            return where if where else None
+        scope = {"session_id": session_id}
+        if not where:
+            return scope
+        return {"$and": [where, scope]}
+
+    def _scope_metadatas(self, metadatas: List[Dict[str, Any]], session_id: Optional[str]) -> List[Dict[str, Any]]:
+        if self._partition != "where":
+            return metadatas
+        return [dict(m or {}, session_id=session_id) for m in metadatas]
+
+    # --- ChromaStore 接口 ---
+
+    def _stored_count(self) -> int:
+        """
+        条数: 已加载时取内存中的行数，否则只数旁表的行数 (不解析、不加载矩阵)
+        """
+        if self._loaded:
+            return len(self._ids)
+        if not self._persistent or not os.path.exists(self._meta_path()):
+            return 0
+        with open(self._meta_path(), "rb") as f:
+            # 不计写入中断留下的残行
+            return sum(1 for line in f if line.strip() and line.endswith(b"\n"))
+
+    def describe(self) -> Dict[str, Any]:
+        """
+        获取集合概况 (不触发加载；collection 分区模式下统计所有会话分区)
+
+        Returns:
+            Dict: 集合名称、条数、分区数、加载耗时 (毫秒，尚未加载时为 None) 以及是否持久化
+        """
+        if self._partition == "collection":
+            prefix = f"{self._collection_name}-s-"
+            names = set()
+            if self._persistent and os.path.isdir(self._persist_directory):
+                names = {n for n in os.listdir(self._persist_directory) if n.startswith(prefix)}
+            with self._lock:
+                opened = {store._collection_name: store for store in self._partitions.values()}
+            names |= set(opened)
+            count = sum(
+                opened[n]._stored_count() if n in opened else NumpyStore(self._persist_directory, n, embedding_service=self._embeddings)._stored_count()
+                for n in names
+            )
+            partitions = len(names)
+        else:
+            count = self._stored_count()
+            partitions = 0
+        return {
+            "collection": self._collection_name,
+            "count": count,
+            "load_ms": self._load_ms,
+            "persistent": self._persistent,
+            "partition": self._partition,
+            "partitions": partitions,
+            "open_partitions": len(self._partitions),
+        }
+
+    def add_texts(
+        self,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        session_id: Optional[str] = None,
+    ):
+        """
+        添加文本到向量库 (已存在的 ID 会报错，与 Chroma 行为一致)
+        """
+        store = self._resolve(session_id)
+        metadatas = self._scope_metadatas(metadatas, session_id)
+        store._ensure_loaded()
+        with store._lock:
+            duplicated = [id for id in ids if id in store._id_index]
+            if duplicated or len(set(ids)) != len(ids):
+                raise ValueError(f"IDs already exist in collection {store._collection_name}: {duplicated[:5]}")
+            store._append(ids, texts, metadatas)
+
+    def has_id(self, id: str, session_id: Optional[str] = None) -> bool:
+        """
+        检查指定 ID 是否已存在
+        """
+        store = self._resolve(session_id)
+        store._ensure_loaded()
+        return id in store._id_index
+
+    def add_text_if_not_exists(self, id: str, text: str, metadata: Dict[str, Any], session_id: Optional[str] = None):
+        """
+        如果 ID 不存在则添加文本（用于去重）
+        """
+        self.add_texts_if_not_exist([id], [text], [metadata], session_id=session_id)
+
+    def add_texts_if_not_exist(
+        self,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        chunk_size: Optional[int] = None,
+        session_id: Optional[str] = None,
+    ) -> int:
+        """
+        批量添加文本，已存在的 ID 跳过（用于去重）
+
+        Returns:
+            int: 实际新增的条数
+        """
+        store = self._resolve(session_id)
+        metadatas = self._scope_metadatas(metadatas, session_id)
+        store._ensure_loaded()
+        with store._lock:
+            seen = set(store._id_index)
+            new_ids, new_texts, new_metas = [], [], []
+            for id, text, meta in zip(ids, texts, metadatas):
+                if id in seen:
+                    continue
+                seen.add(id)
+                new_ids.append(id)
+                new_texts.append(text)
+                new_metas.append(meta)
+            if new_ids:
+                store._append(new_ids, new_texts, new_metas)
+        return len(new_ids)
+
+    def embed_query(self, query: str) -> List[float]:
+        """
+        计算查询文本的向量 (经共享缓存，供多次 similarity_search 复用)
+        """
+        return self._embeddings.embed_query(query)
+
+    def similarity_search(
+        self,
+        query: str,
+        n_results: int = 5,
+        where: Dict[str, Any] | None = None,
+        query_embedding: Optional[List[float]] = None,
+        session_id: Optional[str] = None,
+    ):
+        """
+        执行相似度搜索
+
+        Args:
+            query: 查询文本
+            n_results: 返回结果数量
+            where: 过滤条件 (Metadata 过滤)
+            query_embedding: 预先计算好的查询向量，为空则经共享缓存计算 query 的向量
+            session_id: 只检索该会话的数据，分区模式下必填
+
+        Returns:
+            List[Dict]: 包含 id, text, metadata, distance 的结果列表
+        """
+        if n_results <= 0:
+            return []
+        store = self._resolve(session_id)
+        query_where = self._scope_where(where, session_id)
+        store._ensure_loaded()
+        if self._load_ms is None:
+            # collection 分区模式下以首个会话分区的加载耗时作为本库的加载耗时
+            self._load_ms = store._load_ms
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+
+        with store._lock:
+            count = len(store._ids)
+            if count == 0:
+                return []
+            q = np.asarray(query_embedding, dtype=np.float32)
+            norm = np.linalg.norm(q)
+            if norm > 0:
+                q = q / norm
+            rows = store._filter_rows(query_where) if query_where else None
+
+            best_scores = np.empty(0, dtype=np.float32)
+            best_rows = np.empty(0, dtype=np.int64)
+            total = count if rows is None else len(rows)
+            for start in range(0, total, store._search_block_rows):
+                if rows is None:
+                    block_rows = np.arange(start, min(start + store._search_block_rows, total))
+                    scores = store._matrix[start:start + len(block_rows)] @ q
+                else:
+                    block_rows = rows[start:start + store._search_block_rows]
+                    scores = store._matrix[block_rows] @ q
+                # 合并当前最优与本块结果，只保留 top-k
+                cand_scores = np.concatenate([best_scores, scores])
+                cand_rows = np.concatenate([best_rows, block_rows])
+                if len(cand_scores) > n_results:
+                    top = np.argpartition(-cand_scores, n_results - 1)[:n_results]
+                    cand_scores, cand_rows = cand_scores[top], cand_rows[top]
+                best_scores, best_rows = cand_scores, cand_rows
+
+            order = np.argsort(-best_scores, kind="stable")
+            docs = []
+            for idx in order:
+                row = int(best_rows[idx])
+                docs.append(
+                    {
+                        "id": store._ids[row],
+                        "text": store._texts[row],
+                        "metadata": dict(store._metadatas[row]),
+                        "distance": float(1.0 - best_scores[idx]),
+                    }
+                )
+            return docs